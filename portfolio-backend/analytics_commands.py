@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析管理指令 (flask analytics ...)
+"""
+
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, text
+
+from analytics_dimensions import intern_existing_rows
+from analytics_retention import (
+    retention_cutoff, run_retention, is_partitioned, list_partitions, partition_statements
+)
+from analytics_rollup import backfill_rollups
+from analytics_snapshot import build_snapshot, load_snapshot, query_snapshot
+from geoip import build_geoip_database, geo_lookup
+from models import db, AnalyticsArchivedDay, PageView, VisitorSession
+
+analytics_cli = AppGroup('analytics', help='流量分析管理指令')
+
+
+def _parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+@analytics_cli.command('backfill-rollups')
+@click.option('--start', help='起始日期 (YYYY-MM-DD)，預設為最早的瀏覽記錄')
+@click.option('--end', help='結束日期 (YYYY-MM-DD)，預設為今天')
+@click.option('--days', type=int, help='只重建最近 N 天')
+def backfill_rollups_command(start, end, days):
+    """從原始頁面瀏覽重建彙總表"""
+    end_day = _parse_day(end) or datetime.now().date()
+    if days:
+        start_day = end_day - timedelta(days=days - 1)
+    else:
+        start_day = _parse_day(start)
+        if start_day is None:
+            earliest = db.session.query(func.min(PageView.visit_time)).scalar()
+            if earliest is None:
+                click.echo("[INFO] 沒有頁面瀏覽記錄，無需重建")
+                return
+            start_day = earliest.date()
+
+    # 已清除原始資料的日期只剩彙總，重建會把彙總歸零
+    cutoff = retention_cutoff(current_app.config['ANALYTICS_RAW_RETENTION_DAYS'])
+    if start_day < cutoff:
+        click.echo(f"[WARN] {cutoff.isoformat()} 之前的原始資料已超過保留期限，起始日期調整為 {cutoff.isoformat()}")
+        start_day = cutoff
+    last_archived = db.session.query(func.max(AnalyticsArchivedDay.day)).scalar()
+    if last_archived is not None and start_day <= last_archived:
+        start_day = last_archived + timedelta(days=1)
+        click.echo(f"[WARN] {last_archived.isoformat()} 以前的原始資料已封存，起始日期調整為 {start_day.isoformat()}")
+    if start_day > end_day:
+        click.echo("[INFO] 沒有可重建的日期")
+        return
+
+    click.echo(f"[INIT] 重建彙總表: {start_day.isoformat()} ~ {end_day.isoformat()}")
+    total = backfill_rollups(start_day, end_day, log=click.echo)
+    click.echo(f"[OK] 彙總表重建完成，共處理 {total} 筆瀏覽")
+
+
+@analytics_cli.command('retention')
+@click.option('--days', type=int, help='原始資料保留天數，預設為 ANALYTICS_RAW_RETENTION_DAYS')
+@click.option('--archive-folder', help='封存檔目錄，預設為 ANALYTICS_ARCHIVE_FOLDER')
+@click.option('--batch-size', type=int, help='每批刪除筆數，預設為 ANALYTICS_RETENTION_BATCH_SIZE')
+@click.option('--pause', type=float, default=0.0, help='每批刪除之間暫停秒數')
+@click.option('--dry-run', is_flag=True, help='只列出將處理的日期')
+def retention_command(days, archive_folder, batch_size, pause, dry_run):
+    """彙總、封存並刪除超過保留期限的原始頁面瀏覽"""
+    config = current_app.config
+    retention_days = days or config['ANALYTICS_RAW_RETENTION_DAYS']
+    click.echo(f"[INIT] 保留最近 {retention_days} 天的原始資料")
+    summary = run_retention(
+        retention_days,
+        archive_folder or config['ANALYTICS_ARCHIVE_FOLDER'],
+        batch_size=batch_size or config['ANALYTICS_RETENTION_BATCH_SIZE'],
+        pause=pause,
+        dry_run=dry_run,
+        log=click.echo
+    )
+    click.echo(
+        f"[OK] 保留策略完成: {summary['days']} 天, 封存 {summary['archived']} 筆, 刪除 {summary['deleted']} 筆"
+    )
+
+
+@analytics_cli.command('partition-page-views')
+@click.option('--months', type=int, default=3, help='預先建立未來 N 個月的分區')
+@click.option('--apply', 'apply_changes', is_flag=True, help='實際執行 (預設只輸出 SQL)')
+def partition_page_views_command(months, apply_changes):
+    """將 page_views 依 visit_time 按月分區，或補上未來月份的分區 (僅 MySQL)"""
+    if db.session.get_bind().dialect.name != 'mysql':
+        click.echo("[ERROR] 分區僅支援 MySQL")
+        return
+
+    partitioned = is_partitioned()
+    existing = [name for name, _ in list_partitions()] if partitioned else []
+    statements = partition_statements(months, partitioned=partitioned, existing=existing)
+    if not statements:
+        click.echo("[INFO] 分區已是最新狀態")
+        return
+
+    for statement in statements:
+        click.echo(f"{statement};")
+        if apply_changes:
+            db.session.execute(text(statement))
+    if apply_changes:
+        db.session.commit()
+        click.echo("[OK] 分區更新完成")
+    else:
+        click.echo("[INFO] 以上為預覽，加上 --apply 實際執行")
+
+
+@analytics_cli.command('intern-dimensions')
+@click.option('--chunk-size', type=int, default=2000, help='每批轉換筆數')
+def intern_dimensions_command(chunk_size):
+    """將既有瀏覽與會話的 UA / 來源字串移入維度表"""
+    click.echo("[INIT] 轉換 User-Agent 與來源欄位為維度表 ID")
+    report = intern_existing_rows(chunk_size=chunk_size, log=click.echo)
+    click.echo(
+        f"[OK] 轉換完成: {report['pageViews']} 筆瀏覽, {report['sessions']} 筆會話, "
+        f"{report['userAgents']} 種 UA, {report['referrers']} 種來源"
+    )
+    saved_ratio = report['bytesSaved'] / report['bytesBefore'] if report['bytesBefore'] else 0.0
+    click.echo(
+        f"[INFO] 字串欄位估計 {report['bytesBefore']:,} bytes -> {report['bytesAfter']:,} bytes "
+        f"(節省 {report['bytesSaved']:,} bytes, {saved_ratio:.1%})"
+    )
+    if db.session.get_bind().dialect.name == 'mysql':
+        click.echo("[INFO] MySQL 需執行 OPTIMIZE TABLE page_views, visitor_sessions 才會釋放磁碟空間")
+
+
+@analytics_cli.command('snapshot')
+@click.option('--full', is_flag=True, help='重新匯出全部資料 (預設只附加上次快照之後的資料)')
+@click.option('--chunk-size', type=int, default=5000, help='每次自資料庫讀取筆數')
+def snapshot_command(full, chunk_size):
+    """將 page_views 匯出為欄式快照 (需要 NumPy)"""
+    folder = current_app.config['ANALYTICS_SNAPSHOT_FOLDER']
+    click.echo(f"[INIT] 建立欄式快照: {folder}")
+    try:
+        manifest = build_snapshot(folder, full=full, chunk_size=chunk_size, log=click.echo)
+    except RuntimeError as e:
+        click.echo(f"[ERROR] {e}")
+        return
+    click.echo(
+        f"[OK] 快照 {manifest['version']}: {manifest['rows']} 筆 (本次附加 {manifest['appendedRows']} 筆)，"
+        f"涵蓋至 {manifest['watermark']}"
+    )
+
+
+@analytics_cli.command('snapshot-query')
+@click.option('--dimension', 'dimensions', multiple=True, help='分組維度 (path/referrer/browser/device，最多兩個)')
+@click.option('--metric', type=click.Choice(['count', 'unique']), default='count', help='瀏覽數或不重複會話數')
+@click.option('--days', type=int, help='只查詢最近 N 天')
+@click.option('--limit', type=int, default=20, help='列出前 N 組')
+@click.option('--no-delta', is_flag=True, help='不合併快照之後的新資料')
+def snapshot_query_command(dimensions, metric, days, limit, no_delta):
+    """在欄式快照上執行分組查詢"""
+    try:
+        snapshot = load_snapshot(current_app.config['ANALYTICS_SNAPSHOT_FOLDER'])
+    except RuntimeError as e:
+        click.echo(f"[ERROR] {e}")
+        return
+    if snapshot is None:
+        click.echo("[ERROR] 尚未建立快照，請先執行 flask analytics snapshot")
+        return
+
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1) if days else None
+    result = query_snapshot(snapshot, dimensions, start=start, metric=metric, limit=limit, include_delta=not no_delta)
+    for row in result['rows']:
+        labels = ' / '.join(row[dim] or '(空)' for dim in dimensions) or '(全部)'
+        click.echo(f"{row['value']:>10}  {labels}")
+    click.echo(
+        f"[INFO] 總計 {result['total']}，快照 {result['snapshotRows']} 筆 + 增量 {result['deltaRows']} 筆"
+    )
+
+
+@analytics_cli.command('geoip-build')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--country-column', type=int, default=2, help='國家欄位的位置 (從 0 起算)')
+@click.option('--city-column', type=int, default=3, help='城市欄位的位置 (從 0 起算，-1 表示沒有)')
+def geoip_build_command(csv_path, country_column, city_column):
+    """將 IP 區間 CSV (起點, 終點, 國家, 城市，可為 .gz) 轉為本機地理資料庫"""
+    folder = current_app.config['GEOIP_FOLDER']
+    click.echo(f"[INIT] 建立 IP 地理資料庫: {csv_path} -> {folder}")
+    build_geoip_database(
+        csv_path, folder, country_column=country_column,
+        city_column=city_column if city_column >= 0 else None, log=click.echo
+    )
+
+
+@analytics_cli.command('geoip-fill')
+@click.option('--chunk-size', type=int, default=2000, help='每批更新筆數')
+def geoip_fill_command(chunk_size):
+    """為尚未記錄國家的既有會話補上國家/城市"""
+    if geo_lookup.database() is None:
+        click.echo("[ERROR] 尚未建立 IP 地理資料庫，請先執行 flask analytics geoip-build")
+        return
+
+    updated = 0
+    last_id = ''
+    while True:
+        rows = db.session.query(VisitorSession.id, VisitorSession.ip_address).filter(
+            VisitorSession.id > last_id,
+            VisitorSession.country.is_(None)
+        ).order_by(VisitorSession.id).limit(chunk_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for row in rows:
+            country, city = geo_lookup.lookup(row.ip_address)
+            if country:
+                updates.append({'id': row.id, 'country': country, 'city': city})
+        if updates:
+            db.session.bulk_update_mappings(VisitorSession, updates)
+            db.session.commit()
+            updated += len(updates)
+            click.echo(f"[OK] visitor_sessions: 已更新 {updated} 筆")
+
+    click.echo(f"[OK] 補上 {updated} 筆會話的地理位置，執行 flask analytics backfill-rollups 可重建國家/城市統計")
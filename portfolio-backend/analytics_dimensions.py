@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析維度表 (User-Agent / 來源網址)
+重複的長字串只在維度表保存一次，page_views 與 visitor_sessions 只存整數 ID；
+行程內以 LRU 快取 字串 -> ID，熱門值在寫入時不需查詢資料庫。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from sqlalchemy import func
+
+from db_utils import insert_ignore
+from models import db, PageView, VisitorSession, UserAgentDim, ReferrerDim
+from ua_classifier import parse_user_agent
+
+DEFAULT_CACHE_SIZE = 10000
+
+
+def value_hash(value):
+    """維度值的 SHA-1 (作為唯一鍵，避免對長字串建立唯一索引)"""
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def normalize_host(referrer):
+    """來源網址的主機名稱 (小寫、去除 www. 與連接埠)，無法解析時回傳 None"""
+    try:
+        host = urlsplit(referrer).hostname or ''
+    except ValueError:
+        return None
+    if host.startswith('www.'):
+        host = host[4:]
+    return host[:255] or None
+
+
+class DimensionInterner:
+    """將字串值對應到維度表 ID
+
+    lookup() 在目前交易中查詢或新增維度資料列；新 ID 需在交易提交後
+    以 remember() 放入快取，避免快取到已回滾的 ID。
+    """
+
+    def __init__(self, model, build_row, cache_size=DEFAULT_CACHE_SIZE):
+        self.model = model
+        self.build_row = build_row  # (value, value_hash) -> 欄位 dict
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _select(self, hashes):
+        rows = db.session.query(self.model.value_hash, self.model.id).filter(
+            self.model.value_hash.in_(list(hashes))
+        ).all()
+        return {row.value_hash: row.id for row in rows}
+
+    def lookup(self, values):
+        """回傳 {value: id} (空值略過，不提交交易)"""
+        ids = {}
+        missing = set()
+        with self._lock:
+            for value in set(values):
+                if not value:
+                    continue
+                cached = self._cache.get(value)
+                if cached is None:
+                    missing.add(value)
+                else:
+                    self._cache.move_to_end(value)
+                    ids[value] = cached
+            self.hits += len(ids)
+            self.misses += len(missing)
+
+        if missing:
+            by_hash = {value_hash(value): value for value in missing}
+            found = self._select(by_hash.keys())
+            new_hashes = [digest for digest in by_hash if digest not in found]
+            if new_hashes:
+                insert_ignore(
+                    self.model,
+                    [self.build_row(by_hash[digest], digest) for digest in new_hashes],
+                    index_elements=('value_hash',)
+                )
+                found.update(self._select(new_hashes))
+            ids.update({by_hash[digest]: id_ for digest, id_ in found.items()})
+
+        return ids
+
+    def remember(self, ids):
+        """交易提交後將 ID 放入快取"""
+        with self._lock:
+            for value, id_ in ids.items():
+                self._cache[value] = id_
+                self._cache.move_to_end(value)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def stats(self):
+        """快取命中統計"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._cache),
+            'maxSize': self.cache_size,
+            'hitRate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def clear(self):
+        """清除快取"""
+        with self._lock:
+            self._cache.clear()
+
+
+def _user_agent_row(user_agent, digest):
+    browser, os_name, device = parse_user_agent(user_agent)
+    return {
+        'value_hash': digest,
+        'user_agent': user_agent,
+        'browser': browser,
+        'os': os_name,
+        'device': device
+    }
+
+
+def _referrer_row(referrer, digest):
+    return {
+        'value_hash': digest,
+        'referrer': referrer[:500],
+        'host': normalize_host(referrer)
+    }
+
+
+user_agents = DimensionInterner(UserAgentDim, _user_agent_row)
+referrers = DimensionInterner(ReferrerDim, _referrer_row)
+
+
+def _legacy_text_bytes():
+    """page_views / visitor_sessions 中尚未轉換的 UA 與來源字串總長度"""
+    page_views = db.session.query(
+        func.coalesce(func.sum(func.length(PageView.user_agent)), 0),
+        func.coalesce(func.sum(func.length(PageView.referer)), 0)
+    ).one()
+    sessions = db.session.query(
+        func.coalesce(func.sum(func.length(VisitorSession.user_agent)), 0)
+    ).scalar()
+    return int(page_views[0]) + int(page_views[1]) + int(sessions)
+
+
+def _dimension_text_bytes():
+    """維度表中的字串總長度"""
+    user_agent_bytes = db.session.query(
+        func.coalesce(func.sum(func.length(UserAgentDim.user_agent) + func.length(UserAgentDim.value_hash)), 0)
+    ).scalar()
+    referrer_bytes = db.session.query(
+        func.coalesce(func.sum(
+            func.length(ReferrerDim.referrer) + func.length(ReferrerDim.value_hash)
+            + func.coalesce(func.length(ReferrerDim.host), 0)
+        ), 0)
+    ).scalar()
+    return int(user_agent_bytes) + int(referrer_bytes)
+
+
+def _intern_table(model, columns, chunk_size, log):
+    """依主鍵分段，將舊資料的字串欄位轉為維度表 ID 並清空原欄位
+
+    columns: [(字串欄位, ID 欄位, interner)]
+    """
+    converted = 0
+    last_id = ''
+    while True:
+        rows = db.session.query(
+            model.id, *[getattr(model, text_column) for text_column, _, _ in columns]
+        ).filter(model.id > last_id).order_by(model.id).limit(chunk_size).all()
+        if not rows:
+            return converted
+        last_id = rows[-1].id
+
+        pending = [row for row in rows if any(getattr(row, text_column) is not None for text_column, _, _ in columns)]
+        if pending:
+            resolved = {
+                text_column: interner.lookup(getattr(row, text_column) for row in pending)
+                for text_column, _, interner in columns
+            }
+            updates = []
+            for row in pending:
+                update = {'id': row.id}
+                for text_column, id_column, _ in columns:
+                    value = getattr(row, text_column)
+                    if value is not None:
+                        update[text_column] = None
+                        update[id_column] = resolved[text_column].get(value)
+                updates.append(update)
+            db.session.bulk_update_mappings(model, updates)
+            db.session.commit()
+
+            for text_column, _, interner in columns:
+                interner.remember(resolved[text_column])
+            converted += len(pending)
+            log(f"[OK] {model.__tablename__}: 已轉換 {converted} 筆")
+
+
+def intern_existing_rows(chunk_size=2000, log=print):
+    """將既有資料的 UA / 來源字串移入維度表，回傳儲存空間估計"""
+    before = _legacy_text_bytes() + _dimension_text_bytes()
+
+    page_views = _intern_table(PageView, [
+        ('user_agent', 'user_agent_id', user_agents),
+        ('referer', 'referrer_id', referrers),
+    ], chunk_size, log)
+    sessions = _intern_table(VisitorSession, [
+        ('user_agent', 'user_agent_id', user_agents),
+    ], chunk_size, log)
+
+    # 每筆轉換後的資料列多了 4 bytes 的整數 ID
+    after = _legacy_text_bytes() + _dimension_text_bytes() + (page_views * 2 + sessions) * 4
+    return {
+        'pageViews': page_views,
+        'sessions': sessions,
+        'userAgents': UserAgentDim.query.count(),
+        'referrers': ReferrerDim.query.count(),
+        'bytesBefore': before,
+        'bytesAfter': after,
+        'bytesSaved': before - after
+    }
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+原始流量資料匯出
+以伺服器端游標 (yield_per / stream_results) 逐批讀取，產生 NDJSON 或 CSV 串流，
+可即時 gzip 壓縮；記憶體用量與匯出筆數無關。
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import and_, func, or_, select
+
+from models import db, PageView, VisitorSession, UserAgentDim, ReferrerDim
+from pagination import encode_cursor, decode_cursor
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+
+def _page_view_columns():
+    return [
+        ('id', PageView.id),
+        ('visitTime', PageView.visit_time),
+        ('path', PageView.path),
+        ('title', PageView.title),
+        ('sessionId', PageView.session_id),
+        ('ipAddress', PageView.ip_address),
+        ('userAgent', func.coalesce(PageView.user_agent, UserAgentDim.user_agent)),
+        ('referer', func.coalesce(PageView.referer, ReferrerDim.referrer)),
+        ('viewDuration', PageView.view_duration),
+        ('sampleWeight', PageView.sample_weight),
+    ]
+
+
+def _session_columns():
+    return [
+        ('id', VisitorSession.id),
+        ('firstVisit', VisitorSession.first_visit),
+        ('sessionId', VisitorSession.session_id),
+        ('lastVisit', VisitorSession.last_visit),
+        ('ipAddress', VisitorSession.ip_address),
+        ('userAgent', func.coalesce(VisitorSession.user_agent, UserAgentDim.user_agent)),
+        ('browser', VisitorSession.browser),
+        ('os', VisitorSession.os),
+        ('device', VisitorSession.device),
+        ('totalPageViews', VisitorSession.total_page_views),
+        ('totalTimeSpent', VisitorSession.total_time_spent),
+        ('sampleWeight', VisitorSession.sample_weight),
+    ]
+
+
+# 匯出類型 -> (模型, 時間欄位, 欄位定義)
+EXPORT_TYPES = {
+    'page_views': (PageView, 'visit_time', _page_view_columns),
+    'sessions': (VisitorSession, 'first_visit', _session_columns),
+}
+
+
+def export_columns(kind):
+    """匯出欄位名稱"""
+    return [name for name, _ in EXPORT_TYPES[kind][2]()]
+
+
+def _keyset_select(kind, start, end, after, columns):
+    """依 (時間, id) 排序的區間查詢；after 為上一頁最後一筆的排序鍵"""
+    model, time_attr, _ = EXPORT_TYPES[kind]
+    time_column = getattr(model, time_attr)
+
+    stmt = select(*columns).where(time_column >= start, time_column < end)
+    if after is not None:
+        after_time, after_id = after
+        stmt = stmt.where(or_(
+            time_column > after_time,
+            and_(time_column == after_time, model.id > after_id)
+        ))
+    return stmt.order_by(time_column, model.id)
+
+
+def parse_export_cursor(token):
+    """解析匯出游標，回傳 (時間, id)"""
+    return tuple(decode_cursor(token, size=2))
+
+
+def iter_export_rows(kind, start, end, after=None, limit=None, chunk_size=1000):
+    """逐筆產生匯出資料 (dict)，以伺服器端游標分批讀取"""
+    model, _, column_factory = EXPORT_TYPES[kind]
+    named = column_factory()
+    columns = [column.label(name) for name, column in named]
+
+    stmt = _keyset_select(kind, start, end, after, columns)
+    stmt = stmt.outerjoin(UserAgentDim, UserAgentDim.id == model.user_agent_id)
+    if kind == 'page_views':
+        stmt = stmt.outerjoin(ReferrerDim, ReferrerDim.id == PageView.referrer_id)
+    if limit:
+        stmt = stmt.limit(limit)
+
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    try:
+        for row in result:
+            yield dict(row._mapping)
+    finally:
+        result.close()
+
+
+def next_export_cursor(kind, start, end, after, limit):
+    """limit 筆之後仍有資料時回傳下一頁游標 (只讀取索引中的排序鍵)"""
+    if not limit:
+        return None
+    model, time_attr, _ = EXPORT_TYPES[kind]
+    boundary = db.session.execute(
+        _keyset_select(kind, start, end, after, [getattr(model, time_attr), model.id]).offset(limit - 1).limit(2)
+    ).all()
+    if len(boundary) < 2:
+        return None
+    return encode_cursor(list(boundary[0]))
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+def encode_rows(rows, export_format, columns, rows_per_chunk=500):
+    """將資料列編碼為 NDJSON / CSV 文字區塊"""
+    buffer = io.StringIO()
+    writer = None
+    if export_format == 'csv':
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+
+    pending = 0
+    for row in rows:
+        if writer is not None:
+            writer.writerow([
+                value.isoformat() if hasattr(value, 'isoformat') else ('' if value is None else value)
+                for value in (row[name] for name in columns)
+            ])
+        else:
+            buffer.write(json.dumps(row, ensure_ascii=False, default=_json_default))
+            buffer.write('\n')
+
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """即時 gzip 壓縮文字區塊串流"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,577 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析寫入佇列 (write-behind)
+追蹤端點只做驗證與排隊，由背景執行緒批次寫入資料庫
+"""
+
+import atexit
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, func
+
+from analytics_dimensions import user_agents, referrers
+from analytics_rollup import RollupAccumulator, apply_rollup, bump_stats_version, invalidate_stats_cache
+from analytics_sampling import AdaptiveSampler
+from analytics_sketches import (
+    VisitorSketchAccumulator, TopKAccumulator, apply_visitor_sketches, apply_topk_sketches, visitor_key
+)
+from db_utils import upsert, insert_ignore
+from geoip import geo_lookup
+from models import db, PageView, VisitorSession
+
+PAGE_VIEW_ID_PATTERN = re.compile(r'^[A-Za-z0-9-]{1,36}$')
+
+# 找不到頁面瀏覽 (事件可能仍在佇列中) 的停留時間保留重試的秒數
+DURATION_RETRY_SECONDS = 60
+
+# 前端緩衝事件的時間戳最多可早於收到時間多久 (更早的事件以收到時間記錄)
+MAX_EVENT_AGE = timedelta(hours=24)
+
+
+def validate_page_view(data):
+    """驗證頁面瀏覽資料，回傳錯誤訊息 (None 表示通過)"""
+    if not isinstance(data, dict):
+        return "無效的請求資料"
+
+    path = data.get('path', '/')
+    if not isinstance(path, str) or not path or len(path) > 255:
+        return "path 必須為 1-255 字元的字串"
+
+    title = data.get('title', '')
+    if title is not None and (not isinstance(title, str) or len(title) > 255):
+        return "title 必須為 255 字元以內的字串"
+
+    session_id = data.get('sessionId')
+    if session_id is not None and (not isinstance(session_id, str) or not session_id or len(session_id) > 36):
+        return "sessionId 必須為 1-36 字元的字串"
+
+    referrer = data.get('referrer')
+    if referrer is not None and (not isinstance(referrer, str) or len(referrer) > 500):
+        return "referrer 必須為 500 字元以內的字串"
+
+    page_view_id = data.get('pageViewId')
+    if page_view_id is not None and (not isinstance(page_view_id, str) or not PAGE_VIEW_ID_PATTERN.match(page_view_id)):
+        return "pageViewId 必須為 1-36 字元的英數字或連字號"
+
+    return None
+
+
+def validate_heartbeat(data):
+    """驗證停留時間心跳資料，回傳錯誤訊息 (None 表示通過)"""
+    if not isinstance(data, dict):
+        return "無效的心跳資料"
+
+    page_view_id = data.get('pageViewId')
+    if not isinstance(page_view_id, str) or not PAGE_VIEW_ID_PATTERN.match(page_view_id):
+        return "pageViewId 必須為 1-36 字元的英數字或連字號"
+
+    duration = data.get('duration')
+    if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration < 0:
+        return "duration 必須為非負數 (秒)"
+
+    return None
+
+
+def parse_event_timestamp(value, now=None, max_age=MAX_EVENT_AGE):
+    """解析前端緩衝事件的時間戳 (毫秒)，無效或超出範圍時回傳 None"""
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    now = now or datetime.now()
+    try:
+        visit_time = datetime.fromtimestamp(value / 1000.0)
+    except (OverflowError, OSError, ValueError):
+        return None
+    if visit_time > now or now - visit_time > max_age:
+        return None
+    return visit_time
+
+
+def build_page_view_event(data, ip_address, user_agent, referer, visit_time=None):
+    """將請求資料整理為待寫入的事件"""
+    return {
+        # 前端可自行產生 pageViewId，讓停留時間心跳在頁面瀏覽寫入前就能對應
+        'id': data.get('pageViewId') or str(uuid.uuid4()),
+        'path': data.get('path', '/'),
+        'title': data.get('title') or '',
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'referer': referer,
+        'session_id': data.get('sessionId') or str(uuid.uuid4()),
+        'visit_time': visit_time or datetime.now()
+    }
+
+
+def write_page_views(events, parse_user_agent):
+    """批次寫入頁面瀏覽與會話
+
+    會話以單一 upsert 語句寫入，頁面瀏覽以 executemany 批次插入，
+    並在同一交易中累加彙總表、每日訪客草圖與熱門項目草圖。
+    User-Agent 與來源只寫入維度表 ID；取樣保留的事件依 sample_weight 加權累加。
+    """
+    if not events:
+        return 0
+
+    # 前端重送的事件 (相同 pageViewId) 只記錄一次，避免重複累加會話與彙總
+    unique_events = {}
+    for event in events:
+        unique_events.setdefault(event['id'], event)
+    stored = {
+        row.id for row in db.session.query(PageView.id).filter(PageView.id.in_(list(unique_events.keys())))
+    }
+    events = [event for event_id, event in unique_events.items() if event_id not in stored]
+    if not events:
+        return 0
+
+    user_agent_ids = user_agents.lookup(event['user_agent'] for event in events)
+    referrer_ids = referrers.lookup(event['referer'] for event in events)
+
+    # 依會話彙整本批次的瀏覽
+    by_session = {}
+    for event in events:
+        by_session.setdefault(event['session_id'], []).append(event)
+
+    # 只用於判斷是否為新會話 (彙總表的會話數與進站頁面)；
+    # 會話計數本身由下方的 upsert 在資料庫內原子累加
+    existing = {
+        row.session_id
+        for row in db.session.query(VisitorSession.session_id).filter(
+            VisitorSession.session_id.in_(list(by_session.keys()))
+        )
+    }
+
+    rollup = RollupAccumulator()
+    visitors = VisitorSketchAccumulator()
+    top_items = TopKAccumulator()
+    unique_key_mode = current_app.config.get('ANALYTICS_UNIQUE_KEY', 'session')
+    session_rows = []
+    for session_id, session_events in by_session.items():
+        first = session_events[0]
+        last = session_events[-1]
+
+        for event in session_events:
+            weight = event.get('sample_weight', 1)
+            browser, _, device = parse_user_agent(event['user_agent'])
+            rollup.add_view(
+                event['visit_time'], event['path'], event['title'], event['referer'], browser, device, weight,
+                geo_lookup.lookup(event['ip_address'])
+            )
+            visitors.add(event['visit_time'], visitor_key(
+                session_id, event['ip_address'], event['user_agent'], unique_key_mode
+            ))
+            top_items.add_view(event['visit_time'], event['path'], event['title'], event['referer'], weight)
+
+        browser, os_name, device = parse_user_agent(first['user_agent'])
+        session_weight = first.get('sample_weight', 1)
+        country, city = location = geo_lookup.lookup(first['ip_address'])
+        if session_id not in existing:
+            rollup.add_session(
+                first['visit_time'], first['path'], first['referer'], browser, device, session_weight, location
+            )
+        session_rows.append({
+            'id': str(uuid.uuid4()),
+            'session_id': session_id,
+            'ip_address': first['ip_address'],
+            'user_agent_id': user_agent_ids.get(first['user_agent']),
+            'browser': browser,
+            'os': os_name,
+            'device': device,
+            'country': country,
+            'city': city,
+            'first_visit': first['visit_time'],
+            'last_visit': last['visit_time'],
+            'total_page_views': len(session_events),
+            'is_unique': len(session_events) == 1,
+            'sample_weight': session_weight
+        })
+
+    # 已存在的會話：瀏覽數累加、最後造訪取較晚者、不再是單頁訪客 (取樣權重維持第一次寫入的值)
+    upsert(
+        VisitorSession,
+        session_rows,
+        index_elements=('session_id',),
+        increments=('total_page_views',),
+        maximums=('last_visit',),
+        assignments={'is_unique': False}
+    )
+
+    # 與其他行程同時寫入相同 pageViewId 時直接略過
+    insert_ignore(PageView, [
+        {
+            'id': event['id'],
+            'path': event['path'],
+            'title': event['title'],
+            'ip_address': event['ip_address'],
+            'user_agent_id': user_agent_ids.get(event['user_agent']),
+            'referrer_id': referrer_ids.get(event['referer']),
+            'session_id': event['session_id'],
+            'visit_time': event['visit_time'],
+            'sample_weight': event.get('sample_weight', 1)
+        }
+        for event in events
+    ], index_elements=('id',))
+
+    apply_rollup(rollup)
+    apply_visitor_sketches(visitors)
+    apply_topk_sketches(top_items, current_app.config.get('ANALYTICS_TOPK_CAPACITY', 100))
+    # 當天的統計快取由短 TTL 處理；寫入已結束日期的延遲事件時遞增彙總版本號並移除涵蓋該日的快取
+    bump_stats_version(rollup.days())
+    db.session.commit()
+
+    today = date.today()
+    invalidate_stats_cache(day for day in rollup.days() if day < today)
+
+    user_agents.remember(user_agent_ids)
+    referrers.remember(referrer_ids)
+    return len(events)
+
+
+def write_view_durations(durations):
+    """批次更新頁面停留時間，回傳 (更新筆數, 找不到的 pageViewId 集合)
+
+    durations 為 {pageViewId: 累計停留秒數}。只有比已記錄值大的部分才會累加到
+    會話停留時間與彙總表，重複或延遲的心跳不會重複計算；彙總表依取樣權重加權。
+    """
+    if not durations:
+        return 0, set()
+
+    rollup = RollupAccumulator()
+    views = db.session.query(
+        PageView.id, PageView.session_id, PageView.path, PageView.visit_time, PageView.view_duration,
+        PageView.sample_weight
+    ).filter(PageView.id.in_(list(durations.keys()))).with_for_update().all()
+
+    view_updates = []
+    session_deltas = {}
+    for view in views:
+        delta = durations[view.id] - (view.view_duration or 0)
+        if delta <= 0:
+            continue
+        view_updates.append({'id': view.id, 'view_duration': durations[view.id]})
+        rollup.add_duration(view.visit_time, view.path, delta * (view.sample_weight or 1))
+        if view.session_id:
+            session_deltas[view.session_id] = session_deltas.get(view.session_id, 0) + delta
+
+    missing = set(durations) - {view.id for view in views}
+    if not view_updates:
+        db.session.rollback()
+        return 0, missing
+
+    # 會話停留時間改變時移動停留時間分佈的區間
+    sessions = db.session.query(
+        VisitorSession.session_id, VisitorSession.first_visit, VisitorSession.total_time_spent,
+        VisitorSession.sample_weight
+    ).filter(VisitorSession.session_id.in_(list(session_deltas.keys()))).with_for_update().all()
+    for session in sessions:
+        old_total = session.total_time_spent or 0
+        rollup.move_session_duration(
+            session.first_visit, old_total, old_total + session_deltas[session.session_id],
+            session.sample_weight or 1
+        )
+
+    db.session.bulk_update_mappings(PageView, view_updates)
+    sessions_table = VisitorSession.__table__
+    db.session.execute(
+        sessions_table.update().where(
+            sessions_table.c.session_id == bindparam('b_session_id')
+        ).values(
+            total_time_spent=func.coalesce(sessions_table.c.total_time_spent, 0) + bindparam('b_delta')
+        ),
+        [{'b_session_id': session_id, 'b_delta': delta} for session_id, delta in session_deltas.items()]
+    )
+
+    apply_rollup(rollup)
+    bump_stats_version(rollup.days())
+    db.session.commit()
+
+    today = date.today()
+    invalidate_stats_cache(day for day in rollup.days() if day < today)
+    return len(view_updates), missing
+
+
+class AnalyticsIngestQueue:
+    """行程內的寫入佇列，以固定批次大小與間隔批次寫入"""
+
+    def __init__(self, app=None):
+        self._app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 確保同一時間只有一個批次在寫入
+        self._stop = threading.Event()
+        self._parse_user_agent = None
+        self._durations = {}  # pageViewId -> (累計停留秒數, 首次收到時間)
+        self._skipped_views = OrderedDict()  # 取樣略過的 pageViewId (忽略其停留時間心跳)
+        self._skipped_visitors = VisitorSketchAccumulator()  # 取樣略過的事件仍加入訪客草圖，唯一訪客數不受取樣影響
+        self.unique_key_mode = 'session'
+        self.sampler = AdaptiveSampler()
+
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.max_duration = 4 * 3600
+
+        # 統計計數
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_at = None
+        self.last_error = None
+        self.durations_flushed = 0
+        self.durations_dropped = 0
+        self.sampled_out = 0
+        self.skipped_visitor_writes = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, parse_user_agent=None):
+        """綁定 Flask 應用並讀取配置"""
+        self._app = app
+        self._parse_user_agent = parse_user_agent
+        self._queue = queue.Queue(maxsize=app.config.get('ANALYTICS_QUEUE_MAXSIZE', 10000))
+        self.batch_size = app.config.get('ANALYTICS_BATCH_SIZE', 500)
+        self.flush_interval = app.config.get('ANALYTICS_FLUSH_INTERVAL', 1.0)
+        self.max_duration = app.config.get('ANALYTICS_MAX_VIEW_DURATION', 4 * 3600)
+        self.unique_key_mode = app.config.get('ANALYTICS_UNIQUE_KEY', 'session')
+        self.sampler.init_app(app)
+        app.extensions['analytics_ingest'] = self
+        atexit.register(self.shutdown)
+
+    def enqueue(self, event):
+        """加入佇列，佇列已滿時丟棄並回傳 False
+
+        負載過高時依取樣比例略過部分會話的事件 (仍視為已接受)，
+        保留的事件記錄取樣權重。略過的事件只將訪客鍵加入記憶體中的每日草圖，隨下一批次合併寫入。
+        """
+        self._ensure_worker()
+        weight = self.sampler.weight(event.get('session_id'))
+        if not weight:
+            key = visitor_key(event['session_id'], event['ip_address'], event['user_agent'], self.unique_key_mode)
+            with self._lock:
+                self.sampled_out += 1
+                self._skipped_visitors.add(event['visit_time'], key)
+                self._skipped_views[event['id']] = None
+                if len(self._skipped_views) > self._queue.maxsize:
+                    self._skipped_views.popitem(last=False)
+            return True
+        event['sample_weight'] = weight
+
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def record_duration(self, page_view_id, seconds):
+        """記錄頁面的累計停留時間，同一頁面瀏覽在寫入前只保留最大值
+
+        待寫入的頁面數超過佇列上限時丟棄並回傳 False。
+        """
+        seconds = int(min(max(seconds, 0), self.max_duration))
+        self._ensure_worker()
+        with self._lock:
+            if page_view_id in self._skipped_views:
+                return True
+            pending = self._durations.get(page_view_id)
+            if pending is None:
+                if len(self._durations) >= self._queue.maxsize:
+                    self.durations_dropped += 1
+                    return False
+                self._durations[page_view_id] = (seconds, time.monotonic())
+            elif seconds > pending[0]:
+                self._durations[page_view_id] = (seconds, pending[1])
+        return True
+
+    def depth(self):
+        """目前佇列深度"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        """佇列統計資料"""
+        with self._lock:
+            return {
+                'queueDepth': self.depth(),
+                'queueCapacity': self._queue.maxsize if self._queue is not None else 0,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'batches': self.batches,
+                'batchSize': self.batch_size,
+                'flushInterval': self.flush_interval,
+                'lastFlushAt': self.last_flush_at.isoformat() if self.last_flush_at else None,
+                'lastError': self.last_error,
+                'pendingDurations': len(self._durations),
+                'durationsFlushed': self.durations_flushed,
+                'durationsDropped': self.durations_dropped,
+                'sampledOut': self.sampled_out,
+                'skippedVisitorWrites': self.skipped_visitor_writes,
+                'sampling': self.sampler.stats()
+            }
+
+    def flush(self):
+        """同步清空佇列 (含背景執行緒正在處理的批次)，回傳寫入筆數"""
+        total = 0
+        with self._write_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    break
+                total += self._write(batch)
+            self._write_skipped_visitors()
+            self._write_durations()
+        return total
+
+    def shutdown(self):
+        """停止背景執行緒並寫入剩餘事件"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=max(self.flush_interval * 2, 5))
+        if self._queue is not None and self._app is not None:
+            self.flush()
+
+    def _ensure_worker(self):
+        """延遲啟動背景執行緒 (fork 後的 worker 需要重新啟動)"""
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='analytics-ingest', daemon=True
+            )
+            self._thread.start()
+
+    def _drain(self, limit, timeout=0):
+        """從佇列取出最多 limit 筆，timeout 內等待第一批事件"""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """背景寫入迴圈"""
+        while not self._stop.is_set():
+            with self._write_lock:
+                batch = self._drain(self.batch_size, timeout=self.flush_interval)
+                started = time.monotonic()
+                if batch:
+                    self._write(batch)
+                # 以批次寫入耗時與剩餘佇列深度調整取樣比例 (閒置時回報 0 讓比例逐步恢復)
+                self.sampler.observe(time.monotonic() - started, self.depth(), self._queue.maxsize)
+                self._write_skipped_visitors()
+                # 停留時間在頁面瀏覽之後寫入，確保同一批次的頁面已存在
+                self._write_durations()
+
+    def _write(self, batch):
+        """在應用上下文中寫入一個批次"""
+        with self._app.app_context():
+            try:
+                written = write_page_views(batch, self._parse_user_agent)
+                with self._lock:
+                    self.flushed += written
+                    self.batches += 1
+                    self.last_flush_at = datetime.now()
+                return written
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.failed += len(batch)
+                    self.last_error = str(e)
+                print(f"[ERROR] 流量記錄批次寫入失敗: {e}")
+                return 0
+            finally:
+                db.session.remove()
+
+    def _write_skipped_visitors(self):
+        """將取樣略過事件的訪客草圖合併進每日草圖，失敗時放回下次重試"""
+        with self._lock:
+            if not self._skipped_visitors:
+                return
+            pending, self._skipped_visitors = self._skipped_visitors, VisitorSketchAccumulator()
+
+        with self._app.app_context():
+            try:
+                apply_visitor_sketches(pending)
+                bump_stats_version(pending.sketches)
+                db.session.commit()
+                today = date.today()
+                invalidate_stats_cache(day for day in pending.sketches if day < today)
+                with self._lock:
+                    self.skipped_visitor_writes += 1
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self._skipped_visitors.merge(pending)
+                    self.last_error = str(e)
+                print(f"[ERROR] 取樣略過的訪客草圖寫入失敗: {e}")
+            finally:
+                db.session.remove()
+
+    def _write_durations(self):
+        """寫入累積的停留時間，找不到頁面瀏覽的項目在期限內保留重試"""
+        with self._lock:
+            if not self._durations:
+                return 0
+            pending, self._durations = self._durations, {}
+
+        written = 0
+        items = list(pending.items())
+        with self._app.app_context():
+            try:
+                for offset in range(0, len(items), self.batch_size):
+                    chunk = dict(items[offset:offset + self.batch_size])
+                    updated, missing = write_view_durations(
+                        {page_view_id: seconds for page_view_id, (seconds, _) in chunk.items()}
+                    )
+                    written += updated
+
+                    now = time.monotonic()
+                    with self._lock:
+                        for page_view_id in missing:
+                            seconds, first_seen = chunk[page_view_id]
+                            if now - first_seen < DURATION_RETRY_SECONDS and page_view_id not in self._durations:
+                                self._durations[page_view_id] = (seconds, first_seen)
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.last_error = str(e)
+                print(f"[ERROR] 停留時間批次寫入失敗: {e}")
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            self.durations_flushed += written
+        return written
+
+
+ingest_queue = AnalyticsIngestQueue()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+即時流量推送 (Server-Sent Events)
+追蹤端點將新的頁面瀏覽發布到行程內的發布/訂閱匯流排，背景執行緒每秒合併一次
+推送給所有訂閱者；訂閱者的緩衝區有上限，跟不上的連線會被中斷而不會拖慢寫入。
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+def format_sse(event, data):
+    """格式化為 Server-Sent Events 訊息"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class LiveSubscription:
+    """單一訂閱者的有界訊息緩衝區"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.closed = False  # 緩衝區滿載被中斷時為 True
+
+    def get(self, timeout):
+        """等待下一則訊息，逾時回傳 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LiveAnalyticsBus:
+    """行程內的發布/訂閱匯流排，每秒合併新瀏覽並計算在線訪客數"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._pending_views = []
+        self._pending_count = 0
+        self._sessions = OrderedDict()  # sessionId -> 最後活動時間 (monotonic)
+        self._page_views = OrderedDict()  # pageViewId -> sessionId (心跳對應會話)
+        self._last_active = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+        self.buffer_size = 32
+        self.max_subscribers = 20
+        self.active_window = 300
+        self.max_views_per_tick = 50
+        self.max_tracked_views = 10000
+
+        # 統計計數
+        self.published = 0
+        self.messages = 0
+        self.subscribers_dropped = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """綁定 Flask 應用並讀取配置"""
+        self.buffer_size = app.config.get('ANALYTICS_LIVE_BUFFER', 32)
+        self.max_subscribers = app.config.get('ANALYTICS_LIVE_MAX_SUBSCRIBERS', 20)
+        self.active_window = app.config.get('ANALYTICS_LIVE_ACTIVE_WINDOW', 300)
+        app.extensions['analytics_live'] = self
+
+    def publish_view(self, event):
+        """發布新的頁面瀏覽 (不阻塞，只更新記憶體狀態)"""
+        now = time.monotonic()
+        with self._lock:
+            self.published += 1
+            self._touch_session(event.get('session_id'), now)
+            self._page_views[event['id']] = event.get('session_id')
+            if len(self._page_views) > self.max_tracked_views:
+                self._page_views.popitem(last=False)
+
+            if not self._subscribers:
+                return
+            self._pending_count += 1
+            if len(self._pending_views) < self.max_views_per_tick:
+                self._pending_views.append({
+                    'id': event['id'],
+                    'path': event.get('path'),
+                    'title': event.get('title') or '',
+                    'sessionId': event.get('session_id'),
+                    'ipAddress': event.get('ip_address'),
+                    'userAgent': event.get('user_agent'),
+                    'referer': event.get('referer'),
+                    'visitTime': event['visit_time'].isoformat() if event.get('visit_time') else None,
+                    'viewDuration': 0
+                })
+
+    def touch(self, page_view_id):
+        """收到心跳時更新所屬會話的最後活動時間"""
+        with self._lock:
+            session_id = self._page_views.get(page_view_id)
+            if session_id:
+                self._touch_session(session_id, time.monotonic())
+
+    def _touch_session(self, session_id, now):
+        if not session_id:
+            return
+        self._sessions[session_id] = now
+        self._sessions.move_to_end(session_id)
+        self._prune_sessions(now)
+
+    def _prune_sessions(self, now):
+        """移除超過活動時間窗口的會話 (依最後活動時間排序，只檢查最舊的)"""
+        cutoff = now - self.active_window
+        while self._sessions:
+            session_id, last_seen = next(iter(self._sessions.items()))
+            if last_seen >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+    def active_visitors(self):
+        """最近 active_window 秒內有活動的會話數"""
+        with self._lock:
+            self._prune_sessions(time.monotonic())
+            return len(self._sessions)
+
+    def snapshot(self):
+        """新訂閱者的初始狀態"""
+        return {
+            'time': datetime.now().isoformat(),
+            'activeVisitors': self.active_visitors(),
+            'activeWindow': self.active_window,
+            'views': [],
+            'viewCount': 0
+        }
+
+    def subscribe(self):
+        """新增訂閱者，已達上限時回傳 None"""
+        self._ensure_ticker()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = LiveSubscription(self.buffer_size)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        """移除訂閱者"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if not self._subscribers:
+                self._pending_views = []
+                self._pending_count = 0
+
+    def stats(self):
+        """匯流排統計資料"""
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'maxSubscribers': self.max_subscribers,
+                'bufferSize': self.buffer_size,
+                'published': self.published,
+                'messages': self.messages,
+                'subscribersDropped': self.subscribers_dropped,
+                'activeSessions': len(self._sessions)
+            }
+
+    def _ensure_ticker(self):
+        """延遲啟動每秒推送的背景執行緒 (fork 後的 worker 需要重新啟動)"""
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='analytics-live', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """每秒合併一次新瀏覽，推送給所有訂閱者"""
+        while not self._stop.wait(1.0):
+            self.tick()
+
+    def tick(self):
+        """合併這一秒的變化並推送；沒有新瀏覽且在線人數不變時不推送"""
+        with self._lock:
+            if not self._subscribers:
+                return 0
+            self._prune_sessions(time.monotonic())
+            active = len(self._sessions)
+            if not self._pending_count and active == self._last_active:
+                return 0
+
+            message = {
+                'time': datetime.now().isoformat(),
+                'activeVisitors': active,
+                'activeWindow': self.active_window,
+                'views': self._pending_views,
+                'viewCount': self._pending_count
+            }
+            self._pending_views = []
+            self._pending_count = 0
+            self._last_active = active
+
+            delivered = 0
+            for subscription in list(self._subscribers):
+                try:
+                    subscription.queue.put_nowait(message)
+                    delivered += 1
+                except queue.Full:
+                    # 跟不上的訂閱者直接中斷，由用戶端重新連線取得最新狀態
+                    subscription.closed = True
+                    self._subscribers.discard(subscription)
+                    self.subscribers_dropped += 1
+            self.messages += 1
+            return delivered
+
+
+live_bus = LiveAnalyticsBus()
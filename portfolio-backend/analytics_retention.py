@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析原始資料保留策略
+超過保留天數的頁面瀏覽會先確認已彙總，再匯出為 gzip NDJSON 封存檔，
+最後分批刪除 (避免長時間鎖表)。MySQL 可選擇以 visit_time 分區，直接刪除整個分區。
+第一批刪除前會記錄該日已封存 (analytics_archived_days)，中斷後重新執行只繼續刪除，不再重新彙總或封存。
+"""
+
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, text
+
+from analytics_rollup import backfill_rollups, query_rollup_totals
+from models import db, AnalyticsArchivedDay, PageView
+
+
+def _day_range(day):
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def retention_cutoff(retention_days):
+    """保留期限的起始日，早於此日的原始資料會被清除"""
+    return date.today() - timedelta(days=retention_days)
+
+
+def archive_path(archive_folder, day):
+    """封存檔路徑 (同一天重複執行時加上序號，不覆寫既有檔案)"""
+    folder = os.path.join(archive_folder, 'page_views', f"{day.year:04d}", f"{day.month:02d}")
+    os.makedirs(folder, exist_ok=True)
+
+    base = os.path.join(folder, f"page_views-{day.isoformat()}")
+    path = f"{base}.ndjson.gz"
+    sequence = 1
+    while os.path.exists(path):
+        path = f"{base}.{sequence}.ndjson.gz"
+        sequence += 1
+    return path
+
+
+def compact_day(day, log=print):
+    """確認該日彙總已涵蓋原始資料，彙總較少 (有缺漏) 時從原始資料重建
+
+    原始資料較少表示已有部分被刪除 (例如前一次執行中斷)，此時彙總才是完整的，不可重建。
+    """
+    day_start, day_end = _day_range(day)
+    # 取樣期間的事件以權重代表多筆瀏覽，彙總表同樣以權重累加
+    raw_views = int(db.session.query(func.coalesce(func.sum(PageView.sample_weight), 0)).filter(
+        PageView.visit_time >= day_start,
+        PageView.visit_time < day_end
+    ).scalar())
+    rollup_views, _ = query_rollup_totals(day_start, day_start)
+
+    if raw_views > rollup_views:
+        log(f"[INFO] {day.isoformat()} 彙總 {rollup_views} 筆少於原始資料 {raw_views} 筆，重新彙總")
+        backfill_rollups(day, day, log=log)
+    elif raw_views < rollup_views:
+        log(f"[WARN] {day.isoformat()} 原始資料 {raw_views} 筆少於彙總 {rollup_views} 筆，視為已彙總")
+    return raw_views
+
+
+def mark_archived(day, raw_views, path):
+    """記錄該日已彙總並封存 (在第一批刪除前提交)"""
+    db.session.add(AnalyticsArchivedDay(day=day, raw_views=raw_views, archive_path=path))
+    db.session.commit()
+
+
+def export_day(day, archive_folder, chunk_size=5000):
+    """將某日的頁面瀏覽串流匯出為 gzip NDJSON，回傳 (檔案路徑, 筆數)"""
+    day_start, day_end = _day_range(day)
+    path = archive_path(archive_folder, day)
+    temp_path = f"{path}.tmp"
+
+    count = 0
+    rows = PageView.query.filter(
+        PageView.visit_time >= day_start,
+        PageView.visit_time < day_end
+    ).order_by(PageView.visit_time, PageView.id).yield_per(chunk_size)
+
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as handle:
+        for row in rows:
+            handle.write(json.dumps(row.to_dict(), ensure_ascii=False))
+            handle.write('\n')
+            count += 1
+
+    if count == 0:
+        os.remove(temp_path)
+        return None, 0
+
+    # 先寫完暫存檔再改名，確保封存檔完整
+    os.replace(temp_path, path)
+    db.session.expunge_all()
+    return path, count
+
+
+def delete_day(day, batch_size=1000, pause=0.0):
+    """分批刪除某日的頁面瀏覽，每批獨立提交，回傳刪除筆數"""
+    day_start, day_end = _day_range(day)
+    deleted = 0
+    while True:
+        ids = [
+            row.id for row in db.session.query(PageView.id).filter(
+                PageView.visit_time >= day_start,
+                PageView.visit_time < day_end
+            ).limit(batch_size)
+        ]
+        if not ids:
+            return deleted
+
+        PageView.query.filter(PageView.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+
+        if pause:
+            time.sleep(pause)
+
+
+def run_retention(retention_days, archive_folder, batch_size=1000, pause=0.0, dry_run=False, log=print):
+    """套用保留策略：彙總 → 封存 → 分批刪除 (或刪除 MySQL 分區)"""
+    cutoff = datetime.combine(retention_cutoff(retention_days), datetime.min.time())
+    earliest = db.session.query(func.min(PageView.visit_time)).scalar()
+    if earliest is None or earliest >= cutoff:
+        log(f"[INFO] 沒有早於 {cutoff.date().isoformat()} 的原始資料")
+        return {'days': 0, 'archived': 0, 'deleted': 0}
+
+    partitioned = is_partitioned()
+    droppable = {name for name, bound in list_partitions() if bound is not None and bound <= cutoff.date()} if partitioned else set()
+
+    summary = {'days': 0, 'archived': 0, 'deleted': 0}
+    day = earliest.date()
+    archived_days = {
+        row.day for row in db.session.query(AnalyticsArchivedDay.day).filter(
+            AnalyticsArchivedDay.day >= day,
+            AnalyticsArchivedDay.day < cutoff.date()
+        )
+    }
+    while day < cutoff.date():
+        if dry_run:
+            action = '繼續刪除' if day in archived_days else '彙總、封存並刪除'
+            log(f"[DRY-RUN] {day.isoformat()} 將被{action}")
+        else:
+            if day in archived_days:
+                # 前一次執行已封存但未刪除完成：彙總與封存檔都是完整的，只繼續刪除
+                log(f"[INFO] {day.isoformat()} 已封存，繼續刪除剩餘的原始資料")
+                pending = True
+            else:
+                raw_views = compact_day(day, log=log)
+                pending = bool(raw_views)
+                if pending:
+                    path, archived = export_day(day, archive_folder)
+                    mark_archived(day, raw_views, path)
+                    summary['archived'] += archived
+                    log(f"[OK] {day.isoformat()} 已封存 {archived} 筆 -> {path}")
+
+            # 整個分區都會被刪除時不需逐筆刪除
+            if pending and partition_name(day) not in droppable:
+                deleted = delete_day(day, batch_size=batch_size, pause=pause)
+                summary['deleted'] += deleted
+                log(f"[OK] {day.isoformat()} 已刪除 {deleted} 筆原始資料")
+
+        summary['days'] += 1
+        day += timedelta(days=1)
+
+    for name in sorted(droppable):
+        if dry_run:
+            log(f"[DRY-RUN] 將刪除分區 {name}")
+            continue
+        db.session.execute(text(f"ALTER TABLE page_views DROP PARTITION {name}"))
+        db.session.commit()
+        log(f"[OK] 已刪除分區 {name}")
+
+    return summary
+
+
+# ===== MySQL 分區 =====
+
+def partition_name(day):
+    """以月份命名分區"""
+    return f"p{day.year:04d}{day.month:02d}"
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def is_partitioned():
+    """page_views 是否已依 visit_time 分區 (僅 MySQL)"""
+    if db.session.get_bind().dialect.name != 'mysql':
+        return False
+    count = db.session.execute(text(
+        "SELECT COUNT(*) FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'page_views' AND PARTITION_NAME IS NOT NULL"
+    )).scalar()
+    return bool(count)
+
+
+def list_partitions():
+    """回傳 [(分區名稱, 上界日期或 None)]，上界為不包含的月份起始日"""
+    names = db.session.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'page_views' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    )).scalars().all()
+
+    partitions = []
+    for name in names:
+        if name.startswith('p') and name[1:].isdigit() and len(name) == 7:
+            partitions.append((name, _next_month(date(int(name[1:5]), int(name[5:7]), 1))))
+        else:
+            partitions.append((name, None))
+    return partitions
+
+
+def partition_statements(months_ahead=3, partitioned=False, existing=()):
+    """產生依月份分區的 SQL
+
+    MySQL 要求分區鍵包含於每個唯一鍵，因此主鍵需改為 (id, visit_time)。
+    已分區時只從 pmax 分出尚未建立的未來月份。
+    """
+    today = date.today()
+    earliest = db.session.query(func.min(PageView.visit_time)).scalar()
+    month = (earliest.date() if earliest else today).replace(day=1)
+    last_month = today.replace(day=1)
+    for _ in range(months_ahead):
+        last_month = _next_month(last_month)
+
+    existing = set(existing)
+    definitions = []
+    while month <= last_month:
+        name = partition_name(month)
+        if name not in existing:
+            bound = _next_month(month).isoformat()
+            definitions.append(f"PARTITION {name} VALUES LESS THAN (TO_DAYS('{bound}'))")
+        month = _next_month(month)
+
+    if partitioned:
+        if not definitions:
+            return []
+        definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        return [f"ALTER TABLE page_views REORGANIZE PARTITION pmax INTO ({', '.join(definitions)})"]
+
+    definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return [
+        "ALTER TABLE page_views DROP PRIMARY KEY, ADD PRIMARY KEY (id, visit_time)",
+        f"ALTER TABLE page_views PARTITION BY RANGE (TO_DAYS(visit_time)) ({', '.join(definitions)})",
+    ]
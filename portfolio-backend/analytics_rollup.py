@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析彙總表
+寫入頁面瀏覽時同步累加每小時/每日的維度計數，統計查詢直接讀取彙總表
+"""
+
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from analytics_sketches import (
+    VisitorSketchAccumulator, TopKAccumulator, replace_visitor_sketch, replace_topk_sketches, visitor_key
+)
+from content_versions import bump_versions, read_versions
+from db_utils import upsert
+from geoip import geo_lookup
+from hyperloglog import HyperLogLog
+from models import db, AnalyticsRollup, PageView, VisitorSession, UserAgentDim, ReferrerDim
+from result_cache import ResultCache
+
+GRANULARITIES = ('hour', 'day')
+DIMENSIONS = ('total', 'path', 'referrer', 'browser', 'device', 'country', 'city', 'session_duration')
+
+# 會話停留時間分佈的區間下界 (秒)，session_duration 維度的值為區間下界；
+# 停留時間為 0 的會話不記錄，由總會話數扣除
+SESSION_DURATION_BUCKETS = (1, 10, 30, 60, 120, 180, 300, 600, 1200, 1800, 3600)
+
+# city 維度的值為「國家/城市」，避免不同國家的同名城市合併
+CITY_SEPARATOR = '/'
+
+# 維度值欄位長度上限
+VALUE_MAX_LENGTH = 255
+
+# 統計端點的結果快取，鍵為 ('stats', 天數, 區間最後一天, exact, 彙總版本號)
+stats_cache = ResultCache()
+
+# content_versions 中的彙總版本號名稱：已結束日期的彙總有變動時遞增 (任何行程寫入都會改變快取鍵)
+STATS_VERSION = 'analytics_rollups'
+
+
+def stats_cache_key(days, end_day, exact, version):
+    """統計結果的快取鍵"""
+    return ('stats', days, end_day, bool(exact), version)
+
+
+def read_stats_version():
+    """已結束日期彙總的版本號 (統計請求讀取一次)"""
+    return read_versions([STATS_VERSION])[STATS_VERSION]
+
+
+def bump_stats_version(days):
+    """寫入涉及已結束的日期時，在目前的交易內遞增彙總版本號 (當天的資料由短 TTL 處理)"""
+    today = date.today()
+    if any(day < today for day in days):
+        bump_versions([STATS_VERSION])
+
+
+def invalidate_stats_cache(days):
+    """移除本行程涵蓋任一指定日期的統計快取 (延遲寫入或重建彙總後呼叫；其他行程由版本號處理)"""
+    days = set(days)
+    if not days:
+        return 0
+
+    def covers(key):
+        _, window_days, end_day, _, _ = key
+        start_day = end_day - timedelta(days=window_days - 1)
+        return any(start_day <= day <= end_day for day in days)
+
+    return stats_cache.invalidate(covers)
+
+
+def duration_bucket(seconds):
+    """停留時間所屬的分佈區間下界 (0 秒回傳 None)"""
+    index = bisect_right(SESSION_DURATION_BUCKETS, seconds) - 1
+    return SESSION_DURATION_BUCKETS[index] if index >= 0 else None
+
+
+def bucket_start(moment, granularity):
+    """取得時間所屬區間的起點"""
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class RollupAccumulator:
+    """在記憶體中累加彙總增量，最後一次 upsert 寫入"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def _add(self, moment, dimensions, views, sessions, duration=0):
+        for granularity in GRANULARITIES:
+            start = bucket_start(moment, granularity)
+            for dimension, value, label in dimensions:
+                key = (granularity, start, dimension, (value or '')[:VALUE_MAX_LENGTH])
+                row = self.rows.get(key)
+                if row is None:
+                    row = self.rows[key] = {'views': 0, 'sessions': 0, 'duration': 0, 'label': None}
+                row['views'] += views
+                row['sessions'] += sessions
+                row['duration'] += duration
+                if label:
+                    row['label'] = label[:VALUE_MAX_LENGTH]
+
+    def add_view(self, visit_time, path, title, referrer, browser, device, weight=1, location=None):
+        """累加一次頁面瀏覽 (weight 為取樣權重，location 為 (國家, 城市))"""
+        self._add(visit_time, self._dimensions(path, title, referrer, browser, device, location), weight, 0)
+
+    def add_session(self, first_visit, path, referrer, browser, device, weight=1, location=None):
+        """累加一個新會話 (path/referrer 為進站頁面與來源)"""
+        self._add(first_visit, self._dimensions(path, None, referrer, browser, device, location), 0, weight)
+
+    def add_duration(self, visit_time, path, seconds):
+        """累加頁面停留時間 (依頁面瀏覽的時間區間)"""
+        dimensions = [('total', '', None)]
+        if path:
+            dimensions.append(('path', path, None))
+        self._add(visit_time, dimensions, 0, 0, seconds)
+
+    def move_session_duration(self, first_visit, old_seconds, new_seconds, weight=1):
+        """會話停留時間改變時，將會話移到新的分佈區間"""
+        old_bucket = duration_bucket(old_seconds)
+        new_bucket = duration_bucket(new_seconds)
+        if old_bucket == new_bucket:
+            return
+        if old_bucket is not None:
+            self._add(first_visit, [('session_duration', str(old_bucket), None)], 0, -weight)
+        if new_bucket is not None:
+            self._add(first_visit, [('session_duration', str(new_bucket), None)], 0, weight)
+
+    @staticmethod
+    def _dimensions(path, title, referrer, browser, device, location=None):
+        dimensions = [('total', '', None)]
+        if path:
+            dimensions.append(('path', path, title))
+        if referrer:
+            dimensions.append(('referrer', referrer, None))
+        dimensions.append(('browser', browser or 'Unknown', None))
+        dimensions.append(('device', device or 'Unknown', None))
+        country, city = location or (None, None)
+        dimensions.append(('country', country or 'Unknown', None))
+        if country and city:
+            dimensions.append(('city', f"{country}{CITY_SEPARATOR}{city}", None))
+        return dimensions
+
+    def to_rows(self):
+        """轉換為 upsert 資料列"""
+        return [
+            {
+                'granularity': granularity,
+                'bucket_start': start,
+                'dimension': dimension,
+                'value': value,
+                'label': row['label'],
+                'views': row['views'],
+                'sessions': row['sessions'],
+                'duration': row['duration']
+            }
+            for (granularity, start, dimension, value), row in self.rows.items()
+        ]
+
+    def days(self):
+        """本次累加涉及的日期"""
+        return {start.date() for granularity, start, _, _ in self.rows if granularity == 'day'}
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def apply_rollup(accumulator):
+    """將累加結果寫入彙總表 (不提交交易)"""
+    upsert(
+        AnalyticsRollup,
+        accumulator.to_rows(),
+        index_elements=('granularity', 'bucket_start', 'dimension', 'value'),
+        increments=('views', 'sessions', 'duration'),
+        coalesces=('label',)  # 只有停留時間的資料列沒有頁面標題，不覆蓋已存的標題
+    )
+
+
+def backfill_rollups(start_day, end_day, chunk_size=5000, log=print):
+    """從原始資料重建 [start_day, end_day] 的彙總資料與草圖 (逐日處理)"""
+    unique_key_mode = current_app.config.get('ANALYTICS_UNIQUE_KEY', 'session')
+    topk_capacity = current_app.config.get('ANALYTICS_TOPK_CAPACITY', 100)
+    day = start_day
+    total_views = 0
+    while day <= end_day:
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        AnalyticsRollup.query.filter(
+            AnalyticsRollup.bucket_start >= day_start,
+            AnalyticsRollup.bucket_start < day_end
+        ).delete(synchronize_session=False)
+
+        accumulator = RollupAccumulator()
+        visitors = VisitorSketchAccumulator()
+        top_items = TopKAccumulator()
+        sessions = {
+            row.session_id: row
+            for row in db.session.query(
+                VisitorSession.session_id, VisitorSession.browser, VisitorSession.device,
+                VisitorSession.first_visit, VisitorSession.total_time_spent, VisitorSession.sample_weight,
+                VisitorSession.ip_address
+            ).filter(
+                VisitorSession.first_visit >= day_start,
+                VisitorSession.first_visit < day_end
+            )
+        }
+        for session in sessions.values():
+            accumulator.move_session_duration(
+                session.first_visit, 0, session.total_time_spent or 0, session.sample_weight or 1
+            )
+
+        # 舊資料的 UA/來源仍存於 page_views，新資料改由維度表取得
+        views = db.session.query(
+            PageView.visit_time, PageView.path, PageView.title, PageView.view_duration, PageView.sample_weight,
+            func.coalesce(PageView.referer, ReferrerDim.referrer).label('referer'),
+            PageView.session_id, PageView.ip_address,
+            func.coalesce(PageView.user_agent, UserAgentDim.user_agent).label('user_agent'),
+            func.coalesce(UserAgentDim.browser, VisitorSession.browser).label('browser'),
+            func.coalesce(UserAgentDim.device, VisitorSession.device).label('device')
+        ).outerjoin(
+            VisitorSession, VisitorSession.session_id == PageView.session_id
+        ).outerjoin(
+            UserAgentDim, UserAgentDim.id == PageView.user_agent_id
+        ).outerjoin(
+            ReferrerDim, ReferrerDim.id == PageView.referrer_id
+        ).filter(
+            PageView.visit_time >= day_start,
+            PageView.visit_time < day_end
+        ).order_by(PageView.visit_time).yield_per(chunk_size)
+
+        day_views = 0
+        for view in views:
+            weight = view.sample_weight or 1
+            accumulator.add_view(
+                view.visit_time, view.path, view.title, view.referer, view.browser, view.device, weight,
+                geo_lookup.lookup(view.ip_address)
+            )
+            visitors.add(view.visit_time, visitor_key(
+                view.session_id, view.ip_address, view.user_agent, unique_key_mode
+            ))
+            top_items.add_view(view.visit_time, view.path, view.title, view.referer, weight)
+            if view.view_duration:
+                accumulator.add_duration(view.visit_time, view.path, view.view_duration * weight)
+            day_views += weight
+
+            # 會話的第一筆瀏覽即為進站頁面
+            session = sessions.pop(view.session_id, None)
+            if session is not None:
+                accumulator.add_session(
+                    session.first_visit, view.path, view.referer, session.browser, session.device,
+                    session.sample_weight or 1, geo_lookup.lookup(session.ip_address)
+                )
+
+        # 沒有任何瀏覽記錄的會話
+        for session in sessions.values():
+            accumulator.add_session(
+                session.first_visit, None, None, session.browser, session.device, session.sample_weight or 1,
+                geo_lookup.lookup(session.ip_address)
+            )
+
+        apply_rollup(accumulator)
+        replace_visitor_sketch(day, visitors.sketches.get(day) or HyperLogLog())
+        replace_topk_sketches(day, top_items.build_sketches(topk_capacity))
+        bump_stats_version([day])
+        db.session.commit()
+        invalidate_stats_cache([day])
+
+        log(f"[OK] {day.isoformat()} 彙總完成: {day_views} 筆瀏覽, {len(accumulator)} 筆彙總")
+        total_views += day_views
+        day += timedelta(days=1)
+
+    return total_views
+
+
+def query_rollup_series(granularity, start_date, end_date, metric='views', dimension='total', value=''):
+    """查詢每小時/每日的時間序列 [(區間起點, 數值), ...]，沒有資料的區間補 0"""
+    column = {'views': AnalyticsRollup.views, 'sessions': AnalyticsRollup.sessions}[metric]
+    first = bucket_start(start_date, granularity)
+    last = bucket_start(end_date, granularity)
+    values = dict(db.session.query(AnalyticsRollup.bucket_start, column).filter(
+        AnalyticsRollup.granularity == granularity,
+        AnalyticsRollup.dimension == dimension,
+        AnalyticsRollup.value == (value or '')[:VALUE_MAX_LENGTH],
+        AnalyticsRollup.bucket_start >= first,
+        AnalyticsRollup.bucket_start <= last
+    ).all())
+
+    step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+    series = []
+    moment = first
+    while moment <= last:
+        series.append((moment, int(values.get(moment) or 0)))
+        moment += step
+    return series
+
+
+def _day_filter(query, start_date, end_date):
+    return query.filter(
+        AnalyticsRollup.granularity == 'day',
+        AnalyticsRollup.bucket_start >= bucket_start(start_date, 'day'),
+        AnalyticsRollup.bucket_start <= bucket_start(end_date, 'day')
+    )
+
+
+def query_rollup_totals(start_date, end_date):
+    """查詢區間內的總瀏覽數與新會話數"""
+    views, sessions = _day_filter(
+        db.session.query(
+            func.coalesce(func.sum(AnalyticsRollup.views), 0),
+            func.coalesce(func.sum(AnalyticsRollup.sessions), 0)
+        ).filter(AnalyticsRollup.dimension == 'total'),
+        start_date, end_date
+    ).one()
+    return int(views), int(sessions)
+
+
+def query_rollup_top(dimension, start_date, end_date, metric='views', limit=10):
+    """查詢區間內某維度的排行 (依 views 或 sessions 排序)"""
+    column = AnalyticsRollup.views if metric == 'views' else AnalyticsRollup.sessions
+    total = func.sum(column)
+    rows = _day_filter(
+        db.session.query(
+            AnalyticsRollup.value,
+            func.max(AnalyticsRollup.label).label('label'),
+            total.label('total')
+        ).filter(AnalyticsRollup.dimension == dimension),
+        start_date, end_date
+    ).group_by(AnalyticsRollup.value).having(total > 0).order_by(total.desc()).limit(limit).all()
+    return [(row.value, row.label, int(row.total)) for row in rows]
+
+
+def query_time_on_site(start_date, end_date):
+    """查詢區間內的平均與中位數會話停留時間 (秒)
+
+    平均值為停留時間總和 / 會話數；中位數由會話停留時間分佈在區間內線性內插估計。
+    """
+    duration, sessions = _day_filter(
+        db.session.query(
+            func.coalesce(func.sum(AnalyticsRollup.duration), 0),
+            func.coalesce(func.sum(AnalyticsRollup.sessions), 0)
+        ).filter(AnalyticsRollup.dimension == 'total'),
+        start_date, end_date
+    ).one()
+    histogram = dict(_day_filter(
+        db.session.query(AnalyticsRollup.value, func.sum(AnalyticsRollup.sessions)).filter(
+            AnalyticsRollup.dimension == 'session_duration'
+        ),
+        start_date, end_date
+    ).group_by(AnalyticsRollup.value).all())
+    return _time_on_site(int(duration), int(sessions), histogram)
+
+
+def _time_on_site(duration, sessions, histogram):
+    """由停留時間總和、會話數與停留時間分佈 {區間下界字串: 會話數} 計算 (平均, 中位數)"""
+    if sessions <= 0:
+        return 0, 0
+
+    # 區間 [下界, 上界)，最前面補上沒有停留時間記錄的會話 (視為 0 秒)
+    counts = [max(0, int(histogram.get(str(lower)) or 0)) for lower in SESSION_DURATION_BUCKETS]
+    counts.insert(0, max(0, sessions - sum(counts)))
+    lowers = (0,) + SESSION_DURATION_BUCKETS
+    uppers = SESSION_DURATION_BUCKETS + (None,)
+
+    half = sum(counts) / 2.0
+    cumulative = 0
+    median = 0
+    for lower, upper, count in zip(lowers, uppers, counts):
+        if count and cumulative + count >= half:
+            # 最後一個區間沒有上界，以下界估計
+            median = lower if upper is None else lower + (upper - lower) * (half - cumulative) / count
+            break
+        cumulative += count
+
+    return int(round(duration / sessions)), int(round(median))
+
+
+class RollupSummary:
+    """單次掃描區間內每日彙總的結果，供多個統計共用
+
+    rows 為 {維度: {值: (label, views, sessions, duration)}}。
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def totals(self):
+        """(總瀏覽數, 新會話數)"""
+        _, views, sessions, _ = self.rows.get('total', {}).get('', (None, 0, 0, 0))
+        return views, sessions
+
+    def top(self, dimension, metric='views', limit=10):
+        """某維度的排行 [(value, label, total), ...]，與 query_rollup_top 相同"""
+        position = 1 if metric == 'views' else 2
+        items = [
+            (value, row[0], row[position])
+            for value, row in self.rows.get(dimension, {}).items() if row[position] > 0
+        ]
+        items.sort(key=lambda item: (-item[2], item[0]))
+        return items[:limit]
+
+    def time_on_site(self):
+        """(平均, 中位數) 會話停留時間 (秒)，與 query_time_on_site 相同"""
+        _, _, sessions, duration = self.rows.get('total', {}).get('', (None, 0, 0, 0))
+        histogram = {value: row[2] for value, row in self.rows.get('session_duration', {}).items()}
+        return _time_on_site(duration, sessions, histogram)
+
+
+def query_rollup_summary(start_date, end_date, dimensions=DIMENSIONS):
+    """以單一查詢讀取區間內多個維度的每日彙總 (依維度與值合併)，回傳 RollupSummary
+
+    取代分別查詢總數、各維度排行與停留時間分佈；區間只掃描一次，
+    排序與截取在 Python 中進行。
+    """
+    rows = {}
+    result = _day_filter(
+        db.session.query(
+            AnalyticsRollup.dimension,
+            AnalyticsRollup.value,
+            func.max(AnalyticsRollup.label),
+            func.coalesce(func.sum(AnalyticsRollup.views), 0),
+            func.coalesce(func.sum(AnalyticsRollup.sessions), 0),
+            func.coalesce(func.sum(AnalyticsRollup.duration), 0)
+        ).filter(AnalyticsRollup.dimension.in_(list(dimensions))),
+        start_date, end_date
+    ).group_by(AnalyticsRollup.dimension, AnalyticsRollup.value)
+    for dimension, value, label, views, sessions, duration in result:
+        rows.setdefault(dimension, {})[value] = (label, int(views), int(sessions), int(duration))
+    return RollupSummary(rows)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析自適應取樣
+寫入延遲或佇列深度超過門檻時降低保留比例 (1/factor，factor 為 2 的次方)，
+恢復正常一段時間後逐步回到全部保留。保留的事件記錄取樣權重 factor，
+彙總時以權重累加，瀏覽數與熱門頁面仍是不偏估計。
+
+取樣以會話 ID 的雜湊決定：同一會話在同一比例下全部保留或全部略過，
+且較低比例保留的會話一定也會在較高比例下保留。
+"""
+
+import threading
+import time
+import zlib
+
+
+class AdaptiveSampler:
+    """依寫入延遲與佇列深度調整取樣比例"""
+
+    def __init__(self, enabled=True, max_latency=0.5, max_depth_ratio=0.5, max_factor=64,
+                 recovery_seconds=10.0, smoothing=0.3):
+        self.enabled = enabled
+        self.max_latency = max_latency  # 每批寫入耗時門檻 (秒)
+        self.max_depth_ratio = max_depth_ratio  # 佇列深度 / 容量門檻
+        self.max_factor = max_factor
+        self.recovery_seconds = recovery_seconds
+        self.smoothing = smoothing  # 延遲指數移動平均的權重
+
+        self.factor = 1
+        self.latency = 0.0
+        self.depth_ratio = 0.0
+        self._changed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        # 統計計數
+        self.kept = 0
+        self.skipped = 0
+        self.increases = 0
+        self.decreases = 0
+
+    def init_app(self, app):
+        """讀取 Flask 配置"""
+        config = app.config
+        self.enabled = config.get('ANALYTICS_SAMPLING_ENABLED', True)
+        self.max_latency = config.get('ANALYTICS_SAMPLING_MAX_LATENCY', 0.5)
+        self.max_depth_ratio = config.get('ANALYTICS_SAMPLING_MAX_DEPTH', 0.5)
+        self.max_factor = config.get('ANALYTICS_SAMPLING_MAX_FACTOR', 64)
+        self.recovery_seconds = config.get('ANALYTICS_SAMPLING_RECOVERY', 10.0)
+
+    def weight(self, session_id):
+        """事件的取樣權重，0 表示略過"""
+        factor = self.factor
+        if factor == 1 or zlib.crc32((session_id or '').encode('utf-8')) % factor == 0:
+            self.kept += 1
+            return factor
+        self.skipped += 1
+        return 0
+
+    def observe(self, latency, depth, capacity, now=None):
+        """回報一次寫入的耗時與目前佇列深度，必要時調整取樣比例"""
+        if not self.enabled:
+            return self.factor
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.latency = self.smoothing * latency + (1 - self.smoothing) * self.latency
+            self.depth_ratio = depth / capacity if capacity else 0.0
+
+            overloaded = self.latency > self.max_latency or self.depth_ratio > self.max_depth_ratio
+            healthy = self.latency < self.max_latency / 2 and self.depth_ratio < self.max_depth_ratio / 2
+            if overloaded and self.factor < self.max_factor:
+                self.factor = min(self.factor * 2, self.max_factor)
+                self._changed_at = now
+                self.increases += 1
+                print(f"[WARN] 流量記錄負載過高 (延遲 {self.latency:.3f}s, 佇列 {self.depth_ratio:.0%})，保留比例降為 1/{self.factor}")
+            elif healthy and self.factor > 1 and now - self._changed_at >= self.recovery_seconds:
+                self.factor //= 2
+                self._changed_at = now
+                self.decreases += 1
+                print(f"[INFO] 流量記錄負載恢復，保留比例提高為 1/{self.factor}")
+            return self.factor
+
+    def stats(self):
+        """取樣狀態"""
+        return {
+            'enabled': self.enabled,
+            'factor': self.factor,
+            'keepRate': round(1.0 / self.factor, 4),
+            'latency': round(self.latency, 4),
+            'depthRatio': round(self.depth_ratio, 4),
+            'kept': self.kept,
+            'skipped': self.skipped,
+            'increases': self.increases,
+            'decreases': self.decreases
+        }
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析草圖
+每日唯一訪客以 HyperLogLog 草圖保存，熱門頁面與來源以 Space-Saving 草圖保存，
+任意日期區間合併草圖即可估計
+"""
+
+from collections import Counter
+
+from sqlalchemy.exc import IntegrityError
+
+from hyperloglog import HyperLogLog, DEFAULT_PRECISION
+from models import db, AnalyticsVisitorSketch, AnalyticsTopKSketch
+from space_saving import SpaceSaving, DEFAULT_CAPACITY
+
+
+def visitor_key(session_id, ip_address, user_agent, mode='session'):
+    """唯一訪客的識別鍵 (草圖內會再經過雜湊，不保存原始值)"""
+    if mode == 'ip':
+        return f"{ip_address or ''}|{user_agent or ''}"
+    return session_id or ''
+
+
+def _merge_row(model, keys, column, create, merge):
+    """鎖定並合併草圖資料列 (不提交交易)
+
+    資料列不存在時以 savepoint 插入，其他 worker 同時建立時改為合併。
+    """
+    row = model.query.filter_by(**keys).with_for_update().first()
+    if row is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(model(**keys, **{column: create()}))
+            return
+        except IntegrityError:
+            row = model.query.filter_by(**keys).with_for_update().first()
+
+    setattr(row, column, merge(getattr(row, column)))
+
+
+class VisitorSketchAccumulator:
+    """在記憶體中累加每日訪客草圖"""
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.sketches = {}
+
+    def add(self, visit_time, key):
+        day = visit_time.date()
+        sketch = self.sketches.get(day)
+        if sketch is None:
+            sketch = self.sketches[day] = HyperLogLog(self.precision)
+        sketch.add(key)
+
+    def merge(self, other):
+        """合併另一個累加器 (寫入失敗時放回)"""
+        for day, sketch in other.sketches.items():
+            if day in self.sketches:
+                self.sketches[day].merge(sketch)
+            else:
+                self.sketches[day] = sketch
+
+    def __len__(self):
+        return len(self.sketches)
+
+
+def apply_visitor_sketches(accumulator):
+    """將草圖合併進資料庫 (不提交交易)"""
+    for day, sketch in accumulator.sketches.items():
+        _merge_row(
+            AnalyticsVisitorSketch, {'day': day}, 'registers',
+            create=sketch.to_bytes,
+            merge=lambda stored, sketch=sketch: HyperLogLog.from_bytes(stored).merge(sketch).to_bytes()
+        )
+
+
+def replace_visitor_sketch(day, sketch):
+    """覆寫某日的草圖 (重建彙總時使用，不提交交易)"""
+    AnalyticsVisitorSketch.query.filter_by(day=day).delete(synchronize_session=False)
+    if not sketch.is_empty():
+        db.session.add(AnalyticsVisitorSketch(day=day, registers=sketch.to_bytes()))
+
+
+def query_unique_visitors(start_date, end_date, precision=DEFAULT_PRECISION):
+    """估計區間內的唯一訪客數
+
+    逐日合併草圖，記憶體固定為一個草圖大小，成本為 O(天數)。
+    回傳 (估計值, 相對標準誤差)。
+    """
+    merged = HyperLogLog(precision)
+    rows = db.session.query(AnalyticsVisitorSketch.registers).filter(
+        AnalyticsVisitorSketch.day >= start_date.date(),
+        AnalyticsVisitorSketch.day <= end_date.date()
+    )
+    for (registers,) in rows:
+        merged.merge(HyperLogLog.from_bytes(registers))
+    return merged.count(), merged.relative_error
+
+
+class TopKAccumulator:
+    """在記憶體中累加每日各維度的項目計數"""
+
+    def __init__(self):
+        self.counts = {}  # (day, dimension) -> Counter
+        self.labels = {}  # (day, dimension) -> {item: label}
+
+    def add(self, visit_time, dimension, item, label=None, weight=1):
+        if not item:
+            return
+        key = (visit_time.date(), dimension)
+        self.counts.setdefault(key, Counter())[item] += weight
+        if label:
+            self.labels.setdefault(key, {})[item] = label
+
+    def add_view(self, visit_time, path, title, referrer, weight=1):
+        """累加一次頁面瀏覽的熱門頁面與來源 (weight 為取樣權重)"""
+        self.add(visit_time, 'path', path, title, weight)
+        self.add(visit_time, 'referrer', referrer, weight=weight)
+
+    def build_sketches(self, capacity=DEFAULT_CAPACITY):
+        """轉換為 {(day, dimension): SpaceSaving}"""
+        sketches = {}
+        for key, counts in self.counts.items():
+            sketch = SpaceSaving(capacity)
+            sketch.add_counts(counts, self.labels.get(key, {}))
+            sketches[key] = sketch
+        return sketches
+
+    def __len__(self):
+        return len(self.counts)
+
+
+def apply_topk_sketches(accumulator, capacity=DEFAULT_CAPACITY):
+    """將本批次計數加入既有草圖 (不提交交易)"""
+    for (day, dimension), counts in accumulator.counts.items():
+        labels = accumulator.labels.get((day, dimension), {})
+
+        def create(counts=counts, labels=labels):
+            sketch = SpaceSaving(capacity)
+            sketch.add_counts(counts, labels)
+            return sketch.to_bytes()
+
+        def merge(stored, counts=counts, labels=labels):
+            sketch = SpaceSaving.from_bytes(stored)
+            sketch.add_counts(counts, labels)
+            return sketch.to_bytes()
+
+        _merge_row(AnalyticsTopKSketch, {'day': day, 'dimension': dimension}, 'payload', create, merge)
+
+
+def replace_topk_sketches(day, sketches):
+    """覆寫某日的熱門項目草圖 (重建彙總時使用，不提交交易)"""
+    AnalyticsTopKSketch.query.filter_by(day=day).delete(synchronize_session=False)
+    for (sketch_day, dimension), sketch in sketches.items():
+        if sketch_day == day and len(sketch):
+            db.session.add(AnalyticsTopKSketch(day=day, dimension=dimension, payload=sketch.to_bytes()))
+
+
+def query_topk(dimension, start_date, end_date, limit=10, capacity=DEFAULT_CAPACITY):
+    """合併區間內的每日草圖，回傳 [(item, label, count), ...]"""
+    return query_topk_many([dimension], start_date, end_date, limit, capacity)[dimension]
+
+
+def query_topk_many(dimensions, start_date, end_date, limit=10, capacity=DEFAULT_CAPACITY):
+    """以單一查詢合併多個維度的每日草圖，回傳 {dimension: [(item, label, count), ...]}"""
+    merged = {dimension: SpaceSaving(capacity) for dimension in dimensions}
+    rows = db.session.query(AnalyticsTopKSketch.dimension, AnalyticsTopKSketch.payload).filter(
+        AnalyticsTopKSketch.dimension.in_(list(dimensions)),
+        AnalyticsTopKSketch.day >= start_date.date(),
+        AnalyticsTopKSketch.day <= end_date.date()
+    )
+    for dimension, payload in rows:
+        merged[dimension].merge(SpaceSaving.from_bytes(payload))
+    return {
+        dimension: [(item, label, count) for item, count, _, label in sketch.top(limit)]
+        for dimension, sketch in merged.items()
+    }
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析欄式快照 (memory-mapped)
+將 page_views 匯出為每欄一個二進位檔：時間為 int64 (微秒)，路徑/來源/瀏覽器/裝置為
+字典編碼的 int32，會話為 64 位元雜湊。查詢引擎以 NumPy 直接在 mmap 上依時間篩選、
+依一或兩個維度分組計算瀏覽數或不重複會話數，並可合併快照之後的新資料 (增量)。
+瀏覽數依取樣權重加總。
+
+NumPy 為選用套件，只有建立或查詢快照時才會載入。
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from analytics_ingest import MAX_EVENT_AGE
+from models import db, PageView, UserAgentDim, ReferrerDim
+from ua_classifier import parse_user_agent
+
+DIMENSIONS = ('path', 'referrer', 'browser', 'device')
+METRICS = ('count', 'unique')
+
+# 欄位 -> 資料型態 (維度欄位為字典編碼，代碼 0 代表空值)
+COLUMNS = {
+    'visit_time': 'int64',
+    'session': 'int64',
+    'path': 'int32',
+    'referrer': 'int32',
+    'browser': 'int32',
+    'device': 'int32',
+    'weight': 'int32',
+}
+
+EPOCH = datetime(1970, 1, 1)
+CURRENT_FILE = 'CURRENT'
+KEEP_VERSIONS = 2
+
+# 分組數量不超過此值時以 bincount 計數，否則改用排序
+BINCOUNT_MAX_GROUPS = 1 << 24
+
+
+def _numpy():
+    """延遲載入 NumPy"""
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("欄式快照需要 NumPy，請先執行 pip install numpy") from e
+    return numpy
+
+
+def to_micros(moment):
+    """datetime -> 自 1970-01-01 起的微秒數 (不做時區轉換)"""
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    """微秒數 -> datetime"""
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def session_hash(session_id):
+    """會話 ID 的 64 位元雜湊，快照與增量資料以同樣方式計算，可合併去重"""
+    digest = hashlib.blake2b((session_id or '').encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+def _row_select(start=None, end=None):
+    """依時間排序的頁面瀏覽欄位 (UA 與來源由維度表還原)"""
+    stmt = select(
+        PageView.visit_time,
+        PageView.session_id,
+        PageView.sample_weight,
+        PageView.path,
+        func.coalesce(PageView.referer, ReferrerDim.referrer).label('referrer'),
+        PageView.user_agent,
+        UserAgentDim.browser,
+        UserAgentDim.device
+    ).outerjoin(
+        UserAgentDim, UserAgentDim.id == PageView.user_agent_id
+    ).outerjoin(
+        ReferrerDim, ReferrerDim.id == PageView.referrer_id
+    )
+    if start is not None:
+        stmt = stmt.where(PageView.visit_time >= start)
+    if end is not None:
+        stmt = stmt.where(PageView.visit_time < end)
+    return stmt.order_by(PageView.visit_time, PageView.id)
+
+
+class _Encoder:
+    """維度值 -> 字典代碼 (代碼 0 保留給空值)"""
+
+    def __init__(self, dictionaries=None):
+        self.values = {dim: list((dictionaries or {}).get(dim) or ['']) for dim in DIMENSIONS}
+        self.codes = {dim: {value: code for code, value in enumerate(values)} for dim, values in self.values.items()}
+
+    def encode(self, dim, value):
+        value = value or ''
+        code = self.codes[dim].get(value)
+        if code is None:
+            code = self.codes[dim][value] = len(self.values[dim])
+            self.values[dim].append(value)
+        return code
+
+    def encode_rows(self, rows):
+        """將資料列轉為 {欄位: 串列}"""
+        columns = {name: [] for name in COLUMNS}
+        for row in rows:
+            browser, device = row.browser, row.device
+            if browser is None and row.user_agent:
+                # 尚未移入維度表的舊資料
+                browser, _, device = parse_user_agent(row.user_agent)
+            columns['visit_time'].append(to_micros(row.visit_time))
+            columns['session'].append(session_hash(row.session_id))
+            columns['path'].append(self.encode('path', row.path))
+            columns['referrer'].append(self.encode('referrer', row.referrer))
+            columns['browser'].append(self.encode('browser', browser or 'Unknown'))
+            columns['device'].append(self.encode('device', device or 'Unknown'))
+            columns['weight'].append(row.sample_weight or 1)
+        return columns
+
+
+def _read_current(folder):
+    try:
+        with open(os.path.join(folder, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _read_manifest(directory):
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def build_snapshot(folder, full=False, chunk_size=5000, now=None, log=print):
+    """建立新版本的欄式快照，回傳 manifest
+
+    只匯出早於 (現在 - MAX_EVENT_AGE) 的資料，之後才到達的延遲事件不會落在快照範圍內；
+    非 full 時沿用上一版快照並只附加新的時間範圍，已被保留策略刪除的舊資料仍保留在快照中。
+    新版本寫在獨立目錄，完成後才切換 CURRENT，讀取中的舊版本不受影響。
+    """
+    np = _numpy()
+    now = now or datetime.now()
+    cutoff = (now - MAX_EVENT_AGE).replace(microsecond=0)
+    os.makedirs(folder, exist_ok=True)
+
+    previous_name = None if full else _read_current(folder)
+    previous = _read_manifest(os.path.join(folder, previous_name)) if previous_name else None
+    if previous and set(previous['columns']) != set(COLUMNS):
+        log(f"[INFO] 快照 {previous_name} 的欄位與目前版本不同，重新建立完整快照")
+        previous = None
+    start = datetime.fromisoformat(previous['watermark']) if previous else None
+    if previous and start >= cutoff:
+        log(f"[INFO] 快照已涵蓋至 {previous['watermark']}，無需更新")
+        return previous
+
+    name = f"page_views-{now:%Y%m%d%H%M%S%f}"
+    target = os.path.join(folder, name)
+    staging = target + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    encoder = _Encoder(previous['dictionaries'] if previous else None)
+    rows = 0
+    files = {column: open(os.path.join(staging, f'{column}.bin'), 'wb') for column in COLUMNS}
+    try:
+        if previous:
+            for column, f in files.items():
+                with open(os.path.join(folder, previous_name, f'{column}.bin'), 'rb') as source:
+                    shutil.copyfileobj(source, f)
+            rows = previous['rows']
+            log(f"[INFO] 沿用快照 {previous_name} ({rows} 筆)，附加 {start.isoformat()} 之後的資料")
+
+        result = db.session.execute(
+            _row_select(start, cutoff).execution_options(stream_results=True, yield_per=chunk_size)
+        )
+        try:
+            for chunk in result.partitions(chunk_size):
+                columns = encoder.encode_rows(chunk)
+                for column, values in columns.items():
+                    np.asarray(values, dtype=COLUMNS[column]).tofile(files[column])
+                rows += len(chunk)
+                log(f"[OK] 已匯出 {rows} 筆")
+        finally:
+            result.close()
+    finally:
+        for f in files.values():
+            f.close()
+
+    manifest = {
+        'version': name,
+        'createdAt': now.isoformat(),
+        'rows': rows,
+        'appendedRows': rows - (previous['rows'] if previous else 0),
+        'watermark': cutoff.isoformat(),
+        'columns': COLUMNS,
+        'dictionaries': encoder.values,
+    }
+    _write_json(os.path.join(staging, 'manifest.json'), manifest)
+    os.rename(staging, target)
+
+    current_tmp = os.path.join(folder, CURRENT_FILE + '.tmp')
+    with open(current_tmp, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(current_tmp, os.path.join(folder, CURRENT_FILE))
+
+    # 保留最近幾個版本，讓仍在讀取舊版本的行程有時間切換
+    versions = sorted(
+        entry for entry in os.listdir(folder)
+        if entry.startswith('page_views-') and not entry.endswith('.tmp')
+    )
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(folder, old), ignore_errors=True)
+
+    return manifest
+
+
+class ColumnarSnapshot:
+    """唯讀的欄式快照，欄位以 np.memmap 對應到檔案"""
+
+    def __init__(self, directory, manifest):
+        np = _numpy()
+        self.directory = directory
+        self.manifest = manifest
+        self.rows = manifest['rows']
+        self.watermark = datetime.fromisoformat(manifest['watermark'])
+        self.dictionaries = manifest['dictionaries']
+        self.columns = {}
+        for column, dtype in manifest['columns'].items():
+            if self.rows:
+                self.columns[column] = np.memmap(
+                    os.path.join(directory, f'{column}.bin'), dtype=dtype, mode='r', shape=(self.rows,)
+                )
+            else:
+                self.columns[column] = np.empty(0, dtype=dtype)
+
+    def time_slice(self, start, end):
+        """時間區間 [start, end) 的欄位 (快照依時間排序，以二分搜尋取得範圍，不複製資料)"""
+        np = _numpy()
+        visit_time = self.columns['visit_time']
+        lower = int(np.searchsorted(visit_time, to_micros(start), side='left')) if start else 0
+        upper = int(np.searchsorted(visit_time, to_micros(end), side='left')) if end else self.rows
+        return {column: values[lower:upper] for column, values in self.columns.items()}
+
+    def info(self):
+        """快照摘要"""
+        return {
+            'version': self.manifest['version'],
+            'createdAt': self.manifest['createdAt'],
+            'rows': self.rows,
+            'watermark': self.manifest['watermark'],
+            'dictionarySizes': {dim: len(values) for dim, values in self.dictionaries.items()}
+        }
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_snapshot(folder):
+    """載入目前版本的快照 (同一版本在行程內只開啟一次)，沒有快照時回傳 None"""
+    name = _read_current(folder)
+    if name is None:
+        return None
+    with _loaded_lock:
+        snapshot = _loaded.get(folder)
+        if snapshot is None or snapshot.manifest['version'] != name:
+            directory = os.path.join(folder, name)
+            snapshot = _loaded[folder] = ColumnarSnapshot(directory, _read_manifest(directory))
+        return snapshot
+
+
+def _delta_frame(encoder, start, end, chunk_size):
+    """從資料庫讀取快照之後的資料並以同一組字典編碼"""
+    np = _numpy()
+    columns = {column: [] for column in COLUMNS}
+    result = db.session.execute(
+        _row_select(start, end).execution_options(stream_results=True, yield_per=chunk_size)
+    )
+    try:
+        for chunk in result.partitions(chunk_size):
+            for column, values in encoder.encode_rows(chunk).items():
+                columns[column].extend(values)
+    finally:
+        result.close()
+    return {column: np.asarray(values, dtype=COLUMNS[column]) for column, values in columns.items()}
+
+
+def query_snapshot(snapshot, dimensions, start=None, end=None, metric='count', where=None,
+                   limit=20, include_delta=True, chunk_size=5000):
+    """以快照 (加上增量) 計算分組統計
+
+    dimensions: 0-2 個維度；metric: count (瀏覽數) 或 unique (不重複會話數)；
+    where: {維度: 值} 篩選條件。回傳 {'rows', 'total', 'snapshotRows', 'deltaRows'}。
+    """
+    np = _numpy()
+    dimensions = list(dimensions)
+    if len(dimensions) > 2 or any(dim not in DIMENSIONS for dim in dimensions):
+        raise ValueError(f"dimensions 最多兩個，可用值: {', '.join(DIMENSIONS)}")
+    if metric not in METRICS:
+        raise ValueError(f"metric 必須是 {', '.join(METRICS)}")
+    where = where or {}
+    if any(dim not in DIMENSIONS for dim in where):
+        raise ValueError(f"篩選維度必須是 {', '.join(DIMENSIONS)}")
+
+    encoder = _Encoder(snapshot.dictionaries)
+    snapshot_end = min(end, snapshot.watermark) if end else snapshot.watermark
+    frames = []
+    if start is None or start < snapshot.watermark:
+        frames.append(snapshot.time_slice(start, snapshot_end))
+    snapshot_rows = len(frames[0]['visit_time']) if frames else 0
+
+    delta_rows = 0
+    if include_delta and (end is None or end > snapshot.watermark):
+        delta_start = max(start, snapshot.watermark) if start else snapshot.watermark
+        delta = _delta_frame(encoder, delta_start, end, chunk_size)
+        delta_rows = len(delta['visit_time'])
+        frames.append(delta)
+
+    # 篩選條件與分組鍵 (多個維度以混合進位合併為單一 int64)
+    filter_codes = {dim: encoder.codes[dim].get(value or '') for dim, value in where.items()}
+    sizes = [len(encoder.values[dim]) for dim in dimensions]
+    keys, sessions, weights = [], [], []
+    for frame in frames:
+        mask = None
+        for dim, code in filter_codes.items():
+            matched = frame[dim] == code if code is not None else np.zeros(len(frame[dim]), dtype=bool)
+            mask = matched if mask is None else mask & matched
+
+        key = np.zeros(len(frame['visit_time']), dtype=np.int64)
+        for dim, size in zip(dimensions, sizes):
+            key = key * size + frame[dim]
+        if mask is not None:
+            key = key[mask]
+        keys.append(key)
+        if metric == 'unique':
+            sessions.append(frame['session'][mask] if mask is not None else frame['session'])
+        else:
+            # 舊版快照沒有權重欄位，視為全部保留
+            weight = frame.get('weight')
+            if weight is None:
+                weight = np.ones(len(frame['visit_time']), dtype=np.int32)
+            weights.append(weight[mask] if mask is not None else weight)
+
+    key = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+    if metric == 'unique':
+        session = np.concatenate(sessions) if sessions else np.zeros(0, dtype=np.int64)
+        total = int(np.unique(session).size)
+        # 依 (分組鍵, 會話) 排序後只保留每組的第一個會話
+        order = np.lexsort((session, key))
+        key, session = key[order], session[order]
+        first = np.ones(len(key), dtype=bool)
+        first[1:] = (key[1:] != key[:-1]) | (session[1:] != session[:-1])
+        key = key[first]
+        weight = None
+    else:
+        weight = np.concatenate(weights).astype(np.int64) if weights else np.zeros(0, dtype=np.int64)
+        total = int(weight.sum())
+
+    group_count = int(np.prod(sizes)) if sizes else 1
+    if group_count <= BINCOUNT_MAX_GROUPS:
+        counts = np.bincount(key, weights=weight, minlength=group_count).astype(np.int64)
+        groups = np.nonzero(counts)[0]
+        values = counts[groups]
+    else:
+        groups, inverse = np.unique(key, return_inverse=True)
+        values = np.bincount(inverse, weights=weight, minlength=len(groups)).astype(np.int64)
+
+    top = np.argsort(-values, kind='stable')[:limit] if limit else np.argsort(-values, kind='stable')
+    rows = []
+    for index in top:
+        group = int(groups[index])
+        labels = {}
+        for dim, size in reversed(list(zip(dimensions, sizes))):
+            group, code = divmod(group, size)
+            labels[dim] = encoder.values[dim][code]
+        rows.append({**{dim: labels[dim] for dim in dimensions}, 'value': int(values[index])})
+
+    return {
+        'rows': rows,
+        'total': total,
+        'snapshotRows': snapshot_rows,
+        'deltaRows': delta_rows
+    }
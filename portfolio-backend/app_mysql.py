@@ -5,61 +5,50 @@ Portfolio Backend API - Flask + MySQL + SQLAlchemy
 個人作品集後端API，整合MySQL資料庫
 """
 
-from flask import Flask, request, jsonify, send_from_directory, current_app
+from flask import Flask, Response, request, jsonify, send_from_directory, current_app, stream_with_context
 from flask_cors import CORS
 from flask_migrate import Migrate
+from sqlalchemy.orm import selectinload
 from datetime import datetime, date, timedelta
 import uuid
 import os
 import base64
-import re
 from config import config
 from models import (
-    db, User, Competition, Project, Skill, News, Patent, MediaCoverage, UploadedFile, PageView, VisitorSession, AboutValue
+    db, User, Competition, Project, Skill, News, Patent, MediaCoverage, UploadedFile, PageView, AboutValue
 )
-
-def parse_user_agent(user_agent):
-    """解析用戶代理字符串"""
-    browser = "Unknown"
-    os = "Unknown"
-    device = "Desktop"
-    
-    if not user_agent:
-        return browser, os, device
-    
-    # 檢測瀏覽器
-    if re.search(r'Chrome', user_agent):
-        browser = "Chrome"
-    elif re.search(r'Firefox', user_agent):
-        browser = "Firefox"
-    elif re.search(r'Safari', user_agent) and not re.search(r'Chrome', user_agent):
-        browser = "Safari"
-    elif re.search(r'Edge', user_agent):
-        browser = "Edge"
-    elif re.search(r'Opera', user_agent):
-        browser = "Opera"
-    
-    # 檢測作業系統
-    if re.search(r'Windows', user_agent):
-        os = "Windows"
-    elif re.search(r'Mac OS X', user_agent):
-        os = "macOS"
-    elif re.search(r'Linux', user_agent):
-        os = "Linux"
-    elif re.search(r'Android', user_agent):
-        os = "Android"
-        device = "Mobile"
-    elif re.search(r'iPhone|iPad', user_agent):
-        os = "iOS"
-        device = "Mobile"
-    
-    # 檢測設備類型
-    if re.search(r'Mobile|Android|iPhone', user_agent):
-        device = "Mobile"
-    elif re.search(r'Tablet|iPad', user_agent):
-        device = "Tablet"
-    
-    return browser, os, device
+from analytics_rollup import (
+    query_rollup_summary, query_rollup_top, query_rollup_series, stats_cache, stats_cache_key, read_stats_version,
+    CITY_SEPARATOR, GRANULARITIES
+)
+from analytics_sketches import query_unique_visitors, query_topk_many
+from analytics_export import (
+    EXPORT_TYPES, EXPORT_FORMATS, export_columns, parse_export_cursor, iter_export_rows,
+    next_export_cursor, encode_rows, gzip_chunks
+)
+from analytics_commands import analytics_cli
+from pagination import next_page_link, page_size, keyset_page
+from analytics_ingest import (
+    ingest_queue, validate_page_view, validate_heartbeat, build_page_view_event, parse_event_timestamp
+)
+from analytics_live import live_bus, format_sse
+from analytics_snapshot import DIMENSIONS as SNAPSHOT_DIMENSIONS, load_snapshot, query_snapshot
+from analytics_dimensions import user_agents, referrers
+from ua_classifier import parse_user_agent, ua_classifier
+from geoip import geo_lookup
+from content_versions import conditional_get, init_content_versions
+from portfolio_bundle import DEFAULT_USER, parse_include, build_portfolio_bundle, encode_bundle
+from response_cache import cached_get, response_cache, init_response_cache
+from content_snapshot import TABLES as CONTENT_TABLES, content_store
+
+def format_duration(seconds):
+    """將秒數格式化為中文時間長度 (例如 2分30秒)"""
+    seconds = int(seconds or 0)
+    if seconds >= 3600:
+        return f"{seconds // 3600}小時{seconds % 3600 // 60}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds}秒"
 
 def create_app(config_name=None):
     """應用工廠函數"""
@@ -83,6 +72,15 @@ def create_app(config_name=None):
     
     # 初始化擴展
     db.init_app(app)
+    ingest_queue.init_app(app, parse_user_agent=parse_user_agent)
+    live_bus.init_app(app)
+    geo_lookup.init_app(app)
+    stats_cache.configure(
+        max_entries=app.config.get('ANALYTICS_STATS_CACHE_MAX_ENTRIES', 256),
+        max_bytes=app.config.get('ANALYTICS_STATS_CACHE_MAX_BYTES', 4 * 1024 * 1024)
+    )
+    init_response_cache(app)
+    content_store.init_app(app)
 
     # 增強 CORS 安全配置 - 開發環境下允許所有局域網 IP
     if app.config.get('DEBUG'):
@@ -92,6 +90,7 @@ def create_app(config_name=None):
                 "origins": "*",  # 開發環境允許所有來源
                 "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
                 "allow_headers": ["Content-Type", "Authorization", "Cache-Control", "Pragma"],
+                "expose_headers": ["X-Next-Cursor", "Link", "ETag"],
                 "supports_credentials": True,
                 "max_age": 86400
             }
@@ -103,6 +102,7 @@ def create_app(config_name=None):
                 "origins": app.config['CORS_ORIGINS'],
                 "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
                 "allow_headers": ["Content-Type", "Authorization", "Cache-Control", "Pragma"],
+                "expose_headers": ["X-Next-Cursor", "Link", "ETag"],
                 "supports_credentials": True,
                 "max_age": 86400  # 24小時預檢緩存
             },
@@ -143,14 +143,18 @@ def create_app(config_name=None):
     
     # 註冊藍圖和路由
     register_routes(app)
+    app.cli.add_command(analytics_cli)
     
     # 創建表格
     with app.app_context():
         try:
             db.create_all()
+            init_content_versions()
             print("[OK] 資料庫表格初始化完成")
             # 初始化預設資料
             init_default_data()
+            # 載入公開內容快照 (之後的公開讀取不查詢資料庫)
+            content_store.refresh()
         except Exception as e:
             print(f"[ERROR] 資料庫初始化失敗: {e}")
     
@@ -160,6 +164,51 @@ def register_routes(app):
     """註冊路由"""
     
     # ===== 健康檢查 =====
+    def list_page(query, columns, descending=True, default_size=None):
+        """依 keyset 游標分頁 (?limit=&cursor=)，回傳 (資料列, 回應標頭, 下一頁游標)；參數錯誤時拋出 ValueError"""
+        limit = page_size(
+            request.args.get('limit'),
+            default_size or app.config.get('API_DEFAULT_PAGE_SIZE', 100),
+            app.config.get('API_MAX_PAGE_SIZE', 500)
+        )
+        items, next_cursor = keyset_page(query, columns, request.args.get('cursor'), limit, descending)
+        return items, page_headers(next_cursor), next_cursor
+
+    def page_headers(next_cursor):
+        """下一頁的回應標頭"""
+        headers = {}
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+            headers['Link'] = next_page_link(request.base_url, request.args, next_cursor)
+        return headers
+
+    def list_content(table):
+        """公開內容列表：由內容快照分頁 (快照停用時查詢資料庫)，回傳 (dict 列表, 回應標頭)；參數錯誤時拋出 ValueError"""
+        snapshot = content_store.current()
+        spec = CONTENT_TABLES[table]
+        if snapshot is None:
+            items, headers, _ = list_page(
+                spec.model.query.filter_by(**spec.filters),
+                [getattr(spec.model, column) for column in spec.columns],
+                descending=spec.descending
+            )
+            return [item.to_dict() for item in items], headers
+        limit = page_size(
+            request.args.get('limit'),
+            app.config.get('API_DEFAULT_PAGE_SIZE', 100),
+            app.config.get('API_MAX_PAGE_SIZE', 500)
+        )
+        items, next_cursor = snapshot.table(table).page(request.args.get('cursor'), limit)
+        return items, page_headers(next_cursor)
+
+    def get_content(table, item_id):
+        """公開內容單筆：由內容快照取得 (快照停用時查詢資料庫)，不存在時回傳 None"""
+        snapshot = content_store.current()
+        if snapshot is None:
+            item = CONTENT_TABLES[table].model.query.get(item_id)
+            return item.to_dict() if item else None
+        return snapshot.table(table).by_id.get(str(item_id))
+
     @app.route('/health', methods=['GET'])
     def health_check():
         """健康檢查端點"""
@@ -208,26 +257,36 @@ def register_routes(app):
             print(f"[ERROR] Auth login error: {e}")
             return jsonify({"error": "登入失敗"}), 500
 
+    # ===== 作品集彙整 =====
+    @app.route('/api/v1/portfolio', methods=['GET'])
+    @cached_get(User, Competition, Project, Skill, Patent, MediaCoverage, AboutValue)
+    def get_portfolio():
+        """一次取得前台需要的所有公開內容 (?include=user,competitions,... 可只取部分區塊)"""
+        try:
+            sections = parse_include(request.args.get('include'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            bundle = build_portfolio_bundle(sections, snapshot=content_store.current())
+            return Response(encode_bundle(bundle), mimetype='application/json')
+        except Exception as e:
+            return jsonify({"error": f"獲取作品集資料失敗: {str(e)}"}), 500
+
     # ===== 用戶管理 =====
     @app.route('/api/v1/user', methods=['GET'])
+    @cached_get(User)
     def get_user():
         """獲取用戶信息"""
+        snapshot = content_store.current()
+        if snapshot is not None:
+            return jsonify(snapshot.table('users').first() or DEFAULT_USER)
         user = User.query.first()
         if user:
             return jsonify(user.to_dict())
         else:
             # 返回預設用戶信息
-            return jsonify({
-                "name": "Portfolio User",
-                "email": "user@example.com",
-                "phone": "",
-                "title": "軟體工程師",
-                "description": "熱愛技術的開發者",
-                "github": "",
-                "linkedin": "",
-                "location": "台灣",
-                "website": ""
-            })
+            return jsonify(DEFAULT_USER)
 
     @app.route('/api/v1/user/update', methods=['POST'])
     def update_user():
@@ -261,11 +320,14 @@ def register_routes(app):
     # ===== 競賽管理 =====
     @app.route('/api/v1/competitions', methods=['GET'])
     @app.route('/api/v1/competitions/', methods=['GET'])
+    @cached_get(Competition)
     def get_competitions():
         """獲取所有競賽"""
         try:
-            competitions = Competition.query.order_by(Competition.created_at.desc()).all()
-            return jsonify([comp.to_dict() for comp in competitions])
+            competitions, headers = list_content('competitions')
+            return jsonify(competitions), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取競賽資料失敗: {str(e)}"}), 500
 
@@ -417,25 +479,29 @@ def register_routes(app):
             return jsonify({"error": f"刪除競賽失敗: {str(e)}"}), 500
 
     @app.route('/api/v1/competitions/<competition_id>', methods=['GET'])
+    @cached_get(Competition)
     def get_competition(competition_id):
         """獲取單個競賽詳情"""
         try:
-            competition = Competition.query.get(competition_id)
+            competition = get_content('competitions', competition_id)
             if not competition:
                 return jsonify({"error": "競賽不存在"}), 404
             
-            return jsonify(competition.to_dict())
+            return jsonify(competition)
             
         except Exception as e:
             return jsonify({"error": f"獲取競賽詳情失敗: {str(e)}"}), 500
 
     # ===== 項目管理 =====
     @app.route('/api/v1/projects', methods=['GET'])
+    @cached_get(Project)
     def get_projects():
         """獲取所有項目"""
         try:
-            projects = Project.query.order_by(Project.created_at.desc()).all()
-            return jsonify([proj.to_dict() for proj in projects])
+            projects, headers = list_content('projects')
+            return jsonify(projects), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取項目資料失敗: {str(e)}"}), 500
 
@@ -475,11 +541,14 @@ def register_routes(app):
 
     # ===== 技能管理 =====
     @app.route('/api/v1/skills', methods=['GET'])
+    @cached_get(Skill)
     def get_skills():
         """獲取所有技能"""
         try:
-            skills = Skill.query.order_by(Skill.category, Skill.name).all()
-            return jsonify([skill.to_dict() for skill in skills])
+            skills, headers = list_content('skills')
+            return jsonify(skills), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取技能資料失敗: {str(e)}"}), 500
 
@@ -558,11 +627,14 @@ def register_routes(app):
 
     # ===== 專利管理 =====
     @app.route('/api/v1/patents', methods=['GET'])
+    @cached_get(Patent)
     def get_patents():
         """獲取所有專利"""
         try:
-            patents = Patent.query.order_by(Patent.created_at.desc()).all()
-            return jsonify([patent.to_dict() for patent in patents])
+            patents, headers = list_content('patents')
+            return jsonify(patents), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取專利失敗: {str(e)}"}), 500
 
@@ -723,23 +795,27 @@ def register_routes(app):
             return jsonify({"error": f"刪除專利失敗: {str(e)}"}), 500
 
     @app.route('/api/v1/patents/<patent_id>', methods=['GET'])
+    @cached_get(Patent)
     def get_patent(patent_id):
         """獲取單個專利"""
         try:
-            patent = Patent.query.get(patent_id)
+            patent = get_content('patents', patent_id)
             if not patent:
                 return jsonify({"error": "專利不存在"}), 404
-            return jsonify(patent.to_dict())
+            return jsonify(patent)
         except Exception as e:
             return jsonify({"error": f"獲取專利失敗: {str(e)}"}), 500
 
     # ===== 媒體報導管理 =====
     @app.route('/api/v1/media-coverage', methods=['GET'])
+    @cached_get(MediaCoverage)
     def get_media_coverage():
         """獲取所有媒體報導"""
         try:
-            media_list = MediaCoverage.query.order_by(MediaCoverage.created_at.desc()).all()
-            return jsonify([media.to_dict() for media in media_list])
+            media_list, headers = list_content('media_coverage')
+            return jsonify(media_list), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取媒體報導失敗: {str(e)}"}), 500
 
@@ -846,23 +922,27 @@ def register_routes(app):
             return jsonify({"error": f"刪除媒體報導失敗: {str(e)}"}), 500
 
     @app.route('/api/v1/media-coverage/<media_id>', methods=['GET'])
+    @cached_get(MediaCoverage)
     def get_single_media_coverage(media_id):
         """獲取單個媒體報導"""
         try:
-            media = MediaCoverage.query.get(media_id)
+            media = get_content('media_coverage', media_id)
             if not media:
                 return jsonify({"error": "媒體報導不存在"}), 404
-            return jsonify(media.to_dict())
+            return jsonify(media)
         except Exception as e:
             return jsonify({"error": f"獲取媒體報導失敗: {str(e)}"}), 500
 
     # ===== 新聞管理 =====
     @app.route('/api/v1/news', methods=['GET'])
+    @cached_get(News)
     def get_news():
         """獲取所有新聞"""
         try:
-            news_list = News.query.order_by(News.created_at.desc()).all()
-            return jsonify([news.to_dict() for news in news_list])
+            news_list, headers = list_content('news')
+            return jsonify(news_list), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取新聞資料失敗: {str(e)}"}), 500
 
@@ -887,11 +967,14 @@ def register_routes(app):
 
     # ===== About Values 管理 =====
     @app.route('/api/v1/about-values', methods=['GET'])
+    @cached_get(AboutValue)
     def get_about_values():
         """獲取所有About翻卡內容"""
         try:
-            about_values = AboutValue.query.filter_by(is_active=True).order_by(AboutValue.order_index).all()
-            return jsonify([value.to_dict() for value in about_values])
+            about_values, headers = list_content('about_values')
+            return jsonify(about_values), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取About內容失敗: {str(e)}"}), 500
 
@@ -1021,15 +1104,19 @@ def register_routes(app):
             return jsonify({"error": f"上傳文件失敗: {str(e)}"}), 500
 
     @app.route('/api/v1/files', methods=['GET'])
+    @conditional_get(UploadedFile)
     def get_files():
         """獲取所有文件"""
         try:
-            files = UploadedFile.query.order_by(UploadedFile.created_at.desc()).all()
-            return jsonify([file.to_dict() for file in files])
+            files, headers, _ = list_page(UploadedFile.query, [UploadedFile.created_at, UploadedFile.id])
+            return jsonify([file.to_dict() for file in files]), 200, headers
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取文件列表失敗: {str(e)}"}), 500
 
     @app.route('/api/v1/files/<file_id>', methods=['GET'])
+    @conditional_get(UploadedFile)
     def get_file(file_id):
         """獲取特定文件"""
         try:
@@ -1059,175 +1146,479 @@ def register_routes(app):
     # ===== 流量分析 =====
     @app.route('/api/v1/analytics/track', methods=['POST'])
     def track_page_view():
-        """記錄頁面瀏覽"""
+        """記錄頁面瀏覽 (排入寫入佇列，由背景執行緒批次寫入)"""
         try:
-            data = request.get_json()
+            data = request.get_json(silent=True)
+            if data is None:
+                data = {}
+
+            error = validate_page_view(data)
+            if error:
+                return jsonify({"error": error}), 400
             
             # 獲取請求信息
-            ip_address = request.remote_addr
-            user_agent = request.headers.get('User-Agent', '')
-            referer = request.headers.get('Referer', '')
-            
-            # 解析用戶代理信息
-            browser, os, device = parse_user_agent(user_agent)
+            event = build_page_view_event(
+                data,
+                ip_address=request.remote_addr,
+                user_agent=request.headers.get('User-Agent', ''),
+                referer=request.headers.get('Referer', '')
+            )
+
+            if not ingest_queue.enqueue(event):
+                return jsonify({"error": "流量記錄佇列已滿，請稍後再試"}), 503
+            live_bus.publish_view(event)
             
-            # 創建或更新訪客會話
-            session_id = data.get('sessionId', str(uuid.uuid4()))
-            session = VisitorSession.query.filter_by(session_id=session_id).first()
+            return jsonify({
+                'status': 'accepted',
+                'sessionId': event['session_id'],
+                'pageViewId': event['id'],
+                'message': '頁面瀏覽已排入記錄佇列'
+            }), 202
             
-            if not session:
-                # 新建會話
-                session = VisitorSession(
-                    id=str(uuid.uuid4()),
-                    session_id=session_id,
+        except Exception as e:
+            return jsonify({"error": f"記錄頁面瀏覽失敗: {str(e)}"}), 500
+
+    @app.route('/api/v1/analytics/track/batch', methods=['POST'])
+    def track_page_view_batch():
+        """批次記錄頁面瀏覽 (前端緩衝後以 sendBeacon 送出)"""
+        try:
+            # sendBeacon 以 text/plain 送出，需強制解析 JSON
+            data = request.get_json(force=True, silent=True)
+            events = data.get('events') if isinstance(data, dict) else data
+            if not isinstance(events, list) or not events:
+                return jsonify({"error": "events 必須為非空陣列"}), 400
+
+            max_events = app.config.get('ANALYTICS_MAX_BATCH_EVENTS', 100)
+            if len(events) > max_events:
+                return jsonify({"error": f"單次最多 {max_events} 筆事件"}), 413
+
+            ip_address = request.remote_addr
+            user_agent = request.headers.get('User-Agent', '')
+            header_referer = request.headers.get('Referer', '')
+            now = datetime.now()
+
+            results = []
+            counts = {'accepted': 0, 'rejected': 0, 'dropped': 0}
+            for index, item in enumerate(events):
+                error = validate_page_view(item)
+                if error:
+                    results.append({'index': index, 'status': 'rejected', 'error': error})
+                    counts['rejected'] += 1
+                    continue
+
+                event = build_page_view_event(
+                    item,
                     ip_address=ip_address,
                     user_agent=user_agent,
-                    browser=browser,
-                    os=os,
-                    device=device,
-                    first_visit=datetime.now(),
-                    last_visit=datetime.now(),
-                    total_page_views=1
+                    referer=item.get('referrer') or header_referer,
+                    visit_time=parse_event_timestamp(item.get('timestamp'), now=now)
                 )
-                db.session.add(session)
+
+                if ingest_queue.enqueue(event):
+                    live_bus.publish_view(event)
+                    results.append({
+                        'index': index, 'status': 'accepted',
+                        'sessionId': event['session_id'], 'pageViewId': event['id']
+                    })
+                    counts['accepted'] += 1
+                else:
+                    results.append({'index': index, 'status': 'dropped', 'error': '流量記錄佇列已滿'})
+                    counts['dropped'] += 1
+
+            if counts['accepted'] == 0:
+                status_code = 503 if counts['dropped'] else 400
             else:
-                # 更新現有會話
-                session.last_visit = datetime.now()
-                session.total_page_views += 1
-                session.is_unique = False
-            
-            # 記錄頁面瀏覽
-            page_view = PageView(
-                id=str(uuid.uuid4()),
-                path=data.get('path', '/'),
-                title=data.get('title', ''),
-                ip_address=ip_address,
-                user_agent=user_agent,
-                referer=referer,
-                session_id=session_id,
-                visit_time=datetime.now()
-            )
-            
-            db.session.add(page_view)
-            db.session.commit()
-            
+                status_code = 202
+
             return jsonify({
-                'status': 'success',
-                'sessionId': session_id,
-                'message': '頁面瀏覽記錄成功'
-            }), 201
-            
+                'status': 'accepted' if status_code == 202 else 'failed',
+                **counts,
+                'results': results
+            }), status_code
+
         except Exception as e:
-            db.session.rollback()
-            return jsonify({"error": f"記錄頁面瀏覽失敗: {str(e)}"}), 500
+            return jsonify({"error": f"批次記錄頁面瀏覽失敗: {str(e)}"}), 500
+
+    @app.route('/api/v1/analytics/heartbeat', methods=['POST'])
+    def track_heartbeat():
+        """記錄頁面停留時間 (定期心跳或頁面卸載時送出累計秒數)"""
+        try:
+            # 頁面卸載時以 sendBeacon (text/plain) 送出，需強制解析 JSON
+            data = request.get_json(force=True, silent=True)
+            if isinstance(data, dict) and 'heartbeats' in data:
+                heartbeats = data.get('heartbeats')
+            elif isinstance(data, list):
+                heartbeats = data
+            else:
+                heartbeats = [data]
+            if not isinstance(heartbeats, list) or not heartbeats:
+                return jsonify({"error": "heartbeats 必須為非空陣列"}), 400
+
+            max_events = app.config.get('ANALYTICS_MAX_BATCH_EVENTS', 100)
+            if len(heartbeats) > max_events:
+                return jsonify({"error": f"單次最多 {max_events} 筆心跳"}), 413
+
+            counts = {'accepted': 0, 'rejected': 0, 'dropped': 0}
+            for item in heartbeats:
+                if validate_heartbeat(item):
+                    counts['rejected'] += 1
+                elif ingest_queue.record_duration(item['pageViewId'], item['duration']):
+                    live_bus.touch(item['pageViewId'])
+                    counts['accepted'] += 1
+                else:
+                    counts['dropped'] += 1
+
+            if counts['accepted'] == 0:
+                status_code = 503 if counts['dropped'] else 400
+            else:
+                status_code = 202
+
+            return jsonify({
+                'status': 'accepted' if status_code == 202 else 'failed',
+                **counts
+            }), status_code
+
+        except Exception as e:
+            return jsonify({"error": f"記錄停留時間失敗: {str(e)}"}), 500
+
+    @app.route('/api/v1/analytics/queue', methods=['GET'])
+    def get_analytics_queue():
+        """獲取流量記錄佇列狀態"""
+        return jsonify(ingest_queue.stats())
+
+    @app.route('/api/v1/analytics/diagnostics', methods=['GET'])
+    def get_analytics_diagnostics():
+        """流量分析的行程內狀態 (寫入佇列、即時推送、各快取命中率)"""
+        return jsonify({
+            'pid': os.getpid(),
+            'queue': ingest_queue.stats(),
+            'live': live_bus.stats(),
+            'statsCache': stats_cache.stats(),
+            'responseCache': response_cache.stats(),
+            'contentSnapshot': content_store.stats(),
+            'uaClassifierCache': ua_classifier.stats(),
+            'geoip': geo_lookup.stats(),
+            'dimensionCaches': {
+                'userAgents': user_agents.stats(),
+                'referrers': referrers.stats()
+            }
+        })
+
+    @app.route('/api/v1/analytics/live', methods=['GET'])
+    def stream_live_analytics():
+        """即時推送新的頁面瀏覽與在線訪客數 (Server-Sent Events)"""
+        subscription = live_bus.subscribe()
+        if subscription is None:
+            return jsonify({"error": "即時連線數已達上限，請稍後再試"}), 503
+
+        def events():
+            try:
+                yield 'retry: 5000\n\n'
+                yield format_sse('snapshot', live_bus.snapshot())
+                while True:
+                    message = subscription.get(timeout=15)
+                    if subscription.closed:
+                        # 緩衝區已滿被中斷，用戶端重新連線後會收到新的 snapshot
+                        yield format_sse('dropped', {'reason': 'slow consumer'})
+                        break
+                    if message is None:
+                        yield ': keepalive\n\n'
+                    else:
+                        yield format_sse('update', message)
+            finally:
+                live_bus.unsubscribe(subscription)
+
+        return Response(events(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
 
     @app.route('/api/v1/analytics/stats', methods=['GET'])
     def get_analytics_stats():
         """獲取分析統計數據"""
         try:
             # 獲取查詢參數
-            days = int(request.args.get('days', 30))  # 預設30天
+            try:
+                days = int(request.args.get('days', 30))  # 預設30天
+                today = date.today()
+                end_day = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+            except ValueError as e:
+                return jsonify({"error": f"參數格式錯誤: {str(e)}"}), 400
+            if days <= 0:
+                return jsonify({"error": "days 必須大於 0"}), 400
+            end_day = min(end_day, today)
+            exact = request.args.get('exact', '').lower() in ('1', 'true') or app.config.get('ANALYTICS_TOPK_EXACT', False)
+            
+            # 結果快取：當天仍在變動的區間短暫快取，已結束的區間長期保存
+            # (鍵包含彙總版本號，任一行程寫入已結束的日期後都會改用新的鍵)
+            cache_key = stats_cache_key(days, end_day, exact, read_stats_version())
+            cached = stats_cache.get(cache_key)
+            if cached is not None:
+                return jsonify(cached), 200, {'X-Cache': 'HIT'}
             
             # 計算時間範圍
-            end_date = datetime.now()
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days-1)
-            
-            # 總頁面瀏覽量
-            total_page_views = PageView.query.filter(
-                PageView.visit_time >= start_date,
-                PageView.visit_time <= end_date
-            ).count()
-            
-            # 唯一訪客數
-            unique_visitors = VisitorSession.query.filter(
-                VisitorSession.first_visit >= start_date,
-                VisitorSession.first_visit <= end_date
-            ).count()
-            
-            # 最受歡迎頁面
-            from sqlalchemy import func
-            top_pages = db.session.query(
-                PageView.path,
-                PageView.title,
-                func.count(PageView.id).label('views')
-            ).filter(
-                PageView.visit_time >= start_date,
-                PageView.visit_time <= end_date
-            ).group_by(PageView.path, PageView.title).order_by(
-                func.count(PageView.id).desc()
-            ).limit(10).all()
-            
-            # 訪客來源
-            referrers = db.session.query(
-                PageView.referer,
-                func.count(PageView.id).label('visits')
-            ).filter(
-                PageView.visit_time >= start_date,
-                PageView.visit_time <= end_date,
-                PageView.referer != None,
-                PageView.referer != ''
-            ).group_by(PageView.referer).order_by(
-                func.count(PageView.id).desc()
-            ).limit(10).all()
-            
-            # 瀏覽器統計
-            browsers = db.session.query(
-                VisitorSession.browser,
-                func.count(VisitorSession.id).label('count')
-            ).filter(
-                VisitorSession.first_visit >= start_date,
-                VisitorSession.first_visit <= end_date
-            ).group_by(VisitorSession.browser).order_by(
-                func.count(VisitorSession.id).desc()
-            ).limit(10).all()
-            
-            # 平均停留時間 (模擬數據，實際需要前端支持)
-            avg_time_on_site = "2分30秒"
+            end_date = datetime.now() if end_day == today else datetime.combine(end_day, datetime.max.time())
+            start_date = datetime.combine(end_day, datetime.min.time()) - timedelta(days=days-1)
             
-            return jsonify({
+            # 從彙總表讀取 (每日區間 × 維度)，不掃描原始資料；
+            # 總數、瀏覽器、國家/城市與停留時間分佈以單一查詢讀取
+            summary = query_rollup_summary(
+                start_date, end_date, ['total', 'browser', 'country', 'city', 'session_duration']
+            )
+            total_page_views, _ = summary.totals()
+            
+            # 唯一訪客數 (合併每日 HyperLogLog 草圖的估計值，相對標準誤差約 1.6%)
+            unique_visitors, unique_visitors_error = query_unique_visitors(start_date, end_date)
+            
+            # 最受歡迎頁面與訪客來源：預設合併每日 Space-Saving 草圖，exact=1 時改用精確彙總
+            # (頁面與來源的值很多，由資料庫排序截取比全部讀回更快)
+            if exact:
+                top_pages = query_rollup_top('path', start_date, end_date, metric='views')
+                referrers = query_rollup_top('referrer', start_date, end_date, metric='views')
+            else:
+                capacity = app.config.get('ANALYTICS_TOPK_CAPACITY', 100)
+                top_items = query_topk_many(['path', 'referrer'], start_date, end_date, capacity=capacity)
+                top_pages, referrers = top_items['path'], top_items['referrer']
+            
+            # 瀏覽器與國家/城市統計 (依新會話數，國家/城市由本機 IP 地理資料庫判斷)
+            browsers = summary.top('browser', metric='sessions')
+            countries = summary.top('country', metric='sessions')
+            cities = summary.top('city', metric='sessions')
+            
+            # 平均/中位數停留時間 (彙總表的停留時間總和與會話停留時間分佈)
+            avg_time_on_site, median_time_on_site = summary.time_on_site()
+            
+            result = {
                 'pageViews': total_page_views,
                 'uniqueVisitors': unique_visitors,
-                'averageTimeOnSite': avg_time_on_site,
+                'uniqueVisitorsEstimate': {
+                    'method': 'hyperloglog',
+                    'relativeError': round(unique_visitors_error, 4),
+                    'lower': max(0, int(unique_visitors * (1 - 2 * unique_visitors_error))),
+                    'upper': int(round(unique_visitors * (1 + 2 * unique_visitors_error)))
+                },
+                'averageTimeOnSite': format_duration(avg_time_on_site),
+                'averageTimeOnSiteSeconds': avg_time_on_site,
+                'medianTimeOnSite': format_duration(median_time_on_site),
+                'medianTimeOnSiteSeconds': median_time_on_site,
                 'topPages': [
-                    {'path': page.path, 'title': page.title, 'views': page.views}
-                    for page in top_pages
+                    {'path': path, 'title': title or '', 'views': views}
+                    for path, title, views in top_pages
                 ],
                 'referrers': [
-                    {'source': ref.referer, 'visits': ref.visits}
-                    for ref in referrers
+                    {'source': source, 'visits': visits}
+                    for source, _, visits in referrers
                 ],
                 'browsers': [
-                    {'name': browser.browser, 'count': browser.count}
-                    for browser in browsers
+                    {'name': name, 'count': count}
+                    for name, _, count in browsers
+                ],
+                'countries': [
+                    {'country': country, 'count': count}
+                    for country, _, count in countries
                 ],
+                'cities': [
+                    dict(zip(('country', 'city'), value.split(CITY_SEPARATOR, 1)), count=count)
+                    for value, _, count in cities
+                ],
+                'topItemsMethod': 'exact' if exact else 'space-saving',
                 'dateRange': {
                     'start': start_date.isoformat(),
                     'end': end_date.isoformat(),
                     'days': days
                 }
-            })
+            }
+            
+            if end_day == today:
+                ttl = app.config.get('ANALYTICS_STATS_CACHE_TTL', 30)
+            else:
+                ttl = app.config.get('ANALYTICS_STATS_CACHE_CLOSED_TTL', 24 * 3600)
+            stats_cache.set(cache_key, result, ttl=ttl)
+            return jsonify(result), 200, {'X-Cache': 'MISS'}
             
         except Exception as e:
             return jsonify({"error": f"獲取統計數據失敗: {str(e)}"}), 500
 
+    @app.route('/api/v1/analytics/timeseries', methods=['GET'])
+    def get_analytics_timeseries():
+        """獲取每小時/每日的流量時間序列 (由彙總表讀取，空白區間補 0)"""
+        try:
+            granularity = request.args.get('granularity', 'day')
+            metric = request.args.get('metric', 'views')
+            path = request.args.get('path')
+            if granularity not in GRANULARITIES:
+                return jsonify({"error": f"granularity 必須是 {', '.join(GRANULARITIES)}"}), 400
+            if metric not in ('views', 'sessions'):
+                return jsonify({"error": "metric 必須是 views 或 sessions"}), 400
+            try:
+                days = int(request.args.get('days', 7 if granularity == 'hour' else 30))
+                today = date.today()
+                end_day = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+            except ValueError as e:
+                return jsonify({"error": f"參數格式錯誤: {str(e)}"}), 400
+            if days <= 0:
+                return jsonify({"error": "days 必須大於 0"}), 400
+            end_day = min(end_day, today)
+            
+            end_date = datetime.now() if end_day == today else datetime.combine(end_day, datetime.max.time())
+            start_date = datetime.combine(end_day, datetime.min.time()) - timedelta(days=days-1)
+            points = days * 24 if granularity == 'hour' else days
+            max_points = app.config.get('ANALYTICS_TIMESERIES_MAX_POINTS', 2000)
+            if points > max_points:
+                return jsonify({"error": f"資料點數 {points} 超過上限 {max_points}，請縮短區間或改用 day"}), 400
+            
+            # path 指定時為該頁面的瀏覽數 / 以該頁面進站的會話數
+            series = query_rollup_series(
+                granularity, start_date, end_date, metric=metric,
+                dimension='path' if path else 'total', value=path or ''
+            )
+            
+            return jsonify({
+                'granularity': granularity,
+                'metric': metric,
+                'path': path,
+                'points': [{'time': moment.isoformat(), 'value': value} for moment, value in series],
+                'total': sum(value for _, value in series),
+                'dateRange': {
+                    'start': start_date.isoformat(),
+                    'end': end_date.isoformat(),
+                    'days': days
+                }
+            })
+            
+        except Exception as e:
+            return jsonify({"error": f"獲取流量時間序列失敗: {str(e)}"}), 500
+
     @app.route('/api/v1/analytics/recent', methods=['GET'])
     def get_recent_views():
         """獲取最近的頁面瀏覽記錄"""
         try:
-            limit = int(request.args.get('limit', 50))
-            
-            recent_views = PageView.query.order_by(
-                PageView.visit_time.desc()
-            ).limit(limit).all()
+            # 依 (visit_time, id) 的 keyset 游標分頁，每頁筆數受 API_MAX_PAGE_SIZE 限制
+            recent_views, headers, next_cursor = list_page(
+                PageView.query.options(
+                    selectinload(PageView.user_agent_dim), selectinload(PageView.referrer_dim)
+                ),
+                [PageView.visit_time, PageView.id],
+                default_size=50
+            )
             
             return jsonify({
                 'recentViews': [view.to_dict() for view in recent_views],
-                'total': len(recent_views)
-            })
+                'total': len(recent_views),
+                'nextCursor': next_cursor
+            }), 200, headers
             
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": f"獲取最近瀏覽記錄失敗: {str(e)}"}), 500
 
+    @app.route('/api/v1/analytics/explore', methods=['GET'])
+    def explore_analytics():
+        """在欄式快照 (加上之後的新資料) 上做臨時分組查詢"""
+        try:
+            try:
+                dimensions = [dim for dim in request.args.get('dimensions', '').split(',') if dim]
+                metric = request.args.get('metric', 'count')
+                limit = min(int(request.args.get('limit', 20)), app.config.get('API_MAX_PAGE_SIZE', 500))
+                if request.args.get('start'):
+                    start_date = datetime.strptime(request.args['start'], '%Y-%m-%d')
+                elif request.args.get('days'):
+                    days = int(request.args['days'])
+                    start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days-1)
+                else:
+                    start_date = None
+                end_date = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') else None
+                # 篩選條件：?browser=Chrome&device=Mobile
+                where = {dim: request.args[dim] for dim in SNAPSHOT_DIMENSIONS if dim in request.args}
+            except ValueError as e:
+                return jsonify({"error": f"參數格式錯誤: {str(e)}"}), 400
+
+            try:
+                snapshot = load_snapshot(app.config['ANALYTICS_SNAPSHOT_FOLDER'])
+            except RuntimeError as e:
+                return jsonify({"error": str(e)}), 501
+            if snapshot is None:
+                return jsonify({"error": "尚未建立欄式快照，請先執行 flask analytics snapshot"}), 404
+
+            try:
+                result = query_snapshot(
+                    snapshot, dimensions, start=start_date, end=end_date, metric=metric, where=where, limit=limit,
+                    include_delta=request.args.get('delta', '1').lower() not in ('0', 'false')
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+
+            return jsonify({
+                **result,
+                'dimensions': dimensions,
+                'metric': metric,
+                'where': where,
+                'snapshot': snapshot.info()
+            })
+
+        except Exception as e:
+            return jsonify({"error": f"快照查詢失敗: {str(e)}"}), 500
+
+    @app.route('/api/v1/analytics/export', methods=['GET'])
+    def export_analytics():
+        """串流匯出頁面瀏覽或會話原始資料 (NDJSON / CSV，可 gzip)"""
+        try:
+            kind = request.args.get('type', 'page_views')
+            export_format = request.args.get('format', 'ndjson').lower()
+            compress = request.args.get('gzip', '').lower() in ('1', 'true')
+            if kind not in EXPORT_TYPES:
+                return jsonify({"error": f"type 必須是 {', '.join(EXPORT_TYPES)}"}), 400
+            if export_format not in EXPORT_FORMATS:
+                return jsonify({"error": f"format 必須是 {', '.join(EXPORT_FORMATS)}"}), 400
+
+            # 日期區間：start/end (YYYY-MM-DD，含 end 當天)，未指定時為最近 days 天
+            try:
+                if request.args.get('start'):
+                    start_date = datetime.strptime(request.args['start'], '%Y-%m-%d')
+                else:
+                    days = int(request.args.get('days', 30))
+                    start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days-1)
+                if request.args.get('end'):
+                    end_date = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1)
+                else:
+                    end_date = datetime.now()
+                limit = int(request.args['limit']) if request.args.get('limit') else None
+                after = parse_export_cursor(request.args['cursor']) if request.args.get('cursor') else None
+            except ValueError as e:
+                return jsonify({"error": f"參數格式錯誤: {str(e)}"}), 400
+            if limit is not None and limit <= 0:
+                return jsonify({"error": "limit 必須大於 0"}), 400
+
+            headers = {}
+            # 分段匯出：超過 limit 筆時提供下一段的游標，中斷後也可從該游標續傳
+            next_cursor = next_export_cursor(kind, start_date, end_date, after, limit)
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+                headers['Link'] = next_page_link(request.base_url, request.args, next_cursor)
+
+            chunk_size = app.config.get('ANALYTICS_EXPORT_CHUNK_SIZE', 1000)
+            columns = export_columns(kind)
+            chunks = encode_rows(
+                iter_export_rows(kind, start_date, end_date, after=after, limit=limit, chunk_size=chunk_size),
+                export_format, columns
+            )
+            filename = f"{kind}-{start_date:%Y%m%d}-{(end_date - timedelta(seconds=1)):%Y%m%d}.{export_format}"
+            mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+            if compress:
+                chunks = gzip_chunks(chunks)
+                filename += '.gz'
+                mimetype = 'application/gzip'
+            else:
+                chunks = (chunk.encode('utf-8') for chunk in chunks)
+            headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            headers['X-Accel-Buffering'] = 'no'
+
+            return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+        except Exception as e:
+            return jsonify({"error": f"匯出流量資料失敗: {str(e)}"}), 500
+
     # ===== 文件上傳端點 =====
     @app.route('/api/v1/upload', methods=['POST'])
     def upload_multipart_file():
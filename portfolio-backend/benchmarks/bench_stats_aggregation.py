@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+統計端點彙總方式基準測試
+
+原始資料：比較舊版統計端點的五個獨立查詢 (總瀏覽數、會話數、熱門頁面、來源、瀏覽器，
+區間被掃描五次)、單次串流掃描 (分段讀取，在 Python 中同時餵給多個累加器)，
+以及單次分組掃描 (每個表格一個最細粒度的 GROUP BY，再於 Python 中合併出各項統計)。
+彙總表：比較分別查詢各維度 (總數、排行、停留時間分佈) 與 query_rollup_summary 的單一查詢，
+分為統計端點預設 (熱門頁面/來源由草圖提供) 與 exact=1 兩種情況。
+
+用法:
+    python benchmarks/bench_stats_aggregation.py --rows 100000,1000000
+    python benchmarks/bench_stats_aggregation.py --rows 10000000 --repeat 1 --output stats.json
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+BROWSERS = ['Chrome', 'Safari', 'Firefox', 'Edge', 'Samsung Internet', 'Opera']
+INSERT_BATCH = 20000
+
+
+def zipf_population(prefix, size, exponent):
+    """產生 Zipf 分佈的母體與累積權重"""
+    items = [f"{prefix}{index}" for index in range(size)]
+    weights = [1.0 / (rank + 1) ** exponent for rank in range(size)]
+    return items, list(accumulate(weights))
+
+
+def populate(db, models, rows, args, now):
+    """寫入合成的會話與頁面瀏覽 (舊版欄位：來源存於 page_views.referer)"""
+    paths, path_weights = zipf_population('/page/', args.paths, args.exponent)
+    referrers, referrer_weights = zipf_population('https://ref.example/', args.referrers, args.exponent)
+    window = args.days * 86400
+
+    session_count = max(1, rows // args.views_per_session)
+    first_visits = [now - timedelta(seconds=random.randint(3600, window)) for _ in range(session_count)]
+    session_table = models.VisitorSession.__table__
+    for offset in range(0, session_count, INSERT_BATCH):
+        db.session.execute(session_table.insert(), [
+            {
+                'id': f"s{index}", 'session_id': f"s{index}", 'browser': random.choice(BROWSERS),
+                'device': 'Desktop', 'first_visit': first_visits[index], 'last_visit': first_visits[index],
+                'total_page_views': 1, 'total_time_spent': 0, 'is_unique': False
+            }
+            for index in range(offset, min(offset + INSERT_BATCH, session_count))
+        ])
+        db.session.commit()
+
+    # 每個會話的第一筆瀏覽時間等於 first_visit，其餘在之後 30 分鐘內
+    view_table = models.PageView.__table__
+    for offset in range(0, rows, INSERT_BATCH):
+        batch = []
+        for index in range(offset, min(offset + INSERT_BATCH, rows)):
+            session = index if index < session_count else random.randrange(session_count)
+            delay = 0 if index < session_count else random.randint(1, 1800)
+            path = random.choices(paths, cum_weights=path_weights)[0]
+            batch.append({
+                'id': f"v{index}", 'path': path, 'title': path.upper(), 'session_id': f"s{session}",
+                'visit_time': first_visits[session] + timedelta(seconds=delay),
+                'referer': random.choices(referrers, cum_weights=referrer_weights)[0] if random.random() < 0.5 else None,
+                'view_duration': random.randint(0, 120), 'sample_weight': 1
+            })
+        db.session.execute(view_table.insert(), batch)
+        db.session.commit()
+
+
+def five_queries(db, models, start_date, end_date):
+    """舊版統計端點：區間內的五個獨立查詢"""
+    from sqlalchemy import func
+    PageView, VisitorSession = models.PageView, models.VisitorSession
+
+    views = PageView.query.filter(PageView.visit_time >= start_date, PageView.visit_time <= end_date).count()
+    sessions = VisitorSession.query.filter(
+        VisitorSession.first_visit >= start_date, VisitorSession.first_visit <= end_date
+    ).count()
+    top_pages = db.session.query(PageView.path, PageView.title, func.count(PageView.id)).filter(
+        PageView.visit_time >= start_date, PageView.visit_time <= end_date
+    ).group_by(PageView.path, PageView.title).order_by(func.count(PageView.id).desc(), PageView.path).limit(10).all()
+    referrers = db.session.query(PageView.referer, func.count(PageView.id)).filter(
+        PageView.visit_time >= start_date, PageView.visit_time <= end_date,
+        PageView.referer != None, PageView.referer != ''
+    ).group_by(PageView.referer).order_by(func.count(PageView.id).desc(), PageView.referer).limit(10).all()
+    browsers = db.session.query(VisitorSession.browser, func.count(VisitorSession.id)).filter(
+        VisitorSession.first_visit >= start_date, VisitorSession.first_visit <= end_date
+    ).group_by(VisitorSession.browser).order_by(func.count(VisitorSession.id).desc(), VisitorSession.browser).limit(10).all()
+
+    return {
+        'pageViews': views,
+        'sessions': sessions,
+        'topPages': [(path, count) for path, _, count in top_pages],
+        'referrers': [tuple(row) for row in referrers],
+        'browsers': [tuple(row) for row in browsers]
+    }
+
+
+def single_pass(db, models, start_date, end_date, chunk_size):
+    """單次串流掃描：分段讀取區間內的瀏覽 (連同所屬會話)，同時累加所有統計"""
+    from sqlalchemy import select
+    PageView, VisitorSession = models.PageView, models.VisitorSession
+
+    stmt = select(
+        PageView.path, PageView.referer, PageView.session_id, VisitorSession.first_visit, VisitorSession.browser
+    ).outerjoin(
+        VisitorSession, VisitorSession.session_id == PageView.session_id
+    ).where(
+        PageView.visit_time >= start_date, PageView.visit_time <= end_date
+    ).execution_options(stream_results=True, yield_per=chunk_size)
+
+    views = 0
+    pages, sources, browsers = Counter(), Counter(), Counter()
+    seen_sessions = set()
+    result = db.session.execute(stmt)
+    try:
+        for chunk in result.partitions(chunk_size):
+            views += len(chunk)
+            for path, referer, session_id, first_visit, browser in chunk:
+                pages[path] += 1
+                if referer:
+                    sources[referer] += 1
+                # 會話只在區間內開始時計入 (與舊版依 first_visit 篩選相同)
+                if first_visit is not None and first_visit >= start_date and session_id not in seen_sessions:
+                    seen_sessions.add(session_id)
+                    browsers[browser] += 1
+    finally:
+        result.close()
+
+    def top(counter):
+        return sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:10]
+
+    return {
+        'pageViews': views,
+        'sessions': len(seen_sessions),
+        'topPages': top(pages),
+        'referrers': top(sources),
+        'browsers': top(browsers)
+    }
+
+
+def grouped_scan(db, models, start_date, end_date):
+    """單次分組掃描：每個表格一個最細粒度的 GROUP BY，總數與各維度排行在 Python 中合併"""
+    from sqlalchemy import func
+    PageView, VisitorSession = models.PageView, models.VisitorSession
+
+    views = 0
+    pages, sources = Counter(), Counter()
+    groups = db.session.query(PageView.path, PageView.referer, func.count(PageView.id)).filter(
+        PageView.visit_time >= start_date, PageView.visit_time <= end_date
+    ).group_by(PageView.path, PageView.referer)
+    for path, referer, count in groups:
+        views += count
+        pages[path] += count
+        if referer:
+            sources[referer] += count
+
+    browsers = Counter(dict(db.session.query(VisitorSession.browser, func.count(VisitorSession.id)).filter(
+        VisitorSession.first_visit >= start_date, VisitorSession.first_visit <= end_date
+    ).group_by(VisitorSession.browser).all()))
+
+    def top(counter):
+        return sorted(counter.items(), key=lambda item: (-item[1], item[0]))[:10]
+
+    return {
+        'pageViews': views,
+        'sessions': sum(browsers.values()),
+        'topPages': top(pages),
+        'referrers': top(sources),
+        'browsers': top(browsers)
+    }
+
+
+def rollup_separate(start_date, end_date, exact):
+    """彙總表：各統計分別查詢"""
+    from analytics_rollup import query_rollup_totals, query_rollup_top, query_time_on_site
+    result = {
+        'totals': query_rollup_totals(start_date, end_date),
+        'browsers': query_rollup_top('browser', start_date, end_date, metric='sessions'),
+        'countries': query_rollup_top('country', start_date, end_date, metric='sessions'),
+        'cities': query_rollup_top('city', start_date, end_date, metric='sessions'),
+        'timeOnSite': query_time_on_site(start_date, end_date)
+    }
+    if exact:
+        result['topPages'] = query_rollup_top('path', start_date, end_date, metric='views')
+        result['referrers'] = query_rollup_top('referrer', start_date, end_date, metric='views')
+    return result
+
+
+def rollup_combined(start_date, end_date, exact):
+    """彙總表：單一查詢讀取總數與低基數維度，頁面/來源排行仍由資料庫截取 (與統計端點相同)"""
+    from analytics_rollup import query_rollup_summary, query_rollup_top
+    summary = query_rollup_summary(start_date, end_date, ['total', 'browser', 'country', 'city', 'session_duration'])
+    result = {
+        'totals': summary.totals(),
+        'browsers': summary.top('browser', metric='sessions'),
+        'countries': summary.top('country', metric='sessions'),
+        'cities': summary.top('city', metric='sessions'),
+        'timeOnSite': summary.time_on_site()
+    }
+    if exact:
+        result['topPages'] = query_rollup_top('path', start_date, end_date, metric='views')
+        result['referrers'] = query_rollup_top('referrer', start_date, end_date, metric='views')
+    return result
+
+
+def timed(function, repeat):
+    """執行多次並回傳 (結果, 各次耗時毫秒)"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return result, durations
+
+
+def same_ranking(left, right):
+    """比較排行的項目與計數 (忽略同分時的順序)"""
+    return sorted((item[0], item[-1]) for item in left) == sorted((item[0], item[-1]) for item in right)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較統計端點的多查詢與單次掃描彙總')
+    parser.add_argument('--rows', default='100000,1000000', help='頁面瀏覽筆數 (以逗號分隔多個規模)')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--views-per-session', type=int, default=4)
+    parser.add_argument('--paths', type=int, default=2000, help='不同頁面數')
+    parser.add_argument('--referrers', type=int, default=300, help='不同來源數')
+    parser.add_argument('--exponent', type=float, default=1.1, help='Zipf 指數')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='單次掃描每段讀取筆數')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='結果輸出為 JSON 檔案')
+    args = parser.parse_args()
+
+    sizes = [int(value) for value in args.rows.split(',') if value]
+    workdir = tempfile.mkdtemp(prefix='bench-stats-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('UPLOAD_FOLDER', os.path.join(workdir, 'uploads'))
+
+    import models
+    from app_mysql import app
+    from analytics_rollup import backfill_rollups
+
+    db = models.db
+    results = {'parameters': vars(args), 'raw': [], 'rollup': None}
+    with app.app_context():
+        for index, rows in enumerate(sizes):
+            random.seed(args.seed)
+            db.drop_all()
+            db.create_all()
+            now = datetime.now().replace(microsecond=0)
+            print(f"[INIT] 產生 {rows:,} 筆頁面瀏覽 ({args.days} 天)...")
+            started = time.perf_counter()
+            populate(db, models, rows, args, now)
+            print(f"[OK] 資料產生完成 ({time.perf_counter() - started:.1f}s)")
+
+            end_date = now
+            start_date = now.replace(hour=0, minute=0, second=0) - timedelta(days=args.days - 1)
+            legacy, legacy_ms = timed(lambda: five_queries(db, models, start_date, end_date), args.repeat)
+            streamed, streamed_ms = timed(
+                lambda: single_pass(db, models, start_date, end_date, args.chunk_size), args.repeat
+            )
+            grouped, grouped_ms = timed(lambda: grouped_scan(db, models, start_date, end_date), args.repeat)
+            matches = all(
+                legacy[key] == other[key] if key in ('pageViews', 'sessions') else same_ranking(legacy[key], other[key])
+                for other in (streamed, grouped) for key in legacy
+            )
+            entry = {
+                'rows': rows,
+                'fiveQueriesMedianMs': round(statistics.median(legacy_ms), 2),
+                'streamedPassMedianMs': round(statistics.median(streamed_ms), 2),
+                'groupedScanMedianMs': round(statistics.median(grouped_ms), 2),
+                'resultsMatch': matches
+            }
+            results['raw'].append(entry)
+            print(
+                f"{rows:>10,} 筆: 五個查詢 {entry['fiveQueriesMedianMs']:10.2f} ms | "
+                f"串流掃描 {entry['streamedPassMedianMs']:10.2f} ms | "
+                f"分組掃描 {entry['groupedScanMedianMs']:10.2f} ms | 結果一致: {matches}"
+            )
+
+            # 彙總表的大小只與天數 × 維度值數量有關，以最小的資料量建立一次即可
+            if index == 0:
+                backfill_rollups(start_date.date(), end_date.date(), log=lambda message: None)
+                results['rollup'] = {}
+                for exact in (False, True):
+                    separate, separate_ms = timed(
+                        lambda: rollup_separate(start_date, end_date, exact), args.repeat * 5
+                    )
+                    summary, summary_ms = timed(
+                        lambda: rollup_combined(start_date, end_date, exact), args.repeat * 5
+                    )
+                    entry = {
+                        'separateQueriesMedianMs': round(statistics.median(separate_ms), 2),
+                        'combinedQueryMedianMs': round(statistics.median(summary_ms), 2),
+                        'resultsMatch': all(
+                            same_ranking(separate[key], summary[key]) if isinstance(separate[key], list)
+                            else separate[key] == summary[key]
+                            for key in separate
+                        )
+                    }
+                    results['rollup']['exact' if exact else 'default'] = entry
+                    print(
+                        f"{'彙總表' + (' exact' if exact else ''):>12}: 分別查詢 {entry['separateQueriesMedianMs']:10.2f} ms | "
+                        f"單一查詢 {entry['combinedQueryMedianMs']:10.2f} ms | 結果一致: {entry['resultsMatch']}"
+                    )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, ensure_ascii=False, indent=2)
+        print(f"[OK] 結果已寫入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+熱門頁面/來源查詢基準測試
+比較 Space-Saving 草圖合併與精確彙總表查詢的速度與準確度
+
+用法:
+    python benchmarks/bench_topk.py --days 365 --views-per-day 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def zipf_population(prefix, size, exponent):
+    """產生 Zipf 分佈的母體與累積權重"""
+    items = [f"{prefix}{index}" for index in range(size)]
+    weights = [1.0 / (rank + 1) ** exponent for rank in range(size)]
+    return items, list(accumulate(weights))
+
+
+def populate(db, models, args, capacity):
+    """寫入合成的每日彙總與草圖，回傳整段區間的精確計數"""
+    from space_saving import SpaceSaving
+
+    paths, path_weights = zipf_population('/page/', args.paths, args.exponent)
+    referrers, referrer_weights = zipf_population('https://ref.example/', args.referrers, args.exponent)
+    populations = {'path': (paths, path_weights), 'referrer': (referrers, referrer_weights)}
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    exact_totals = {'path': Counter(), 'referrer': Counter()}
+
+    for offset in range(args.days):
+        day_start = today - timedelta(days=offset)
+        rollup_rows = []
+        for dimension, (items, cum_weights) in populations.items():
+            day_counts = Counter()
+            sketch = SpaceSaving(capacity)
+            remaining = args.views_per_day
+            # 以寫入佇列的批次大小模擬實際累加方式
+            while remaining > 0:
+                batch = Counter(random.choices(items, cum_weights=cum_weights, k=min(args.batch_size, remaining)))
+                day_counts.update(batch)
+                sketch.add_counts(batch)
+                remaining -= args.batch_size
+
+            exact_totals[dimension].update(day_counts)
+            rollup_rows.extend(
+                {
+                    'granularity': 'day', 'bucket_start': day_start, 'dimension': dimension,
+                    'value': item, 'label': None, 'views': count, 'sessions': 0
+                }
+                for item, count in day_counts.items()
+            )
+            db.session.add(models.AnalyticsTopKSketch(
+                day=day_start.date(), dimension=dimension, payload=sketch.to_bytes()
+            ))
+
+        db.session.bulk_insert_mappings(models.AnalyticsRollup, rollup_rows)
+        db.session.commit()
+
+    return exact_totals
+
+
+def timed(function, repeat):
+    """執行多次並回傳 (結果, 各次耗時毫秒)"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return result, durations
+
+
+def accuracy(approx, exact_counter, limit):
+    """計算 top-K 召回率與計數相對誤差"""
+    truth = dict(exact_counter.most_common(limit))
+    found = [item for item, _, _ in approx]
+    recall = len(set(found) & set(truth)) / max(len(truth), 1)
+    errors = [
+        abs(count - exact_counter[item]) / exact_counter[item]
+        for item, _, count in approx if exact_counter[item]
+    ]
+    return recall, max(errors) if errors else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 Space-Saving 草圖與精確彙總的 top-K 查詢')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--views-per-day', type=int, default=20000)
+    parser.add_argument('--paths', type=int, default=5000, help='不同頁面數')
+    parser.add_argument('--referrers', type=int, default=500, help='不同來源數')
+    parser.add_argument('--exponent', type=float, default=1.1, help='Zipf 指數')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--capacity', type=int, default=100, help='草圖容量')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='結果輸出為 JSON 檔案')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix='bench-topk-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('UPLOAD_FOLDER', os.path.join(workdir, 'uploads'))
+
+    import models
+    from app_mysql import app
+    from analytics_rollup import query_rollup_top
+    from analytics_sketches import query_topk
+
+    with app.app_context():
+        print(f"[INIT] 產生 {args.days} 天 × {args.views_per_day} 筆瀏覽的合成資料...")
+        started = time.perf_counter()
+        exact_totals = populate(models.db, models, args, args.capacity)
+        print(f"[OK] 資料產生完成 ({time.perf_counter() - started:.1f}s)")
+
+        end_date = datetime.now()
+        start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.days - 1)
+
+        results = {'parameters': vars(args), 'dimensions': {}}
+        for dimension in ('path', 'referrer'):
+            exact, exact_ms = timed(
+                lambda: query_rollup_top(dimension, start_date, end_date, limit=args.limit), args.repeat
+            )
+            approx, sketch_ms = timed(
+                lambda: query_topk(dimension, start_date, end_date, limit=args.limit, capacity=args.capacity),
+                args.repeat
+            )
+            recall, max_error = accuracy(approx, exact_totals[dimension], args.limit)
+            rollup_recall, _ = accuracy(exact, exact_totals[dimension], args.limit)
+
+            results['dimensions'][dimension] = {
+                'exactMedianMs': round(statistics.median(exact_ms), 2),
+                'sketchMedianMs': round(statistics.median(sketch_ms), 2),
+                'sketchRecall': recall,
+                'sketchMaxRelativeError': round(max_error, 4),
+                'exactRecall': rollup_recall
+            }
+            print(
+                f"{dimension:>9}: 精確彙總 {statistics.median(exact_ms):8.2f} ms | "
+                f"草圖合併 {statistics.median(sketch_ms):8.2f} ms | "
+                f"召回率 {recall:.0%} | 最大相對誤差 {max_error:.2%}"
+            )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, ensure_ascii=False, indent=2)
+        print(f"[OK] 結果已寫入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
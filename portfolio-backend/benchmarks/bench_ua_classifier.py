@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UA 分類基準測試
+以接近實際流量的 UA 語料 (少數熱門 UA 佔大多數請求) 比較
+原本逐次 re.search 的解析方式、預編譯規則 (無快取) 與預編譯 + LRU 快取
+
+用法:
+    python benchmarks/bench_ua_classifier.py --requests 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from itertools import accumulate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from ua_classifier import UserAgentClassifier  # noqa: E402
+
+# (UA, 相對權重)
+CORPUS = [
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36", 40),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1", 22),
+    ("Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36", 15),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15", 10),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 Edg/124.0.2478.67", 8),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36", 8),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0", 5),
+    ("Mozilla/5.0 (iPad; CPU OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1", 3),
+    ("Mozilla/5.0 (Linux; Android 13; SM-X700) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36", 2),
+    ("Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/24.0 Chrome/117.0.0.0 Mobile Safari/537.36", 2),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36 OPR/109.0.0.0", 1),
+    ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36", 2),
+    ("Mozilla/5.0 (X11; CrOS x86_64 14541.0.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36", 1),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)", 3),
+    ("Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)", 1),
+    ("facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)", 1),
+    ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) HeadlessChrome/124.0.0.0 Safari/537.36", 1),
+    ("curl/8.4.0", 1),
+]
+
+
+def legacy_parse_user_agent(user_agent):
+    """原本 app_mysql.parse_user_agent 的實作 (逐次以字串樣式呼叫 re.search)"""
+    browser = "Unknown"
+    os_name = "Unknown"
+    device = "Desktop"
+
+    if not user_agent:
+        return browser, os_name, device
+
+    if re.search(r'Chrome', user_agent):
+        browser = "Chrome"
+    elif re.search(r'Firefox', user_agent):
+        browser = "Firefox"
+    elif re.search(r'Safari', user_agent) and not re.search(r'Chrome', user_agent):
+        browser = "Safari"
+    elif re.search(r'Edge', user_agent):
+        browser = "Edge"
+    elif re.search(r'Opera', user_agent):
+        browser = "Opera"
+
+    if re.search(r'Windows', user_agent):
+        os_name = "Windows"
+    elif re.search(r'Mac OS X', user_agent):
+        os_name = "macOS"
+    elif re.search(r'Linux', user_agent):
+        os_name = "Linux"
+    elif re.search(r'Android', user_agent):
+        os_name = "Android"
+        device = "Mobile"
+    elif re.search(r'iPhone|iPad', user_agent):
+        os_name = "iOS"
+        device = "Mobile"
+
+    if re.search(r'Mobile|Android|iPhone', user_agent):
+        device = "Mobile"
+    elif re.search(r'Tablet|iPad', user_agent):
+        device = "Tablet"
+
+    return browser, os_name, device
+
+
+def build_stream(size, unique_tail):
+    """依權重抽樣熱門 UA，並混入少量只出現一次的長尾 UA"""
+    agents = [agent for agent, _ in CORPUS]
+    cum_weights = list(accumulate(weight for _, weight in CORPUS))
+    stream = random.choices(agents, cum_weights=cum_weights, k=size)
+    for index in random.sample(range(size), min(unique_tail, size)):
+        stream[index] = f"{stream[index]} Build/{index}"
+    return stream
+
+
+def timed(function, stream, repeat):
+    """回傳每次完整跑完 stream 的每筆平均耗時 (微秒)"""
+    per_call = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for user_agent in stream:
+            function(user_agent)
+        per_call.append((time.perf_counter() - started) * 1e6 / len(stream))
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比較 UA 解析方式的速度')
+    parser.add_argument('--requests', type=int, default=200000, help='模擬的請求數')
+    parser.add_argument('--unique-tail', type=int, default=2000, help='只出現一次的 UA 數')
+    parser.add_argument('--cache-size', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='結果輸出為 JSON 檔案')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    stream = build_stream(args.requests, args.unique_tail)
+
+    uncached = UserAgentClassifier(cache_size=0)
+    cached = UserAgentClassifier(cache_size=args.cache_size)
+
+    variants = {
+        'legacy': legacy_parse_user_agent,
+        'compiled': uncached.classify,
+        'compiledCached': cached.classify,
+    }
+
+    results = {'parameters': vars(args), 'microsecondsPerCall': {}}
+    for name, function in variants.items():
+        cached.clear()
+        per_call = timed(function, stream, args.repeat)
+        results['microsecondsPerCall'][name] = round(statistics.median(per_call), 3)
+        print(f"{name:>15}: {statistics.median(per_call):7.3f} µs/次")
+
+    results['cache'] = cached.stats()
+    print(f"[INFO] 快取命中率 {cached.stats()['hitRate']:.1%} ({cached.stats()['size']} 筆)")
+
+    # 列出新舊分類結果不同的 UA
+    changes = []
+    for agent, _ in CORPUS:
+        before, after = legacy_parse_user_agent(agent), cached.classify(agent)
+        if before != after:
+            changes.append({'userAgent': agent, 'legacy': before, 'classifier': after})
+            print(f"[DIFF] {before} -> {after}: {agent[:80]}")
+    results['classificationChanges'] = changes
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            json.dump(results, handle, ensure_ascii=False, indent=2)
+        print(f"[OK] 結果已寫入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
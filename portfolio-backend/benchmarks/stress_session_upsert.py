@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+會話 upsert 並行壓力測試
+多個執行緒同時對同一個會話批次寫入頁面瀏覽，最後確認
+visitor_sessions.total_page_views 與實際寫入的 page_views 筆數一致 (沒有遺失更新)
+
+用法:
+    python benchmarks/stress_session_upsert.py --threads 16 --batches 50
+    python benchmarks/stress_session_upsert.py --current   # 使用目前配置的資料庫 (例如 MySQL)
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多執行緒同時寫入同一會話，檢查瀏覽數是否一致')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--batches', type=int, default=50, help='每個執行緒寫入的批次數')
+    parser.add_argument('--batch-size', type=int, default=5, help='每批的瀏覽數')
+    parser.add_argument('--retries', type=int, default=20, help='資料庫鎖定時的重試次數')
+    parser.add_argument('--current', action='store_true', help='使用目前配置的資料庫')
+    args = parser.parse_args()
+
+    if not args.current:
+        workdir = tempfile.mkdtemp(prefix='stress-session-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'stress.db')}"
+        os.environ.setdefault('UPLOAD_FOLDER', os.path.join(workdir, 'uploads'))
+
+    from datetime import datetime
+
+    from sqlalchemy.exc import OperationalError
+
+    from analytics_ingest import write_page_views
+    from app_mysql import app
+    from models import db, PageView, VisitorSession
+    from ua_classifier import parse_user_agent
+
+    session_id = f"stress-{uuid.uuid4().hex[:16]}"
+    user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
+    start = threading.Barrier(args.threads)
+    errors = []
+    retried = [0]
+
+    def worker(index):
+        with app.app_context():
+            start.wait()
+            for batch in range(args.batches):
+                events = [
+                    {
+                        'id': str(uuid.uuid4()),
+                        'path': f'/stress/{index}',
+                        'title': '',
+                        'ip_address': '127.0.0.1',
+                        'user_agent': user_agent,
+                        'referer': '',
+                        'session_id': session_id,
+                        'visit_time': datetime.now()
+                    }
+                    for _ in range(args.batch_size)
+                ]
+                # SQLite 同時只允許一個寫入者，鎖定逾時時重試整個批次
+                for attempt in range(args.retries + 1):
+                    try:
+                        write_page_views(events, parse_user_agent)
+                        break
+                    except OperationalError as e:
+                        db.session.rollback()
+                        if attempt == args.retries:
+                            errors.append(f"執行緒 {index} 批次 {batch}: {e}")
+                        else:
+                            retried[0] += 1
+                            time.sleep(0.01 * (attempt + 1))
+                    except Exception as e:
+                        db.session.rollback()
+                        errors.append(f"執行緒 {index} 批次 {batch}: {e}")
+                        break
+            db.session.remove()
+
+    print(f"[INIT] {args.threads} 個執行緒 × {args.batches} 批 × {args.batch_size} 筆瀏覽，會話 {session_id}")
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        session = VisitorSession.query.filter_by(session_id=session_id).first()
+        stored_views = PageView.query.filter_by(session_id=session_id).count()
+        session_count = VisitorSession.query.filter_by(session_id=session_id).count()
+
+    for error in errors[:10]:
+        print(f"[ERROR] {error}")
+
+    expected = args.threads * args.batches * args.batch_size
+    total = session.total_page_views if session else 0
+    print(f"[INFO] 耗時 {elapsed:.2f}s，重試 {retried[0]} 次，失敗 {len(errors)} 批")
+    print(f"[INFO] 寫入瀏覽 {stored_views} 筆 (預期 {expected})，會話 total_page_views = {total}，會話列數 {session_count}")
+
+    if session_count == 1 and total == stored_views and not errors:
+        print("[OK] 會話瀏覽數與實際寫入筆數一致")
+        return 0
+    print("[ERROR] 會話瀏覽數不一致")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流量分析查詢計畫檢查
+實際執行各個流量分析端點與批次寫入，擷取其中的 SELECT，
+再以 EXPLAIN 確認每個查詢都有使用索引 (沒有全表掃描)。
+
+用法:
+    python check_analytics_query_plans.py           # 使用暫存 SQLite 資料庫
+    python check_analytics_query_plans.py --current # 使用目前配置的資料庫 (例如 MySQL)
+"""
+
+import os
+import re
+import sys
+import tempfile
+
+# 需要避免全表掃描的流量分析表
+ANALYTICS_TABLES = {
+    'page_views',
+    'visitor_sessions',
+    'analytics_rollups',
+    'analytics_visitor_sketches',
+    'analytics_topk_sketches',
+    'analytics_user_agents',
+    'analytics_referrers',
+}
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+def capture_analytics_queries(app):
+    """執行流量分析流程並擷取 SELECT 查詢"""
+    from datetime import datetime
+    from sqlalchemy import event
+
+    from analytics_ingest import ingest_queue
+    from analytics_rollup import backfill_rollups
+    from models import db
+
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            captured.append((statement, parameters))
+
+    client = app.test_client()
+    with app.app_context():
+        # 先寫入一些事件，確保各表都有資料
+        for index in range(50):
+            client.post('/api/v1/analytics/track', json={
+                'path': f'/check/{index % 5}',
+                'title': f'Check {index % 5}',
+                'sessionId': f'plan-check-{index % 7}'
+            }, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0) Chrome/120.0', 'Referer': 'https://example.com/'})
+        ingest_queue.flush()
+
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            for index in range(5):
+                client.post('/api/v1/analytics/track', json={
+                    'path': f'/check/{index}', 'sessionId': f'plan-check-{index}',
+                    'pageViewId': f'plan-check-view-{index}'
+                })
+            ingest_queue.flush()
+
+            client.post('/api/v1/analytics/heartbeat', json={'heartbeats': [
+                {'pageViewId': f'plan-check-view-{index}', 'duration': 30 + index} for index in range(5)
+            ]})
+            ingest_queue.flush()
+
+            client.get('/api/v1/analytics/stats?days=30')
+            client.get('/api/v1/analytics/stats?days=365&exact=1')
+            client.get('/api/v1/analytics/recent?limit=20')
+            client.get('/api/v1/analytics/timeseries?granularity=day&days=90')
+            client.get('/api/v1/analytics/timeseries?granularity=hour&days=7&metric=sessions&path=/check/0')
+            client.get('/api/v1/analytics/export?days=30&limit=5').get_data()
+            client.get('/api/v1/analytics/export?type=sessions&format=csv&days=30&limit=5').get_data()
+
+            today = datetime.now().date()
+            backfill_rollups(today, today, log=lambda message: None)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return captured
+
+
+def explain(connection, dialect, statement, parameters):
+    """回傳 (計畫說明列表, 全表掃描的表格列表)"""
+    cursor = connection.cursor()
+    try:
+        if dialect == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            details = [row[3] for row in cursor.fetchall()]
+            scans = []
+            for detail in details:
+                match = SQLITE_FULL_SCAN.match(detail)
+                if match and match.group(1) in ANALYTICS_TABLES:
+                    scans.append(match.group(1))
+            return details, scans
+
+        if dialect == 'mysql':
+            cursor.execute('EXPLAIN ' + statement, parameters)
+            columns = [column[0] for column in cursor.description]
+            details, scans = [], []
+            for values in cursor.fetchall():
+                row = dict(zip(columns, values))
+                details.append(f"{row.get('table')}: type={row.get('type')} key={row.get('key')} rows={row.get('rows')}")
+                if row.get('table') in ANALYTICS_TABLES and (row.get('type') == 'ALL' or row.get('key') is None):
+                    if row.get('type') not in ('const', 'system'):
+                        scans.append(row.get('table'))
+            return details, scans
+
+        raise NotImplementedError(f"不支援的資料庫類型: {dialect}")
+    finally:
+        cursor.close()
+
+
+def check_query_plans(app):
+    """檢查所有擷取到的查詢，回傳是否全部通過"""
+    from models import db
+
+    queries = capture_analytics_queries(app)
+    relevant = [
+        (statement, parameters) for statement, parameters in queries
+        if any(table in statement for table in ANALYTICS_TABLES)
+    ]
+
+    failures = 0
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        connection = db.engine.raw_connection()
+        try:
+            seen = set()
+            for statement, parameters in relevant:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+
+                details, scans = explain(connection, dialect, statement, parameters)
+                summary = ' '.join(statement.split())[:120]
+                if scans:
+                    failures += 1
+                    print(f"[FAIL] {summary}")
+                    print(f"       全表掃描: {', '.join(scans)}")
+                else:
+                    print(f"[OK]   {summary}")
+                for detail in details:
+                    print(f"       {detail}")
+        finally:
+            connection.close()
+
+    print(f"\n共檢查 {len(seen)} 個查詢，{failures} 個未使用索引")
+    return failures == 0
+
+
+if __name__ == '__main__':
+    if '--current' not in sys.argv:
+        workdir = tempfile.mkdtemp(prefix='query-plans-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+        os.environ.setdefault('UPLOAD_FOLDER', os.path.join(workdir, 'uploads'))
+
+    from app_mysql import app
+
+    sys.exit(0 if check_query_plans(app) else 1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+原始資料保留策略中斷檢查
+在暫存 SQLite 資料庫寫入超過保留期限的頁面瀏覽並彙總，模擬保留策略在刪除第一批後中斷，
+再重新執行，確認彙總總數不變、剩餘原始資料被刪除，且不會重新封存殘留的部分資料。
+
+用法:
+    python check_analytics_retention.py
+"""
+
+import gzip
+import os
+import sys
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta
+
+VIEWS = 10
+BATCH_SIZE = 4
+RETENTION_DAYS = 30
+
+
+class Interrupted(Exception):
+    pass
+
+
+def seed_day(day):
+    """寫入某日的頁面瀏覽並彙總"""
+    from analytics_rollup import backfill_rollups
+    from models import db, PageView
+
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=10)
+    db.session.add_all(
+        PageView(
+            id=str(uuid.uuid4()), path=f'/retention/{index % 3}', title='Retention',
+            session_id=f'retention-{index}', visit_time=start + timedelta(minutes=index)
+        )
+        for index in range(VIEWS)
+    )
+    db.session.commit()
+    backfill_rollups(day, day, log=lambda message: None)
+
+
+def rollup_total(day):
+    from analytics_rollup import query_rollup_totals
+    day_start = datetime.combine(day, datetime.min.time())
+    return query_rollup_totals(day_start, day_start)[0]
+
+
+def raw_count(day):
+    from models import PageView
+    day_start = datetime.combine(day, datetime.min.time())
+    return PageView.query.filter(
+        PageView.visit_time >= day_start, PageView.visit_time < day_start + timedelta(days=1)
+    ).count()
+
+
+def check_retention(app, archive_folder):
+    """回傳是否全部通過"""
+    import analytics_retention
+    from analytics_retention import compact_day, run_retention
+    from models import db, PageView
+
+    day = date.today() - timedelta(days=RETENTION_DAYS + 5)
+    other_day = day + timedelta(days=1)
+    failures = []
+
+    def expect(condition, message):
+        print(f"[{'OK' if condition else 'FAIL'}]   {message}")
+        if not condition:
+            failures.append(message)
+
+    quiet = lambda message: None  # noqa: E731
+
+    with app.app_context():
+        db.create_all()
+        seed_day(day)
+        seed_day(other_day)
+        expect(rollup_total(day) == VIEWS, f"彙總 {rollup_total(day)} 筆 (預期 {VIEWS})")
+
+        # 部分原始資料已刪除 (但沒有封存記錄) 時，compact_day 不可以殘留資料重建彙總
+        ids = [row.id for row in db.session.query(PageView.id).filter(PageView.session_id == 'retention-0')]
+        kept = PageView.query.filter(PageView.id.in_(ids)).all()
+        for row in kept:
+            db.session.expunge(row)
+        PageView.query.filter(PageView.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        compact_day(day, log=quiet)
+        expect(rollup_total(day) == VIEWS, f"原始資料較少時 compact_day 保留彙總 {rollup_total(day)} 筆")
+        for row in kept:
+            db.session.merge(row)
+        db.session.commit()
+
+        # 第一批刪除提交後中斷
+        original_delete_day = analytics_retention.delete_day
+
+        def interrupted_delete_day(target_day, batch_size=1000, pause=0.0):
+            day_start = datetime.combine(target_day, datetime.min.time())
+            ids = [
+                row.id for row in db.session.query(PageView.id).filter(
+                    PageView.visit_time >= day_start,
+                    PageView.visit_time < day_start + timedelta(days=1)
+                ).limit(batch_size)
+            ]
+            PageView.query.filter(PageView.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            raise Interrupted()
+
+        analytics_retention.delete_day = interrupted_delete_day
+        try:
+            run_retention(RETENTION_DAYS, archive_folder, batch_size=BATCH_SIZE, log=quiet)
+            expect(False, "模擬的中斷沒有發生")
+        except Interrupted:
+            pass
+        finally:
+            analytics_retention.delete_day = original_delete_day
+        db.session.rollback()
+        expect(raw_count(day) == VIEWS - BATCH_SIZE, f"中斷後剩餘 {raw_count(day)} 筆原始資料")
+
+        summary = run_retention(RETENTION_DAYS, archive_folder, batch_size=BATCH_SIZE, log=quiet)
+        expect(rollup_total(day) == VIEWS, f"重新執行後彙總 {rollup_total(day)} 筆 (預期 {VIEWS})")
+        expect(rollup_total(other_day) == VIEWS, f"其他日期彙總 {rollup_total(other_day)} 筆 (預期 {VIEWS})")
+        expect(raw_count(day) == 0 and raw_count(other_day) == 0, "原始資料已全部刪除")
+        expect(summary['archived'] == VIEWS, f"重新執行只封存尚未處理的日期 ({summary['archived']} 筆)")
+
+        archives = []
+        for root, _, files in os.walk(archive_folder):
+            archives.extend(os.path.join(root, name) for name in files if day.isoformat() in name)
+        lines = sum(1 for path in archives for _ in gzip.open(path, 'rt', encoding='utf-8'))
+        expect(len(archives) == 1 and lines == VIEWS, f"{day.isoformat()} 有 {len(archives)} 個封存檔，共 {lines} 筆")
+
+    print(f"\n共 {len(failures)} 項檢查失敗")
+    return not failures
+
+
+if __name__ == '__main__':
+    workdir = tempfile.mkdtemp(prefix='retention-check-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'retention.db')}"
+    os.environ.setdefault('UPLOAD_FOLDER', os.path.join(workdir, 'uploads'))
+
+    from app_mysql import app
+
+    sys.exit(0 if check_retention(app, os.path.join(workdir, 'archive')) else 1)
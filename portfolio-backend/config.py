@@ -36,6 +36,48 @@ class Config:
     # 文件上傳配置 - 動態路徑，支援本地和雲端部署
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(os.path.dirname(__file__), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB 最大文件大小
+
+    # 列表端點分頁配置
+    API_DEFAULT_PAGE_SIZE = int(os.environ.get('API_DEFAULT_PAGE_SIZE', 100))  # 未指定 limit 時每頁筆數
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 500))  # 每頁筆數上限
+
+    # 公開內容 GET 回應快取 (以表格版本號為鍵，內容寫入後立即清除)
+    CONTENT_CACHE_TTL = int(os.environ.get('CONTENT_CACHE_TTL', 3600))  # 快取秒數
+    CONTENT_CACHE_MAX_ENTRIES = int(os.environ.get('CONTENT_CACHE_MAX_ENTRIES', 512))  # 快取筆數上限
+    CONTENT_CACHE_MAX_BYTES = int(os.environ.get('CONTENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))  # 快取大小上限
+    CONTENT_SNAPSHOT_ENABLED = os.environ.get('CONTENT_SNAPSHOT_ENABLED', 'true').lower() == 'true'  # 公開讀取改由記憶體快照提供
+    CONTENT_SNAPSHOT_POLL_INTERVAL = float(os.environ.get('CONTENT_SNAPSHOT_POLL_INTERVAL', 5.0))  # 檢查其他 worker 寫入的間隔(秒)，0 表示不檢查
+    CONTENT_SNAPSHOT_RETRY_INTERVAL = float(os.environ.get('CONTENT_SNAPSHOT_RETRY_INTERVAL', 30.0))  # 載入失敗後暫停由請求重試的秒數 (期間改查資料庫)
+
+    # 流量分析寫入佇列配置
+    ANALYTICS_QUEUE_MAXSIZE = int(os.environ.get('ANALYTICS_QUEUE_MAXSIZE', 10000))  # 佇列上限，超過即丟棄
+    ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', 500))  # 每批寫入筆數
+    ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 1.0))  # 寫入間隔(秒)
+    ANALYTICS_SAMPLING_ENABLED = os.environ.get('ANALYTICS_SAMPLING_ENABLED', 'true').lower() == 'true'  # 負載過高時自動取樣
+    ANALYTICS_SAMPLING_MAX_LATENCY = float(os.environ.get('ANALYTICS_SAMPLING_MAX_LATENCY', 0.5))  # 每批寫入耗時門檻(秒)
+    ANALYTICS_SAMPLING_MAX_DEPTH = float(os.environ.get('ANALYTICS_SAMPLING_MAX_DEPTH', 0.5))  # 佇列深度門檻 (佔容量比例)
+    ANALYTICS_SAMPLING_MAX_FACTOR = int(os.environ.get('ANALYTICS_SAMPLING_MAX_FACTOR', 64))  # 最低保留比例為 1/N (2 的次方)
+    ANALYTICS_SAMPLING_RECOVERY = float(os.environ.get('ANALYTICS_SAMPLING_RECOVERY', 10.0))  # 負載恢復後每隔幾秒提高一級保留比例
+    ANALYTICS_MAX_BATCH_EVENTS = int(os.environ.get('ANALYTICS_MAX_BATCH_EVENTS', 100))  # 批次端點單次事件上限
+    ANALYTICS_MAX_VIEW_DURATION = int(os.environ.get('ANALYTICS_MAX_VIEW_DURATION', 4 * 3600))  # 單次頁面停留時間上限(秒)
+    ANALYTICS_UNIQUE_KEY = os.environ.get('ANALYTICS_UNIQUE_KEY', 'session')  # 唯一訪客依據：session / ip
+    ANALYTICS_TOPK_CAPACITY = int(os.environ.get('ANALYTICS_TOPK_CAPACITY', 100))  # 每日熱門項目草圖容量
+    ANALYTICS_TOPK_EXACT = os.environ.get('ANALYTICS_TOPK_EXACT', 'false').lower() == 'true'  # 熱門排行改用精確彙總
+    ANALYTICS_RAW_RETENTION_DAYS = int(os.environ.get('ANALYTICS_RAW_RETENTION_DAYS', 180))  # 原始瀏覽記錄保留天數
+    ANALYTICS_ARCHIVE_FOLDER = os.environ.get('ANALYTICS_ARCHIVE_FOLDER') or os.path.join(os.path.dirname(__file__), 'archive')  # 封存檔目錄
+    ANALYTICS_RETENTION_BATCH_SIZE = int(os.environ.get('ANALYTICS_RETENTION_BATCH_SIZE', 1000))  # 每批刪除筆數
+    ANALYTICS_SNAPSHOT_FOLDER = os.environ.get('ANALYTICS_SNAPSHOT_FOLDER') or os.path.join(os.path.dirname(__file__), 'snapshots')  # 欄式快照目錄
+    ANALYTICS_EXPORT_CHUNK_SIZE = int(os.environ.get('ANALYTICS_EXPORT_CHUNK_SIZE', 1000))  # 匯出時每次自資料庫讀取筆數
+    ANALYTICS_TIMESERIES_MAX_POINTS = int(os.environ.get('ANALYTICS_TIMESERIES_MAX_POINTS', 2000))  # 時間序列端點的資料點上限
+    ANALYTICS_STATS_CACHE_TTL = int(os.environ.get('ANALYTICS_STATS_CACHE_TTL', 30))  # 包含今天的統計結果快取秒數
+    ANALYTICS_STATS_CACHE_CLOSED_TTL = int(os.environ.get('ANALYTICS_STATS_CACHE_CLOSED_TTL', 24 * 3600))  # 已結束區間的統計結果快取秒數
+    ANALYTICS_STATS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_STATS_CACHE_MAX_ENTRIES', 256))  # 統計結果快取筆數上限
+    ANALYTICS_STATS_CACHE_MAX_BYTES = int(os.environ.get('ANALYTICS_STATS_CACHE_MAX_BYTES', 4 * 1024 * 1024))  # 統計結果快取大小上限
+    GEOIP_FOLDER = os.environ.get('GEOIP_FOLDER') or os.path.join(os.path.dirname(__file__), 'geoip')  # IP 地理資料庫目錄
+    GEOIP_CACHE_SIZE = int(os.environ.get('GEOIP_CACHE_SIZE', 65536))  # IP 地理查詢快取前綴數
+    ANALYTICS_LIVE_BUFFER = int(os.environ.get('ANALYTICS_LIVE_BUFFER', 32))  # 即時推送每個連線的緩衝訊息數
+    ANALYTICS_LIVE_MAX_SUBSCRIBERS = int(os.environ.get('ANALYTICS_LIVE_MAX_SUBSCRIBERS', 20))  # 每個行程的即時連線上限
+    ANALYTICS_LIVE_ACTIVE_WINDOW = int(os.environ.get('ANALYTICS_LIVE_ACTIVE_WINDOW', 300))  # 在線訪客的活動時間窗口(秒)
     
     # CORS 配置 - 包含本地和線上域名
     CORS_ORIGINS = [
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+公開內容的記憶體快照
+作品集內容 (個人資料、競賽、專案、技能、新聞、專利、媒體報導、About 翻卡) 只有數 KB 到數 MB，
+啟動時整份載入為不可變的快照，公開 GET 端點 (含分頁與 ETag) 直接由快照回應，不查詢資料庫。
+
+內容寫入提交後只重建有變動的表格，其餘表格沿用舊快照的物件 (copy-on-write)，
+完成後以單一參照替換整份快照；讀取端在請求開始時取得快照參照，不會看到只更新一半的內容。
+其他 worker 的寫入由背景執行緒定期比對 content_versions 的版本號後重建。
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from types import MappingProxyType
+
+from flask import g, has_request_context
+from sqlalchemy.orm import Session
+
+from content_versions import on_content_commit
+from models import db, ContentVersion, User, Competition, Project, Skill, News, Patent, MediaCoverage, AboutValue
+from pagination import decode_cursor, encode_cursor
+
+# 表格的排序欄位 (最後一欄必須唯一) 與篩選條件，與列表端點的查詢相同
+TableSpec = namedtuple('TableSpec', 'model columns descending filters')
+
+TABLES = OrderedDict([
+    ('users', TableSpec(User, ('id',), False, {})),
+    ('competitions', TableSpec(Competition, ('created_at', 'id'), True, {})),
+    ('projects', TableSpec(Project, ('created_at', 'id'), True, {})),
+    ('skills', TableSpec(Skill, ('category', 'name', 'id'), False, {})),
+    ('news', TableSpec(News, ('created_at', 'id'), True, {})),
+    ('patents', TableSpec(Patent, ('created_at', 'id'), True, {})),
+    ('media_coverage', TableSpec(MediaCoverage, ('created_at', 'id'), True, {})),
+    ('about_values', TableSpec(AboutValue, ('order_index', 'id'), False, {'is_active': True})),
+])
+
+
+def _comparable(values):
+    """排序鍵 -> 可比較的 tuple (NULL 排在最前面)"""
+    return tuple((0,) if value is None else (1, value) for value in values)
+
+
+class SnapshotTable:
+    """單一表格的唯讀內容 (依列表端點的順序排列)"""
+
+    __slots__ = ('spec', 'items', 'by_id', '_keys', '_ascending_keys')
+
+    def __init__(self, spec, rows):
+        # 排序在記憶體中進行，分頁游標與這裡的順序一致 (字串比較不受資料庫定序影響)
+        keyed = sorted(
+            ((tuple(getattr(row, column) for column in spec.columns), row) for row in rows),
+            key=lambda pair: _comparable(pair[0])
+        )
+        if spec.descending:
+            keyed.reverse()
+        self.spec = spec
+        self.items = tuple(row.to_dict() for _, row in keyed)
+        self.by_id = MappingProxyType({str(row.id): item for (_, row), item in zip(keyed, self.items)})
+        self._keys = tuple(key for key, _ in keyed)
+        comparable = [_comparable(key) for key in self._keys]
+        self._ascending_keys = tuple(reversed(comparable)) if spec.descending else tuple(comparable)
+
+    def first(self):
+        return self.items[0] if self.items else None
+
+    def page(self, cursor, limit):
+        """依 keyset 游標取出一頁，回傳 (items, next_cursor)；游標錯誤時拋出 ValueError"""
+        start = 0
+        if cursor:
+            values = decode_cursor(cursor, size=len(self.spec.columns))
+            try:
+                key = _comparable(values)
+                if self.spec.descending:
+                    start = len(self.items) - bisect_left(self._ascending_keys, key)
+                else:
+                    start = bisect_right(self._ascending_keys, key)
+            except TypeError as e:
+                raise ValueError("無效的游標") from e
+
+        end = start + limit
+        next_cursor = encode_cursor(list(self._keys[end - 1])) if end < len(self.items) else None
+        return list(self.items[start:end]), next_cursor
+
+
+class ContentSnapshot:
+    """不可變的內容快照：各表格的唯讀內容與建立時的版本號"""
+
+    __slots__ = ('tables', 'versions', 'built_at')
+
+    def __init__(self, tables, versions):
+        self.tables = MappingProxyType(dict(tables))
+        self.versions = MappingProxyType(dict(versions))
+        self.built_at = datetime.now()
+
+    def table(self, name):
+        return self.tables[name]
+
+
+class ContentStore:
+    """持有目前的快照，寫入後重建並替換"""
+
+    def __init__(self):
+        self.enabled = True
+        self.poll_interval = 5.0
+        self.retry_interval = 30.0
+        self._app = None
+        self._snapshot = None
+        self._lock = threading.Lock()  # 同一時間只有一個執行緒重建
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._failed_at = None  # 最近一次載入失敗的時間 (monotonic)
+
+        # 統計計數
+        self.builds = 0
+        self.tables_rebuilt = 0
+        self.last_build_seconds = None
+        self.last_error = None
+
+    def init_app(self, app):
+        """綁定 Flask 應用並讀取配置"""
+        self._app = app
+        self.enabled = app.config.get('CONTENT_SNAPSHOT_ENABLED', True)
+        self.poll_interval = app.config.get('CONTENT_SNAPSHOT_POLL_INTERVAL', 5.0)
+        self.retry_interval = app.config.get('CONTENT_SNAPSHOT_RETRY_INTERVAL', 30.0)
+        app.extensions['content_store'] = self
+
+    def current(self):
+        """目前請求使用的快照 (同一請求內固定為同一份)，停用或尚未載入時回傳 None"""
+        if not self.enabled:
+            return None
+        if has_request_context():
+            snapshot = g.get('content_snapshot')
+            if snapshot is None:
+                snapshot = g.content_snapshot = self._current()
+            return snapshot
+        return self._current()
+
+    def _current(self):
+        self._ensure_poller()
+        snapshot = self._snapshot
+        if snapshot is None and self._retry_due():
+            snapshot = self._load()
+        return snapshot
+
+    def _retry_due(self):
+        return self._failed_at is None or time.monotonic() - self._failed_at >= self.retry_interval
+
+    def _load(self):
+        """第一次載入快照；其他執行緒正在載入時不等待，回傳 None 讓請求改查資料庫"""
+        if self._app is None or not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self._snapshot is None and self._retry_due():
+                self._rebuild()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def refresh(self, tables=None):
+        """重建版本號有變動 (或指定) 的表格並替換快照，回傳新的快照；失敗時保留舊快照"""
+        if not self.enabled or self._app is None:
+            return None
+        with self._lock:
+            return self._rebuild(tables)
+
+    def _rebuild(self, tables=None):
+        """在持有 _lock 時重建快照"""
+        previous = self._snapshot
+        started = time.perf_counter()
+        try:
+            with self._app.app_context(), Session(db.engine) as session:
+                # 版本號與資料在同一個交易內讀取，快照的版本號與內容一致
+                versions = dict(session.query(ContentVersion.table_name, ContentVersion.version).filter(
+                    ContentVersion.table_name.in_(list(TABLES))
+                ).all())
+                versions = {name: versions.get(name, 0) for name in TABLES}
+                rebuilt = {}
+                for name, spec in TABLES.items():
+                    unchanged = (
+                        previous is not None
+                        and previous.versions.get(name) == versions[name]
+                        and (tables is None or name not in tables)
+                    )
+                    if not unchanged:
+                        rows = session.query(spec.model).filter_by(**spec.filters).all()
+                        rebuilt[name] = SnapshotTable(spec, rows)
+                session.rollback()
+        except Exception as e:
+            # 失敗後 retry_interval 秒內不再由請求觸發載入 (公開端點改查資料庫)，輪詢執行緒仍會重試
+            self._failed_at = time.monotonic()
+            self.last_error = str(e)
+            print(f"[ERROR] 內容快照載入失敗: {e}")
+            return previous
+
+        if not rebuilt and previous is not None:
+            return previous
+        merged = {name: rebuilt[name] if name in rebuilt else previous.tables[name] for name in TABLES}
+        self._snapshot = ContentSnapshot(merged, versions)
+        self.builds += 1
+        self.tables_rebuilt += len(rebuilt)
+        self.last_build_seconds = round(time.perf_counter() - started, 4)
+        self._failed_at = None
+        self.last_error = None
+        return self._snapshot
+
+    def _ensure_poller(self):
+        """延遲啟動版本號輪詢執行緒 (fork 後的 worker 需要重新啟動)"""
+        if not self.poll_interval or self.poll_interval <= 0:
+            return
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._poll, name='content-snapshot', daemon=True)
+            self._thread.start()
+
+    def _poll(self):
+        """定期比對版本號，其他 worker 寫入後重建快照"""
+        while not self._stop.wait(self.poll_interval):
+            snapshot = self._snapshot
+            try:
+                with self._app.app_context(), Session(db.engine) as session:
+                    versions = dict(session.query(ContentVersion.table_name, ContentVersion.version).all())
+            except Exception as e:
+                self.last_error = str(e)
+                continue
+            if snapshot is None or any(versions.get(name, 0) != snapshot.versions[name] for name in TABLES):
+                self.refresh()
+
+    def shutdown(self):
+        """停止輪詢執行緒"""
+        self._stop.set()
+
+    def stats(self):
+        """快照狀態"""
+        snapshot = self._snapshot
+        return {
+            'enabled': self.enabled,
+            'loaded': snapshot is not None,
+            'builtAt': snapshot.built_at.isoformat() if snapshot else None,
+            'versions': dict(snapshot.versions) if snapshot else None,
+            'items': {name: len(table.items) for name, table in snapshot.tables.items()} if snapshot else None,
+            'builds': self.builds,
+            'tablesRebuilt': self.tables_rebuilt,
+            'lastBuildSeconds': self.last_build_seconds,
+            'pollInterval': self.poll_interval,
+            'retryInterval': self.retry_interval,
+            'lastError': self.last_error
+        }
+
+
+content_store = ContentStore()
+
+
+@on_content_commit
+def _refresh_after_commit(tables):
+    """本行程的內容寫入提交後立即重建 (寫入者之後的讀取一定看得到自己的變更)"""
+    if content_store._snapshot is not None and not tables.isdisjoint(TABLES):
+        content_store.refresh(tables)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+內容表格版本號與條件式 GET
+內容表格 (個人資料、競賽、專案...) 有新增/修改/刪除時，在同一個交易內遞增 content_versions 中該表格的版本號。
+GET 端點以相關表格的版本號與請求網址產生強 ETag，If-None-Match 相符時直接回傳 304，
+不讀取資料列也不執行 to_dict。交易提交後以 on_content_commit 註冊的函式通知哪些表格有寫入。
+其他跨行程共用的快取版本 (例如已結束日期的流量統計) 也存放在同一張表，由 bump_versions 遞增。
+"""
+
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import Response, make_response, request
+from sqlalchemy import event, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import (
+    db, ContentVersion, User, Competition, Project, Skill, News, Patent, MediaCoverage, AboutValue, UploadedFile
+)
+
+# 需要追蹤版本的內容模型
+CONTENT_MODELS = (User, Competition, Project, Skill, News, Patent, MediaCoverage, AboutValue, UploadedFile)
+CONTENT_TABLES = tuple(model.__tablename__ for model in CONTENT_MODELS)
+
+# 304 與帶 ETag 的回應：瀏覽器可快取，但每次使用前都要向伺服器確認
+CACHE_CONTROL = 'no-cache'
+
+
+def init_content_versions():
+    """建立缺少的版本列 (啟動時呼叫，之後的遞增只需要 UPDATE)"""
+    existing = {row[0] for row in db.session.query(ContentVersion.table_name).all()}
+    missing = [name for name in CONTENT_TABLES if name not in existing]
+    if missing:
+        db.session.add_all(ContentVersion(table_name=name, version=0) for name in missing)
+        db.session.commit()
+
+
+def read_versions(tables):
+    """回傳 {表格: 版本號}，沒有版本列的表格視為 0"""
+    rows = db.session.query(ContentVersion.table_name, ContentVersion.version).filter(
+        ContentVersion.table_name.in_(tables)
+    ).all()
+    versions = dict.fromkeys(tables, 0)
+    versions.update(rows)
+    return versions
+
+
+def make_etag(versions, variant):
+    """由版本號與請求網址 (路徑 + 查詢參數) 產生 ETag 值"""
+    key = variant + '|' + ','.join(f"{name}={versions[name]}" for name in sorted(versions))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def current_etag(tables):
+    """目前請求的 ETag 值，無法讀取版本號時回傳 None
+
+    版本號在讀取資料前取得：期間若有寫入，回應內容只會比 ETag 新，下次請求仍會取得完整內容。
+    """
+    try:
+        return make_etag(read_versions(tables), request.full_path)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"[WARN] 讀取內容版本號失敗，略過 ETag: {e}")
+        return None
+
+
+def not_modified(etag):
+    """If-None-Match 相符時回傳 304 回應，否則回傳 None"""
+    if etag is None or not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def tag_response(response, etag):
+    """為 200 回應加上 ETag 與 Cache-Control"""
+    if etag is not None and response.status_code == 200:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def conditional_get(*models):
+    """依指定模型的表格版本號處理 If-None-Match 的裝飾器"""
+    tables = tuple(model.__tablename__ for model in models)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = current_etag(tables)
+            response = not_modified(etag)
+            if response is None:
+                response = tag_response(make_response(view(*args, **kwargs)), etag)
+            return response
+        return wrapper
+    return decorator
+
+
+# 內容表格寫入並提交後呼叫的函式 (參數為有寫入的表格名稱集合)
+_commit_hooks = []
+
+
+def on_content_commit(hook):
+    """註冊內容寫入提交後的處理函式 (例如清除回應快取)，可作為裝飾器使用"""
+    _commit_hooks.append(hook)
+    return hook
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_content_versions(session, flush_context):
+    """在同一個交易內遞增有寫入的內容表格版本號 (每個交易每個表格一次)"""
+    changed = {
+        instance.__tablename__
+        for instance in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(instance, CONTENT_MODELS)
+    }
+    bumped = session.info.setdefault('content_versions_bumped', set())
+    tables = changed - bumped
+    if not tables:
+        return
+    bumped.update(tables)
+    _increment_versions(session.connection(), tables)
+
+
+def _increment_versions(connection, tables):
+    """遞增指定名稱的版本號 (沒有版本列時建立)"""
+    result = connection.execute(
+        update(ContentVersion.__table__)
+        .where(ContentVersion.__table__.c.table_name.in_(tables))
+        .values(version=ContentVersion.__table__.c.version + 1, updated_at=datetime.utcnow())
+    )
+    if result.rowcount < len(tables):
+        existing = {
+            row[0] for row in connection.execute(
+                ContentVersion.__table__.select().with_only_columns(ContentVersion.__table__.c.table_name)
+                .where(ContentVersion.__table__.c.table_name.in_(tables))
+            )
+        }
+        missing = [{'table_name': name, 'version': 1, 'updated_at': datetime.utcnow()} for name in tables - existing]
+        if missing:
+            connection.execute(ContentVersion.__table__.insert(), missing)
+
+
+def bump_versions(names):
+    """在目前的交易內遞增非內容表格的版本號 (例如其他行程共用的快取版本)，隨交易提交"""
+    names = set(names)
+    if names:
+        _increment_versions(db.session.connection(), names)
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_commit_hooks(session):
+    tables = session.info.pop('content_versions_bumped', None)
+    if not tables:
+        return
+    for hook in _commit_hooks:
+        try:
+            hook(frozenset(tables))
+        except Exception as e:
+            print(f"[ERROR] 內容寫入後處理失敗: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_bumped(session):
+    session.info.pop('content_versions_bumped', None)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+資料庫共用工具
+"""
+
+from sqlalchemy import func
+
+from models import db
+
+
+def upsert(model, rows, index_elements, increments=(), replacements=(), maximums=(), coalesces=(),
+           assignments=None):
+    """批次 upsert (executemany)
+
+    MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE，SQLite / PostgreSQL 使用 ON CONFLICT。
+    整個更新在資料庫內以單一語句完成，並行寫入同一列時不會遺失更新。
+    Args:
+        model: SQLAlchemy 模型
+        rows: 欲寫入的資料列 (dict 列表)
+        index_elements: 唯一鍵欄位，用於 ON CONFLICT
+        increments: 衝突時累加的欄位 (欄位 = 欄位 + 新值)
+        replacements: 衝突時以新值覆蓋的欄位
+        maximums: 衝突時取較大值的欄位 (如最後造訪時間)
+        coalesces: 衝突時只在新值不為 NULL 時覆蓋的欄位
+        assignments: 衝突時設為固定值的欄位 {欄位: 值}
+    """
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        new_values = stmt.inserted
+        greatest = func.greatest
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            greatest = func.max  # SQLite 的多參數 max() 為純量函式
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+            greatest = func.greatest
+        stmt = insert(table)
+        new_values = stmt.excluded
+    else:
+        raise NotImplementedError(f"不支援的資料庫類型: {dialect}")
+
+    updates = {name: table.c[name] + new_values[name] for name in increments}
+    updates.update({name: new_values[name] for name in replacements})
+    updates.update({name: greatest(table.c[name], new_values[name]) for name in maximums})
+    updates.update({name: func.coalesce(new_values[name], table.c[name]) for name in coalesces})
+    updates.update(assignments or {})
+
+    if dialect == 'mysql':
+        stmt = stmt.on_duplicate_key_update(updates)
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=list(index_elements), set_=updates)
+
+    db.session.execute(stmt, rows)
+
+
+def insert_ignore(model, rows, index_elements):
+    """批次插入，唯一鍵已存在的資料列直接略過 (executemany)"""
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).prefix_with('IGNORE')
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).on_conflict_do_nothing(index_elements=list(index_elements))
+    else:
+        raise NotImplementedError(f"不支援的資料庫類型: {dialect}")
+
+    db.session.execute(stmt, rows)
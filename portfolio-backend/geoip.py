@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本機 IP 地理位置查詢
+將 IP 區間 CSV 轉為依起點排序的整數陣列檔 (IPv4 為 uint32，IPv6 為高低兩個 uint64)，
+查詢時以唯讀 mmap 對應 (多個 worker 共用作業系統的頁面快取)，以二分搜尋找出所屬區間。
+結果依 /24 (IPv6 為 /48) 前綴快取；只有整個前綴都落在同一區間時才會快取，不影響正確性。
+"""
+
+import csv
+import gzip
+import io
+import ipaddress
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+
+MANIFEST_FILE = 'manifest.json'
+DEFAULT_CACHE_SIZE = 65536
+
+# 快取前綴長度：IPv4 /24、IPv6 /48 (以位移位元數表示)
+PREFIX_SHIFT = {4: 32 - 24, 6: 128 - 48}
+
+# 每隔幾秒檢查一次資料檔是否已被重新建立
+RELOAD_CHECK_SECONDS = 60
+
+UNKNOWN = (None, None)
+
+
+def _parse_ip(value):
+    """IP 字串或整數字串 -> (版本, 整數)，IPv4-mapped IPv6 視為 IPv4"""
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        address = ipaddress.IPv4Address(number) if number <= 0xFFFFFFFF else ipaddress.IPv6Address(number)
+    else:
+        address = ipaddress.ip_address(value)
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.version, int(address)
+
+
+def _open_csv(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def build_geoip_database(csv_path, folder, country_column=2, city_column=3, log=print):
+    """將 IP 區間 CSV (起點, 終點, ...國家, 城市) 轉為查詢用的陣列檔，回傳 manifest
+
+    起點與終點可為 IP 字串或整數；無法解析的列 (例如標題列) 與和前一區間重疊的列會略過。
+    新資料寫在暫存目錄，完成後才取代既有目錄。
+    """
+    ranges = {4: [], 6: []}
+    locations = {}
+    skipped = 0
+    with _open_csv(csv_path) as handle:
+        for row in csv.reader(handle):
+            try:
+                start_version, start = _parse_ip(row[0])
+                end_version, end = _parse_ip(row[1])
+                country = row[country_column].strip() if len(row) > country_column else ''
+                city = row[city_column].strip() if city_column is not None and len(row) > city_column else ''
+            except (ValueError, IndexError):
+                skipped += 1
+                continue
+            if start_version != end_version or start > end or not country or country == '-':
+                skipped += 1
+                continue
+            location = (country, city if city and city != '-' else '')
+            index = locations.setdefault(location, len(locations))
+            ranges[start_version].append((start, end, index))
+
+    staging = folder.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    counts = {}
+    for version, items in ranges.items():
+        items.sort()
+        starts = array('I' if version == 4 else 'Q')
+        ends = array('I' if version == 4 else 'Q')
+        codes = array('I')
+        last_end = -1
+        for start, end, index in items:
+            if start <= last_end:
+                skipped += 1
+                continue
+            if version == 4:
+                starts.append(start)
+                ends.append(end)
+            else:
+                starts.extend((start >> 64, start & 0xFFFFFFFFFFFFFFFF))
+                ends.extend((end >> 64, end & 0xFFFFFFFFFFFFFFFF))
+            codes.append(index)
+            last_end = end
+        for name, values in (('start', starts), ('end', ends), ('location', codes)):
+            with open(os.path.join(staging, f'ipv{version}_{name}.bin'), 'wb') as f:
+                values.tofile(f)
+        counts[f'ipv{version}'] = len(codes)
+
+    manifest = {
+        'version': datetime.now().strftime('%Y%m%d%H%M%S'),
+        'source': os.path.basename(csv_path),
+        'ranges': counts,
+        'locations': [list(location) for location, _ in sorted(locations.items(), key=lambda item: item[1])]
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    # 取代既有目錄；已開啟舊檔案的 worker 會繼續使用舊資料直到重新載入
+    previous = folder.rstrip(os.sep) + '.old'
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(folder):
+        os.rename(folder, previous)
+    os.rename(staging, folder)
+    shutil.rmtree(previous, ignore_errors=True)
+
+    log(f"[OK] IP 地理資料庫已建立: IPv4 {counts['ipv4']} 段, IPv6 {counts['ipv6']} 段, "
+        f"{len(locations)} 個地點 (略過 {skipped} 列)")
+    return manifest
+
+
+class _UInt128Array:
+    """以 (高位, 低位) 兩個 uint64 儲存的 128 位元整數序列，供 bisect 使用"""
+
+    def __init__(self, words):
+        self.words = words
+
+    def __len__(self):
+        return len(self.words) // 2
+
+    def __getitem__(self, index):
+        return (self.words[2 * index] << 64) | self.words[2 * index + 1]
+
+
+class GeoIPDatabase:
+    """以 mmap 對應的 IP 區間表"""
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.locations = [tuple(location) for location in self.manifest['locations']]
+        self.tables = {}
+        for version, fmt in ((4, 'I'), (6, 'Q')):
+            starts = self._map(folder, f'ipv{version}_start.bin', fmt)
+            ends = self._map(folder, f'ipv{version}_end.bin', fmt)
+            codes = self._map(folder, f'ipv{version}_location.bin', 'I')
+            if version == 6:
+                starts, ends = _UInt128Array(starts), _UInt128Array(ends)
+            self.tables[version] = (starts, ends, codes)
+
+    @staticmethod
+    def _map(folder, name, fmt):
+        path = os.path.join(folder, name)
+        if os.path.getsize(path) == 0:
+            return memoryview(b'').cast(fmt)
+        with open(path, 'rb') as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)).cast(fmt)
+
+    def find(self, version, number):
+        """回傳 (地點或 None, 結果是否適用於整個快取前綴)"""
+        starts, ends, codes = self.tables[version]
+        shift = PREFIX_SHIFT[version]
+        prefix_start = (number >> shift) << shift
+        prefix_end = prefix_start | ((1 << shift) - 1)
+
+        position = bisect_right(starts, number)
+        index = position - 1
+        if index >= 0 and number <= ends[index]:
+            whole_prefix = starts[index] <= prefix_start and ends[index] >= prefix_end
+            return self.locations[codes[index]], whole_prefix
+
+        # 沒有符合的區間：前綴內沒有其他區間時整個前綴都查無資料
+        whole_prefix = (
+            (index < 0 or ends[index] < prefix_start)
+            and (position >= len(starts) or starts[position] > prefix_end)
+        )
+        return None, whole_prefix
+
+
+class GeoIPLookup:
+    """IP -> (國家, 城市)，依前綴快取查詢結果"""
+
+    def __init__(self, folder=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.folder = folder
+        self.cache_size = cache_size
+        self._database = None
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+        self._cache = OrderedDict()  # (版本, 前綴) -> (國家, 城市)
+        self._lock = threading.Lock()
+        self._warned = False
+
+        # 統計計數
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+    def init_app(self, app):
+        """讀取 Flask 配置"""
+        self.folder = app.config.get('GEOIP_FOLDER')
+        self.cache_size = app.config.get('GEOIP_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+    def database(self):
+        """目前的資料庫 (延遲載入並定期檢查是否已被重新建立)，不存在時回傳 None"""
+        now = time.monotonic()
+        if self._checked_at and now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return self._database
+        with self._lock:
+            if self._checked_at and now - self._checked_at < RELOAD_CHECK_SECONDS:
+                return self._database
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(os.path.join(self.folder, MANIFEST_FILE)) if self.folder else None
+            except OSError:
+                mtime = None
+            if mtime is None:
+                if not self._warned:
+                    print(f"[INFO] 未找到 IP 地理資料庫 ({self.folder})，國家/城市將不會記錄")
+                    self._warned = True
+                self._database = None
+            elif mtime != self._loaded_mtime:
+                try:
+                    self._database = GeoIPDatabase(self.folder)
+                    self._loaded_mtime = mtime
+                    self._cache.clear()
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"[ERROR] 載入 IP 地理資料庫失敗: {e}")
+                    self._database = None
+            return self._database
+
+    def lookup(self, ip_address):
+        """回傳 (country, city)，查無資料時為 (None, None)"""
+        if not ip_address:
+            return UNKNOWN
+        try:
+            version, number = _parse_ip(ip_address)
+        except ValueError:
+            return UNKNOWN
+        database = self.database()
+        if database is None:
+            return UNKNOWN
+
+        key = (version, number >> PREFIX_SHIFT[version])
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        location, whole_prefix = database.find(version, number)
+        result = (location[0], location[1] or None) if location else UNKNOWN
+        with self._lock:
+            if whole_prefix:
+                self._cache[key] = result
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            else:
+                self.uncacheable += 1
+        return result
+
+    def stats(self):
+        """資料庫與快取統計"""
+        database = self._database
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'loaded': database is not None,
+                'version': database.manifest['version'] if database else None,
+                'ranges': database.manifest['ranges'] if database else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'uncacheable': self.uncacheable,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._cache),
+                'maxSize': self.cache_size
+            }
+
+
+geo_lookup = GeoIPLookup()
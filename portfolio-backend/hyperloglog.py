@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HyperLogLog 基數估計
+以固定大小的暫存器估計不重複元素數量，多個草圖可取暫存器最大值合併
+"""
+
+import hashlib
+import math
+import zlib
+
+DEFAULT_PRECISION = 12  # 4096 個暫存器，相對標準誤差約 1.63%
+
+
+class HyperLogLog:
+    """HyperLogLog 草圖
+
+    相對標準誤差約為 1.04 / sqrt(m)，m = 2 ** precision。
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision 必須介於 4 到 16 之間")
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            self.registers = bytearray(self.m)
+        else:
+            if len(registers) != self.m:
+                raise ValueError("暫存器數量與 precision 不符")
+            self.registers = bytearray(registers)
+
+    @property
+    def relative_error(self):
+        """相對標準誤差"""
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value):
+        """加入一個元素"""
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        x = int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'big')
+
+        index = x >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        w = x & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - w.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        """加入多個元素"""
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """合併另一個草圖 (取各暫存器最大值)"""
+        if other.precision != self.precision:
+            raise ValueError("只能合併相同 precision 的草圖")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """估計不重複元素數量"""
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        harmonic = math.fsum(2.0 ** -r for r in self.registers)
+        estimate = alpha * m * m / harmonic
+
+        # 小基數修正 (linear counting)
+        if estimate <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)
+
+        return int(round(estimate))
+
+    def is_empty(self):
+        return not any(self.registers)
+
+    def to_bytes(self):
+        """序列化 (precision + zlib 壓縮的暫存器)"""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers), 9)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """由 to_bytes 的結果還原"""
+        precision = data[0]
+        return cls(precision, zlib.decompress(data[1:]))
+
+    def __len__(self):
+        return self.count()
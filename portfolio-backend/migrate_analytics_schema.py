@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+更新流量分析相關表結構以匹配目前的模型
+建立缺少的表格、欄位與索引 (db.create_all 不會修改既有表格)，並移除已被取代的索引
+"""
+
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+
+from config import Config
+from models import db
+
+# 需要檢查的流量分析表
+ANALYTICS_TABLES = [
+    'page_views',
+    'visitor_sessions',
+    'analytics_rollups',
+    'analytics_visitor_sketches',
+    'analytics_topk_sketches',
+    'analytics_user_agents',
+    'analytics_referrers',
+    'analytics_archived_days',
+]
+
+# 已被取代的索引 (表格 -> 索引名稱)
+OBSOLETE_INDEXES = {
+    'page_views': ['ix_page_views_visit_time_referer'],  # 改為 visit_time + referrer_id
+}
+
+
+def add_column_sql(engine, table_name, column):
+    """產生新增欄位的 SQL (新欄位一律允許 NULL 或帶有伺服器預設值)"""
+    column_type = column.type.compile(dialect=engine.dialect)
+    sql = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}"
+    if column.server_default is not None:
+        if not column.nullable:
+            sql += " NOT NULL"
+        sql += f" DEFAULT {column.server_default.arg}"
+    return sql
+
+
+def migrate_analytics_schema(database_url=None, dry_run=False):
+    """建立缺少的流量分析表格、欄位與索引"""
+    print("=== 更新流量分析表結構 ===")
+
+    engine = create_engine(database_url or Config.SQLALCHEMY_DATABASE_URI)
+    try:
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+
+        for table_name in ANALYTICS_TABLES:
+            table = db.metadata.tables[table_name]
+
+            if table_name not in existing_tables:
+                print(f"建立表格 {table_name}...")
+                if not dry_run:
+                    table.create(engine)
+                    print(f"✓ 成功建立 {table_name}")
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table_name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                sql = add_column_sql(engine, table_name, column)
+                print(f"新增欄位 {table_name}.{column.name}...")
+                if not dry_run:
+                    with engine.begin() as connection:
+                        connection.execute(text(sql))
+                    print(f"✓ 成功新增 {column.name}")
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table_name)}
+            for index_name in OBSOLETE_INDEXES.get(table_name, []):
+                if index_name not in existing_indexes:
+                    continue
+                print(f"移除索引 {index_name} ON {table_name}...")
+                if not dry_run:
+                    with engine.begin() as connection:
+                        if engine.dialect.name == 'mysql':
+                            connection.execute(text(f"DROP INDEX {index_name} ON {table_name}"))
+                        else:
+                            connection.execute(text(f"DROP INDEX {index_name}"))
+                    print(f"✓ 成功移除 {index_name}")
+
+            for index in sorted(table.indexes, key=lambda item: item.name):
+                if index.name in existing_indexes:
+                    continue
+                columns = ', '.join(column.name for column in index.columns)
+                print(f"建立索引 {index.name} ON {table_name} ({columns})...")
+                if not dry_run:
+                    index.create(engine)
+                    print(f"✓ 成功建立 {index.name}")
+
+        print("\n流量分析表結構更新完成")
+        return True
+
+    except Exception as e:
+        print(f"更新失敗: {e}")
+        return False
+
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    dry_run = '--dry-run' in sys.argv
+    success = migrate_analytics_schema(dry_run=dry_run)
+    sys.exit(0 if success else 1)
@@ -288,41 +288,107 @@ class UploadedFile(db.Model):
             'uploadedAt': self.created_at.isoformat() if self.created_at else None
         }
 
+class UserAgentDim(db.Model):
+    """User-Agent 維度表 (每個不同的 UA 只保存一次，並預先解析)"""
+    __tablename__ = 'analytics_user_agents'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    value_hash = db.Column(db.String(40), unique=True, nullable=False)  # UA 的 SHA-1
+    user_agent = db.Column(db.Text, nullable=False)
+    browser = db.Column(db.String(100))  # 瀏覽器名稱
+    os = db.Column(db.String(100))  # 作業系統
+    device = db.Column(db.String(100))  # 設備類型
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'userAgent': self.user_agent,
+            'browser': self.browser,
+            'os': self.os,
+            'device': self.device
+        }
+
+class ReferrerDim(db.Model):
+    """來源網址維度表 (每個不同的來源只保存一次，並記錄正規化主機名稱)"""
+    __tablename__ = 'analytics_referrers'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    value_hash = db.Column(db.String(40), unique=True, nullable=False)  # 來源網址的 SHA-1
+    referrer = db.Column(db.String(500), nullable=False)
+    host = db.Column(db.String(255), index=True)  # 小寫、去除 www. 與連接埠
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'referrer': self.referrer,
+            'host': self.host
+        }
+
 class PageView(db.Model):
     """頁面瀏覽記錄模型"""
     __tablename__ = 'page_views'
+    __table_args__ = (
+        # 時間區間過濾 + 依頁面/來源分組、依會話查詢瀏覽
+        db.Index('ix_page_views_visit_time_path', 'visit_time', 'path'),
+        db.Index('ix_page_views_visit_time_referrer', 'visit_time', 'referrer_id'),
+        db.Index('ix_page_views_session_visit_time', 'session_id', 'visit_time'),
+    )
     
     id = db.Column(db.String(36), primary_key=True)
     path = db.Column(db.String(255), nullable=False)  # 頁面路徑
     title = db.Column(db.String(255))  # 頁面標題
     ip_address = db.Column(db.String(45))  # IP地址 (支援IPv6)
-    user_agent = db.Column(db.Text)  # 瀏覽器信息
-    referer = db.Column(db.String(500))  # 來源頁面
+    user_agent = db.Column(db.Text)  # 瀏覽器信息 (舊資料，新資料只存 user_agent_id)
+    referer = db.Column(db.String(500))  # 來源頁面 (舊資料，新資料只存 referrer_id)
+    # 維度表 ID；不宣告外鍵約束，因為 MySQL 分區表不支援外鍵
+    user_agent_id = db.Column(db.Integer)  # analytics_user_agents.id
+    referrer_id = db.Column(db.Integer)  # analytics_referrers.id
     session_id = db.Column(db.String(36))  # 會話ID
     visit_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     view_duration = db.Column(db.Integer, default=0)  # 頁面停留時間(秒)
+    sample_weight = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # 取樣權重 (代表的瀏覽數)
+
+    user_agent_dim = db.relationship(
+        'UserAgentDim', primaryjoin='foreign(PageView.user_agent_id) == UserAgentDim.id', viewonly=True
+    )
+    referrer_dim = db.relationship(
+        'ReferrerDim', primaryjoin='foreign(PageView.referrer_id) == ReferrerDim.id', viewonly=True
+    )
     
     def to_dict(self):
+        user_agent = self.user_agent
+        if user_agent is None and self.user_agent_dim is not None:
+            user_agent = self.user_agent_dim.user_agent
+        referer = self.referer
+        if referer is None and self.referrer_dim is not None:
+            referer = self.referrer_dim.referrer
         return {
             'id': self.id,
             'path': self.path,
             'title': self.title,
             'ipAddress': self.ip_address,
-            'userAgent': self.user_agent,
-            'referer': self.referer,
+            'userAgent': user_agent,
+            'referer': referer,
             'sessionId': self.session_id,
             'visitTime': self.visit_time.isoformat() if self.visit_time else None,
-            'viewDuration': self.view_duration
+            'viewDuration': self.view_duration,
+            'sampleWeight': self.sample_weight
         }
 
 class VisitorSession(db.Model):
     """訪客會話記錄模型"""
     __tablename__ = 'visitor_sessions'
+    __table_args__ = (
+        db.Index('ix_visitor_sessions_first_visit_browser', 'first_visit', 'browser'),
+    )
     
     id = db.Column(db.String(36), primary_key=True)
     session_id = db.Column(db.String(36), unique=True, nullable=False)
     ip_address = db.Column(db.String(45))  # IP地址
-    user_agent = db.Column(db.Text)  # 瀏覽器信息
+    user_agent = db.Column(db.Text)  # 瀏覽器信息 (舊資料，新資料只存 user_agent_id)
+    user_agent_id = db.Column(db.Integer)  # analytics_user_agents.id
     browser = db.Column(db.String(100))  # 瀏覽器名稱
     os = db.Column(db.String(100))  # 作業系統
     device = db.Column(db.String(100))  # 設備類型
@@ -333,13 +399,21 @@ class VisitorSession(db.Model):
     total_page_views = db.Column(db.Integer, default=1)
     total_time_spent = db.Column(db.Integer, default=0)  # 總停留時間(秒)
     is_unique = db.Column(db.Boolean, default=True)  # 是否為唯一訪客
+    sample_weight = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # 取樣權重 (代表的會話數)
+
+    user_agent_dim = db.relationship(
+        'UserAgentDim', primaryjoin='foreign(VisitorSession.user_agent_id) == UserAgentDim.id', viewonly=True
+    )
     
     def to_dict(self):
+        user_agent = self.user_agent
+        if user_agent is None and self.user_agent_dim is not None:
+            user_agent = self.user_agent_dim.user_agent
         return {
             'id': self.id,
             'sessionId': self.session_id,
             'ipAddress': self.ip_address,
-            'userAgent': self.user_agent,
+            'userAgent': user_agent,
             'browser': self.browser,
             'os': self.os,
             'device': self.device,
@@ -349,9 +423,66 @@ class VisitorSession(db.Model):
             'lastVisit': self.last_visit.isoformat() if self.last_visit else None,
             'totalPageViews': self.total_page_views,
             'totalTimeSpent': self.total_time_spent,
-            'isUnique': self.is_unique
+            'isUnique': self.is_unique,
+            'sampleWeight': self.sample_weight
+        }
+
+class AnalyticsRollup(db.Model):
+    """流量分析彙總模型 (每小時/每日 × 維度)"""
+    __tablename__ = 'analytics_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('granularity', 'bucket_start', 'dimension', 'value', name='uq_analytics_rollup_bucket'),
+        db.Index('ix_analytics_rollups_dimension_bucket', 'dimension', 'granularity', 'bucket_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    granularity = db.Column(db.String(8), nullable=False)  # hour / day
+    bucket_start = db.Column(db.DateTime, nullable=False)  # 時間區間起點
+    dimension = db.Column(db.String(20), nullable=False)  # total / path / referrer / browser / device / country / city / session_duration
+    value = db.Column(db.String(255), nullable=False, default='')  # 維度值
+    label = db.Column(db.String(255))  # 顯示名稱 (path 維度為頁面標題)
+    views = db.Column(db.Integer, nullable=False, default=0)  # 頁面瀏覽數
+    sessions = db.Column(db.Integer, nullable=False, default=0)  # 新會話數
+    duration = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # 停留時間總和(秒)
+    
+    def to_dict(self):
+        return {
+            'granularity': self.granularity,
+            'bucketStart': self.bucket_start.isoformat() if self.bucket_start else None,
+            'dimension': self.dimension,
+            'value': self.value,
+            'label': self.label,
+            'views': self.views,
+            'sessions': self.sessions,
+            'duration': self.duration
         }
 
+class AnalyticsVisitorSketch(db.Model):
+    """每日訪客 HyperLogLog 草圖模型"""
+    __tablename__ = 'analytics_visitor_sketches'
+    
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)  # precision + zlib 壓縮的暫存器
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AnalyticsTopKSketch(db.Model):
+    """每日熱門項目 (Space-Saving) 草圖模型"""
+    __tablename__ = 'analytics_topk_sketches'
+    
+    day = db.Column(db.Date, primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)  # path / referrer
+    payload = db.Column(db.LargeBinary(length=16777215), nullable=False)  # zlib 壓縮的 JSON
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AnalyticsArchivedDay(db.Model):
+    """已封存的原始資料日期模型 (保留策略在第一批刪除前寫入)"""
+    __tablename__ = 'analytics_archived_days'
+
+    day = db.Column(db.Date, primary_key=True)
+    raw_views = db.Column(db.Integer, nullable=False, default=0)  # 封存時的原始瀏覽數 (含取樣權重)
+    archive_path = db.Column(db.String(500))  # 封存檔路徑
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Patent(db.Model):
     """專利模型"""
     __tablename__ = 'patents'
@@ -437,3 +568,11 @@ class AboutValue(db.Model):
             'createdAt': self.created_at.isoformat() if self.created_at else None,
             'updatedAt': self.updated_at.isoformat() if self.updated_at else None
         }
+
+class ContentVersion(db.Model):
+    """內容表格版本號模型 (表格有寫入時遞增，用於 ETag)"""
+    __tablename__ = 'content_versions'
+    
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
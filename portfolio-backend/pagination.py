@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyset 分頁游標
+游標為排序鍵 (例如 visit_time + id) 的 URL-safe base64 JSON，對前端而言是不透明字串
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from urllib.parse import urlencode
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    """將排序鍵編碼為游標字串"""
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({'dt': value.isoformat()})
+        elif isinstance(value, date):
+            payload.append({'d': value.isoformat()})
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size=None):
+    """解析游標字串，格式錯誤時拋出 ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError, TypeError) as e:
+        raise ValueError("無效的游標") from e
+
+    if not isinstance(payload, list) or (size is not None and len(payload) != size):
+        raise ValueError("無效的游標")
+
+    values = []
+    try:
+        for value in payload:
+            if isinstance(value, dict) and 'dt' in value:
+                values.append(datetime.fromisoformat(value['dt']))
+            elif isinstance(value, dict) and 'd' in value:
+                values.append(date.fromisoformat(value['d']))
+            else:
+                values.append(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError("無效的游標") from e
+    return values
+
+
+def next_page_link(base_url, args, cursor):
+    """下一頁的 Link 標頭值 (保留其他查詢參數)"""
+    query = args.to_dict() if hasattr(args, 'to_dict') else dict(args)
+    query['cursor'] = cursor
+    return f'<{base_url}?{urlencode(query)}>; rel="next"'
+
+
+def page_size(value, default, maximum):
+    """解析每頁筆數 (未指定時用預設值，超過上限時以上限為準)"""
+    if value in (None, ''):
+        return min(default, maximum)
+    size = int(value)
+    if size <= 0:
+        raise ValueError("limit 必須大於 0")
+    return min(size, maximum)
+
+
+def _after_condition(columns, values, descending):
+    """排序鍵 (c1, c2, ...) 在游標之後的條件 (展開為 OR，讓各資料庫都能使用索引)"""
+    conditions = []
+    for index, column in enumerate(columns):
+        equal = [columns[i] == values[i] for i in range(index)]
+        step = column < values[index] if descending else column > values[index]
+        conditions.append(and_(*equal, step))
+    return or_(*conditions)
+
+
+def keyset_page(query, columns, cursor=None, limit=100, descending=True):
+    """依排序鍵取出一頁資料，回傳 (items, next_cursor)
+
+    columns 最後一欄必須唯一 (通常是主鍵)；cursor 為上一頁最後一筆的排序鍵
+    """
+    if cursor:
+        values = decode_cursor(cursor, size=len(columns))
+        query = query.filter(_after_condition(columns, values, descending))
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    items = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in columns])
+    return items, next_cursor
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+作品集公開內容彙整
+將前台首屏需要的資料 (個人資料、競賽、專案、技能、專利、媒體報導、About 翻卡) 組成單一回應。
+啟用內容快照時直接取自快照，否則在同一個交易內每個表格各查詢一次；編碼後的回應由 response_cache 快取。
+"""
+
+import json
+from collections import OrderedDict
+
+from models import db, User, Competition, Project, Skill, Patent, MediaCoverage, AboutValue
+
+# 找不到用戶資料時回傳的預設內容
+DEFAULT_USER = {
+    "name": "Portfolio User",
+    "email": "user@example.com",
+    "phone": "",
+    "title": "軟體工程師",
+    "description": "熱愛技術的開發者",
+    "github": "",
+    "linkedin": "",
+    "location": "台灣",
+    "website": ""
+}
+
+
+def _load_user():
+    user = User.query.first()
+    return user.to_dict() if user else DEFAULT_USER
+
+
+def _loader(query, *order_by):
+    """依與列表端點相同的排序讀取整個表格"""
+    def load():
+        return [item.to_dict() for item in query().order_by(*order_by).all()]
+    return load
+
+
+# 區塊名稱 -> 內容快照的表格名稱
+SNAPSHOT_TABLES = {
+    'user': 'users',
+    'competitions': 'competitions',
+    'projects': 'projects',
+    'skills': 'skills',
+    'patents': 'patents',
+    'mediaCoverage': 'media_coverage',
+    'aboutValues': 'about_values'
+}
+
+# 區塊名稱 -> 讀取函式 (回應中的鍵依此順序)
+SECTIONS = OrderedDict([
+    ('user', _load_user),
+    ('competitions', _loader(lambda: Competition.query, Competition.created_at.desc(), Competition.id.desc())),
+    ('projects', _loader(lambda: Project.query, Project.created_at.desc(), Project.id.desc())),
+    ('skills', _loader(lambda: Skill.query, Skill.category, Skill.name, Skill.id)),
+    ('patents', _loader(lambda: Patent.query, Patent.created_at.desc(), Patent.id.desc())),
+    ('mediaCoverage', _loader(
+        lambda: MediaCoverage.query, MediaCoverage.created_at.desc(), MediaCoverage.id.desc()
+    )),
+    ('aboutValues', _loader(
+        lambda: AboutValue.query.filter_by(is_active=True), AboutValue.order_index, AboutValue.id
+    ))
+])
+
+
+def parse_include(value):
+    """解析 ?include=competitions,skills，回傳依 SECTIONS 順序排列的區塊 tuple；未知區塊拋出 ValueError"""
+    if not value:
+        return tuple(SECTIONS)
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"未知的區塊: {', '.join(sorted(unknown))}，可用: {', '.join(SECTIONS)}")
+    if not requested:
+        raise ValueError("include 不可為空")
+    return tuple(name for name in SECTIONS if name in requested)
+
+
+def build_portfolio_bundle(sections, snapshot=None):
+    """讀取各區塊，回傳 dict (各區塊看到同一時間點的資料)
+
+    有快照時直接取用，不查詢資料庫；否則在同一個交易內讀取。
+    """
+    if snapshot is not None:
+        bundle = {}
+        for name in sections:
+            table = snapshot.table(SNAPSHOT_TABLES[name])
+            bundle[name] = (table.first() or DEFAULT_USER) if name == 'user' else list(table.items)
+        return bundle
+    try:
+        return {name: SECTIONS[name]() for name in sections}
+    finally:
+        # 結束唯讀交易，避免連線停留在舊的快照
+        db.session.rollback()
+
+
+def encode_bundle(bundle):
+    """序列化為 UTF-8 JSON"""
+    return json.dumps(bundle, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+公開內容 GET 回應快取
+快取編碼後的 JSON 位元組 (連同狀態碼與分頁標頭)，鍵包含相關表格與 ETag
+(由表格版本號與請求網址產生)，因此其他 worker 寫入後也不會讀到舊內容。
+啟用內容快照時版本號取自快照，命中快取與 304 都不需要查詢資料庫。
+本行程的寫入提交後，由 content_versions 的提交通知統一清除相關表格的項目，
+各路由不需要自行清除；同一鍵同時未命中時只計算一次。
+"""
+
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from content_snapshot import content_store
+from content_versions import current_etag, make_etag, not_modified, tag_response, on_content_commit
+from result_cache import ResultCache
+
+# 快取回應時保留的標頭
+CACHED_HEADERS = ('X-Next-Cursor', 'Link')
+
+# 鍵為 ('response', 表格 tuple, ETag)，值為 (內容, 狀態碼, 標頭 tuple, mimetype)
+response_cache = ResultCache(max_entries=512, max_bytes=16 * 1024 * 1024)
+_settings = {'ttl': 3600}
+
+
+def init_response_cache(app):
+    """讀取 Flask 配置"""
+    _settings['ttl'] = app.config.get('CONTENT_CACHE_TTL', 3600)
+    response_cache.configure(
+        max_entries=app.config.get('CONTENT_CACHE_MAX_ENTRIES', 512),
+        max_bytes=app.config.get('CONTENT_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+    )
+
+
+def _render(view, args, kwargs):
+    """執行 view 並取出可快取的回應內容"""
+    response = make_response(view(*args, **kwargs))
+    headers = tuple((name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers)
+    return response.get_data(), response.status_code, headers, response.mimetype
+
+
+def request_etag(tables):
+    """由目前的內容快照 (未啟用時為資料庫) 的版本號產生 ETag"""
+    snapshot = content_store.current()
+    if snapshot is not None and all(name in snapshot.versions for name in tables):
+        return make_etag({name: snapshot.versions[name] for name in tables}, request.full_path)
+    return current_etag(tables)
+
+
+def cached_get(*models):
+    """條件式 GET 並快取 200 回應的裝飾器 (未能取得 ETag 時不使用快取)"""
+    tables = tuple(model.__tablename__ for model in models)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = request_etag(tables)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            if etag is None:
+                return make_response(view(*args, **kwargs))
+
+            (body, status, headers, mimetype), hit = response_cache.get_or_set(
+                ('response', tables, etag),
+                lambda: _render(view, args, kwargs),
+                ttl=_settings['ttl'],
+                size=lambda value: len(value[0]),
+                cacheable=lambda value: value[1] == 200
+            )
+            response = Response(body, status=status, headers=headers, mimetype=mimetype)
+            response.headers['X-Cache'] = 'HIT' if hit else 'MISS'
+            return tag_response(response, etag)
+        return wrapper
+    return decorator
+
+
+@on_content_commit
+def invalidate_tables(tables):
+    """移除涉及任一指定表格的快取回應"""
+    return response_cache.invalidate(lambda key: not tables.isdisjoint(key[1]))
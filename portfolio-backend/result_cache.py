@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行程內結果快取
+LRU 淘汰，每筆可設定存活時間 (TTL)，並以序列化後的大小估計記憶體用量，
+總筆數與總大小都有上限。get_or_set 在未命中時只讓一個執行緒計算，同鍵的其他請求等待其結果。
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+
+def estimate_size(value):
+    """估計快取值佔用的記憶體 (JSON 序列化後的位元組數)"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class ResultCache:
+    """執行緒安全的 TTL + LRU 快取"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, 到期時間 monotonic 或 None, 大小)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> 正在計算該鍵的執行緒持有的鎖
+
+        # 統計計數
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.coalesced = 0
+
+    def configure(self, max_entries=None, max_bytes=None):
+        """調整容量上限 (超過時立即淘汰)"""
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key):
+        """取得快取值，不存在或已過期時回傳 None"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def get_or_set(self, key, factory, ttl=None, size=None, cacheable=None):
+        """取得快取值，未命中時呼叫 factory() 計算並寫入，回傳 (值, 是否命中)
+
+        同一個鍵同時只有一個執行緒執行 factory，其他執行緒等待後直接使用其結果。
+        size 與 cacheable 為以值為參數的函式，分別估計大小與判斷是否寫入快取。
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+
+        with self._lock:
+            lock = self._inflight.setdefault(key, threading.Lock())
+        with lock:
+            # 等待期間前一個執行緒可能已完成計算
+            with self._lock:
+                value = self._lookup(key)
+                if value is not None:
+                    self.coalesced += 1
+                    return value, True
+            try:
+                value = factory()
+                if cacheable is None or cacheable(value):
+                    self.set(key, value, ttl=ttl, size=size(value) if size else None)
+            finally:
+                with self._lock:
+                    if self._inflight.get(key) is lock:
+                        del self._inflight[key]
+        return value, False
+
+    def set(self, key, value, ttl=None, size=None):
+        """寫入快取，ttl 為 None 時不會過期 (仍可能被 LRU 淘汰)"""
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+        return True
+
+    def invalidate(self, predicate):
+        """移除 predicate(key) 為 True 的項目，回傳移除筆數"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """清除所有項目"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """快取命中與容量統計"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'coalesced': self.coalesced
+            }
+
+    def _lookup(self, key):
+        """(需持有鎖) 取得未過期的快取值並標記為最近使用，不存在時回傳 None"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        """淘汰最久未使用的項目直到符合上限"""
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Space-Saving 熱門項目草圖
+以固定數量的計數器追蹤串流中的 top-K 項目，多個草圖可合併
+"""
+
+import json
+import zlib
+
+DEFAULT_CAPACITY = 100
+
+
+class SpaceSaving:
+    """Space-Saving 草圖
+
+    每個被追蹤項目保存 (計數, 誤差)。計數為真實值的上界，
+    真實值至少為 計數 - 誤差；未被追蹤項目的真實值不超過最小計數。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("capacity 必須大於 0")
+        self.capacity = capacity
+        self.counters = {}  # item -> [count, error]
+        self.labels = {}  # item -> 顯示名稱 (如頁面標題)
+
+    def add(self, item, weight=1, label=None):
+        """加入一個項目 (可帶權重)"""
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0]
+        else:
+            # 取代計數最小的項目，並以其計數作為誤差
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.labels.pop(victim, None)
+            self.counters[item] = [floor + weight, floor]
+
+        if label:
+            self.labels[item] = label
+
+    def add_counts(self, counts, labels=None):
+        """批次加入 {item: count}
+
+        新項目沿用目前的最小計數作為誤差，最後保留計數最高的 capacity 個項目；
+        被淘汰項目的計數不超過保留項目的最小計數，上界性質不變。
+        """
+        floor = self.min_count()
+        for item, count in counts.items():
+            counter = self.counters.get(item)
+            if counter is not None:
+                counter[0] += count
+            else:
+                self.counters[item] = [floor + count, floor]
+
+        if labels:
+            for item in counts:
+                if labels.get(item):
+                    self.labels[item] = labels[item]
+
+        if len(self.counters) > self.capacity:
+            kept = sorted(self.counters.items(), key=lambda pair: pair[1][0], reverse=True)[:self.capacity]
+            self.counters = dict(kept)
+            self.labels = {item: label for item, label in self.labels.items() if item in self.counters}
+
+    def min_count(self):
+        """未追蹤項目的計數上界 (草圖未滿時為 0)"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other):
+        """合併另一個草圖
+
+        同時出現的項目計數相加；只出現在一方的項目，誤差加上另一方的最小計數。
+        合併後只保留計數最高的 capacity 個項目。
+        """
+        self_floor = self.min_count()
+        other_floor = other.min_count()
+        merged = {}
+
+        for item in set(self.counters) | set(other.counters):
+            mine = self.counters.get(item)
+            theirs = other.counters.get(item)
+            count = (mine[0] if mine else 0) + (theirs[0] if theirs else 0)
+            error = (mine[1] if mine else self_floor) + (theirs[1] if theirs else other_floor)
+            merged[item] = [count, error]
+
+        labels = dict(self.labels)
+        labels.update(other.labels)
+
+        kept = sorted(merged.items(), key=lambda pair: pair[1][0], reverse=True)[:self.capacity]
+        self.counters = dict(kept)
+        self.labels = {item: labels[item] for item in self.counters if item in labels}
+        return self
+
+    def top(self, limit=10):
+        """回傳 [(item, count, error, label), ...]，依計數遞減"""
+        ranked = sorted(self.counters.items(), key=lambda pair: (-pair[1][0], pair[0]))[:limit]
+        return [(item, count, error, self.labels.get(item)) for item, (count, error) in ranked]
+
+    def to_bytes(self):
+        """序列化為 zlib 壓縮的 JSON"""
+        payload = {
+            'capacity': self.capacity,
+            'counters': self.counters,
+            'labels': self.labels
+        }
+        return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """由 to_bytes 的結果還原"""
+        payload = json.loads(zlib.decompress(data).decode('utf-8'))
+        sketch = cls(payload['capacity'])
+        sketch.counters = {item: list(counter) for item, counter in payload['counters'].items()}
+        sketch.labels = payload.get('labels', {})
+        return sketch
+
+    def __len__(self):
+        return len(self.counters)
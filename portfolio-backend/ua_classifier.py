@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用戶代理 (User-Agent) 分類
+規則表預先編譯並依序比對 (第一個符合者勝出)，結果以有上限的 LRU 快取保存；
+實際流量的 UA 種類很少，熱門 UA 只需一次字典查找。
+"""
+
+import re
+from functools import lru_cache
+
+DEFAULT_CACHE_SIZE = 4096
+# 只以前段作為快取鍵，避免異常冗長的 UA 佔用記憶體
+MAX_KEY_LENGTH = 512
+
+UNKNOWN = "Unknown"
+
+# 爬蟲與自動化工具 (以小寫 UA 比對)
+BOT_PATTERN = r'bot\b|crawl|spider|slurp|mediapartners|facebookexternalhit|headless|lighthouse|curl/|wget/|python-requests|python-urllib|go-http-client|okhttp|java/|httpclient'
+
+# 瀏覽器規則：順序很重要，Edge/Opera/Samsung 的 UA 都含有 Chrome 與 Safari
+BROWSER_RULES = [
+    ("Edge", r'Edg(?:e|A|iOS)?/'),
+    ("Opera", r'OPR/|OPiOS/|Opera'),
+    ("Samsung Internet", r'SamsungBrowser/'),
+    ("Firefox", r'Firefox/|FxiOS/'),
+    ("Chrome", r'Chrome/|CriOS/|Chromium/'),
+    ("Safari", r'Safari/'),
+    ("Internet Explorer", r'MSIE |Trident/'),
+]
+
+# 作業系統規則：Android 的 UA 含 Linux，iOS 的 UA 含 Mac OS X
+OS_RULES = [
+    ("Windows", r'Windows'),
+    ("Android", r'Android'),
+    ("iOS", r'iPhone|iPad|iPod'),
+    ("ChromeOS", r'CrOS'),
+    ("macOS", r'Mac OS X|Macintosh'),
+    ("Linux", r'Linux|X11'),
+]
+
+# 設備規則：iPad 的 UA 含 Mobile 需最先判斷；Android 平板不含 Mobile 字樣，
+# 因此 Android 在手機規則之後才歸為平板
+DEVICE_RULES = [
+    ("Tablet", r'iPad|Tablet|Kindle|Silk/'),
+    ("Mobile", r'Mobile|iPhone|iPod|Windows Phone'),
+    ("Tablet", r'Android'),
+]
+
+
+def _compile(rules):
+    # UA 的標記大小寫固定，區分大小寫的比對可使用字面前綴加速
+    return [(name, re.compile(pattern)) for name, pattern in rules]
+
+
+class UserAgentClassifier:
+    """以預編譯規則表分類 UA，並以 LRU 快取結果"""
+
+    def __init__(self, browser_rules=BROWSER_RULES, os_rules=OS_RULES, device_rules=DEVICE_RULES,
+                 bot_pattern=BOT_PATTERN, cache_size=DEFAULT_CACHE_SIZE):
+        self.browser_rules = _compile(browser_rules)
+        self.os_rules = _compile(os_rules)
+        self.device_rules = _compile(device_rules)
+        self.bot_pattern = re.compile(bot_pattern) if bot_pattern else None
+        self.cache_size = cache_size
+        self._cached = lru_cache(maxsize=cache_size)(self._classify)
+
+    @staticmethod
+    def _first_match(rules, user_agent, default):
+        for name, pattern in rules:
+            if pattern.search(user_agent):
+                return name
+        return default
+
+    def _classify(self, user_agent):
+        os_name = self._first_match(self.os_rules, user_agent, UNKNOWN)
+        if self.bot_pattern is not None and self.bot_pattern.search(user_agent.lower()):
+            return "Bot", os_name, "Bot"
+
+        browser = self._first_match(self.browser_rules, user_agent, UNKNOWN)
+        device = self._first_match(self.device_rules, user_agent, "Desktop")
+        return browser, os_name, device
+
+    def classify(self, user_agent):
+        """回傳 (browser, os, device)"""
+        if not user_agent:
+            return UNKNOWN, UNKNOWN, "Desktop"
+        return self._cached(user_agent[:MAX_KEY_LENGTH])
+
+    def stats(self):
+        """快取命中統計"""
+        info = self._cached.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxSize': info.maxsize,
+            'hitRate': round(info.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def clear(self):
+        """清除快取與統計"""
+        self._cached.cache_clear()
+
+
+ua_classifier = UserAgentClassifier()
+
+
+def parse_user_agent(user_agent):
+    """解析用戶代理字符串，回傳 (browser, os, device)"""
+    return ua_classifier.classify(user_agent)
@@ -5,6 +5,7 @@ import { DndContext, closestCenter, KeyboardSensor, PointerSensor, useSensor, us
 import { SortableContext, sortableKeyboardCoordinates, verticalListSortingStrategy, useSortable, arrayMove } from '@dnd-kit/sortable';
 import { CSS } from '@dnd-kit/utilities';
 import { Lightbulb, Code, Users, Target, GripVertical, Edit, Trash2, Plus, Save, X } from 'lucide-react';
+import { adminApi } from '../../../lib/adminApi';
 
 interface AboutValue {
   id: string;
@@ -125,11 +126,9 @@ export default function AboutManagementPage() {
 
   const fetchAboutValues = async () => {
     try {
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/v1/about-values`);
-      if (response.ok) {
-        const data = await response.json();
-        setAboutValues(data.sort((a: AboutValue, b: AboutValue) => a.orderIndex - b.orderIndex));
-      }
+      // 列表端點已分頁，需讀取所有頁面，否則排序時只會送出第一頁
+      const data = await adminApi.getAboutValues();
+      setAboutValues(data.sort((a: AboutValue, b: AboutValue) => a.orderIndex - b.orderIndex));
     } catch (error) {
       console.error('Failed to fetch about values:', error);
     }
@@ -6,7 +6,7 @@ import { motion } from 'framer-motion';
 import Button from '../../../components/common/Button';
 import Card from '../../../components/common/Card';
 import { Analytics } from '../../../types/admin';
-import { adminApi } from '../../../lib/adminApi';
+import { adminApi, AnalyticsTimeseries } from '../../../lib/adminApi';
 import AdminProtection from '../../../components/common/AdminProtection';
 
 export default function AnalyticsPage() {
@@ -27,12 +27,28 @@ export default function AnalyticsPage() {
   } | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [selectedDays, setSelectedDays] = useState(30);
+  const [activeVisitors, setActiveVisitors] = useState<number | null>(null);
+  const [timeseries, setTimeseries] = useState<AnalyticsTimeseries | null>(null);
 
   useEffect(() => {
     loadAnalytics();
     loadRecentViews();
+    loadTimeseries();
   }, [selectedDays]);
 
+  // 即時推送：新瀏覽加到最近瀏覽列表，不需重新查詢統計
+  useEffect(() => {
+    return adminApi.subscribeLiveAnalytics((message) => {
+      setActiveVisitors(message.activeVisitors);
+      if (message.views.length > 0) {
+        setRecentViews(prev => {
+          const views = [...message.views.slice().reverse(), ...(prev?.recentViews || [])].slice(0, 20);
+          return { ...(prev || { total: 0 }), recentViews: views, total: views.length };
+        });
+      }
+    });
+  }, []);
+
   const loadAnalytics = async () => {
     try {
       setIsLoading(true);
@@ -45,6 +61,16 @@ export default function AnalyticsPage() {
     }
   };
 
+  // 7 天以內顯示每小時，其餘顯示每日
+  const loadTimeseries = async () => {
+    try {
+      const data = await adminApi.getAnalyticsTimeseries(selectedDays, selectedDays <= 7 ? 'hour' : 'day');
+      setTimeseries(data);
+    } catch {
+      logger.error('Failed to load analytics timeseries:');
+    }
+  };
+
   const loadRecentViews = async () => {
     try {
       const data = await adminApi.getRecentViews(20);
@@ -84,6 +110,12 @@ export default function AnalyticsPage() {
               <span className="ml-2 text-sm">
                 (最近 {selectedDays} 天)
               </span>
+              {activeVisitors !== null && (
+                <span className="ml-3 inline-flex items-center text-sm text-green-700">
+                  <span className="w-2 h-2 bg-green-500 rounded-full mr-1 animate-pulse"></span>
+                  目前在線 {activeVisitors} 人
+                </span>
+              )}
             </p>
           </div>
           
@@ -110,7 +142,7 @@ export default function AnalyticsPage() {
             >
               返回
             </Button>
-            <Button onClick={() => { loadAnalytics(); loadRecentViews(); }}>
+            <Button onClick={() => { loadAnalytics(); loadRecentViews(); loadTimeseries(); }}>
               刷新數據
             </Button>
           </div>
@@ -172,10 +204,49 @@ export default function AnalyticsPage() {
                     {analytics.averageTimeOnSite}
                   </h3>
                   <p className="text-gray-600">平均停留時間</p>
+                  {analytics.medianTimeOnSite && (
+                    <p className="text-sm text-gray-500 mt-1">中位數 {analytics.medianTimeOnSite}</p>
+                  )}
                 </Card>
               </motion.div>
             </div>
 
+            {/* 流量趨勢 */}
+            {timeseries && timeseries.points.length > 0 && (
+              <motion.div
+                initial={{ opacity: 0, y: 20 }}
+                animate={{ opacity: 1, y: 0 }}
+                transition={{ delay: 0.35 }}
+                className="mb-8"
+              >
+                <Card className="p-6">
+                  <h2 className="text-xl font-semibold text-gray-900 mb-4">
+                    流量趨勢
+                    <span className="ml-2 text-sm font-normal text-gray-500">
+                      ({timeseries.granularity === 'hour' ? '每小時' : '每日'}瀏覽量)
+                    </span>
+                  </h2>
+                  <div className="flex items-end gap-px h-40">
+                    {(() => {
+                      const peak = Math.max(1, ...timeseries.points.map(point => point.value));
+                      return timeseries.points.map(point => (
+                        <div
+                          key={point.time}
+                          className="flex-1 bg-blue-500 hover:bg-blue-600 rounded-t-sm min-h-px"
+                          style={{ height: `${(point.value / peak) * 100}%` }}
+                          title={`${new Date(point.time).toLocaleString('zh-TW')}: ${point.value.toLocaleString()}`}
+                        />
+                      ));
+                    })()}
+                  </div>
+                  <div className="flex justify-between text-xs text-gray-500 mt-2">
+                    <span>{new Date(timeseries.points[0].time).toLocaleDateString('zh-TW')}</span>
+                    <span>{new Date(timeseries.points[timeseries.points.length - 1].time).toLocaleDateString('zh-TW')}</span>
+                  </div>
+                </Card>
+              </motion.div>
+            )}
+
             {/* 熱門頁面和流量來源 */}
             <div className="grid md:grid-cols-2 gap-8 mb-8">
               <motion.div
@@ -173,7 +173,7 @@ export default function AboutSection() {
     const loadData = async () => {
       // 載入技能資料
       try {
-        const skillsData = await adminApi.getSkills();
+        const skillsData = await adminApi.getPublicContent('skills');
         logger.log('AboutSection loaded skills data:', skillsData);
         if (skillsData && skillsData.length > 0) {
           setSkills(skillsData);
@@ -203,7 +203,7 @@ export default function AboutSection() {
 
       // 載入 About Values 資料
       try {
-        const aboutData = await adminApi.getAboutValues();
+        const aboutData = await adminApi.getPublicContent('aboutValues');
         logger.log('AboutSection loaded about values:', aboutData);
         if (aboutData && aboutData.length > 0) {
           // 按 orderIndex 排序並僅顯示啟用的項目
@@ -217,7 +217,7 @@ export default function AboutSection() {
       }
       // 載入用戶資料
       try {
-        const userData = await adminApi.getUserInfo();
+        const userData = await adminApi.getPublicContent('user');
         if (userData) {
           setUserInfo(userData);
         }
@@ -20,7 +20,7 @@ export default function CompetitionsSection() {
   useEffect(() => {
     const loadCompetitions = async () => {
       try {
-        const competitionsData = await adminApi.getCompetitions();
+        const competitionsData = await adminApi.getPublicContent('competitions');
         const sortedCompetitions = competitionsData
           .sort((a, b) => new Date(b.date).getTime() - new Date(a.date).getTime());
         setCompetitions(sortedCompetitions || []);
@@ -36,7 +36,7 @@ export default function HeroSection() {
     const timer = setTimeout(() => {
       const loadUserData = async () => {
         try {
-          const userData = await adminApi.getUserInfo();
+          const userData = await adminApi.getPublicContent('user');
           logger.log('HeroSection loaded user data:', userData);
           if (userData) {
             setUserInfo(userData);
@@ -56,7 +56,7 @@ export default function NewsSection() {
   useEffect(() => {
     const loadNews = async () => {
       try {
-        const newsData = await adminApi.getMediaCoverage();
+        const newsData = await adminApi.getPublicContent('mediaCoverage');
         logger.log('NewsSection loaded media coverage from API:', newsData);
 
         if (newsData && newsData.length > 0) {
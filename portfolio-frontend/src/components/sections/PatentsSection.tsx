@@ -18,7 +18,7 @@ export default function PatentsSection() {
   useEffect(() => {
     const loadPatents = async () => {
       try {
-        const patentsData = await adminApi.getPatents();
+        const patentsData = await adminApi.getPublicContent('patents');
         logger.log('PatentsSection loaded patents from API:', patentsData);
 
         if (patentsData && patentsData.length > 0) {
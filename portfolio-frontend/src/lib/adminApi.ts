@@ -37,6 +37,15 @@ interface AnalyticsData {
     count: number;
     percentage: string;
   }[];
+  countries?: {
+    country: string;
+    count: number;
+  }[];
+  cities?: {
+    country: string;
+    city: string;
+    count: number;
+  }[];
 }
 
 // 最近瀏覽記錄介面
@@ -53,6 +62,25 @@ interface RecentViewsData {
     viewDuration: number;
   }[];
   total: number;
+  nextCursor?: string | null;
+}
+
+// 流量時間序列 (/api/v1/analytics/timeseries)
+export interface AnalyticsTimeseries {
+  granularity: 'hour' | 'day';
+  metric: 'views' | 'sessions';
+  path: string | null;
+  points: { time: string; value: number }[];
+  total: number;
+}
+
+// 即時流量推送訊息 (/api/v1/analytics/live)
+export interface LiveAnalyticsMessage {
+  time: string;
+  activeVisitors: number;
+  activeWindow: number;
+  views: RecentViewsData['recentViews'];
+  viewCount: number;
 }
 
 // 新聞介面
@@ -79,8 +107,64 @@ interface ExportData {
   exportedAt: string;
 }
 
+// 後端競賽資料格式
+interface CompetitionApiData {
+  id: string;
+  name: string;
+  result: string;
+  date: string;
+  description: string;
+  detailedDescription?: string;
+  certificateUrl?: string;
+  category?: string;
+  featured?: boolean;
+  organizer?: string;
+  location?: string;
+  teamSize?: number;
+  role?: string;
+  technologies?: string[];
+  projectUrl?: string;
+  projectImages?: string[];
+  createdAt?: string;
+}
+
+// 作品集彙整 (/api/v1/portfolio)：前台首屏需要的所有公開內容
+export interface PortfolioBundle {
+  user: UserInfo;
+  competitions: Competition[];
+  projects: Project[];
+  skills: Skill[];
+  patents: Patent[];
+  mediaCoverage: MediaCoverage[];
+  aboutValues: AboutValue[];
+}
+
+// 同一頁面內各區塊共用彙整結果的時間 (毫秒)
+const PORTFOLIO_MAX_AGE = 10000;
+
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
+// 將後端競賽資料格式轉換為前端期望的格式
+const toCompetition = (comp: CompetitionApiData): Competition => ({
+  id: comp.id,
+  name: comp.name, // 後端的 name 映射為前端的 name
+  result: comp.result,
+  date: comp.date,
+  description: comp.description,
+  detailedDescription: comp.detailedDescription || undefined,
+  certificateUrl: comp.certificateUrl || '',
+  category: comp.category || '技術競賽', // 提供預設值
+  featured: comp.featured !== false,
+  organizer: comp.organizer || '', // 從後端載入實際資料
+  location: comp.location || '',
+  teamSize: comp.teamSize || 1,
+  role: comp.role || '',
+  technologies: comp.technologies || [],
+  projectUrl: comp.projectUrl || '',
+  projectImages: comp.projectImages || [], // 修復：加入 projectImages 處理
+  createdAt: comp.createdAt || new Date().toISOString()
+});
+
 // 模擬API調用 - 在本地存儲中保存數據
 class AdminApiService {
   private readonly STORAGE_KEYS = {
@@ -96,6 +180,76 @@ class AdminApiService {
     NEWS: 'portfolio_news'
   };
 
+  // 列表端點以 keyset 游標分頁：依 X-Next-Cursor 依序取得所有分頁並合併
+  // (回應帶有 ETag 與 Cache-Control: no-cache，瀏覽器會自動以 If-None-Match 確認，未變更的分頁回傳 304)
+  private async fetchAllPages<T>(path: string): Promise<T[]> {
+    const items: T[] = [];
+    let cursor: string | null = null;
+    do {
+      const separator = path.includes('?') ? '&' : '?';
+      const url = cursor
+        ? `${API_BASE_URL}${path}${separator}cursor=${encodeURIComponent(cursor)}`
+        : `${API_BASE_URL}${path}`;
+      const response = await fetch(url);
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      const page = await response.json();
+      if (!Array.isArray(page)) {
+        throw new Error(`Expected array from ${path}`);
+      }
+      items.push(...page);
+      cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+  }
+
+  private portfolioRequest: Promise<PortfolioBundle> | null = null;
+  private portfolioFetchedAt = 0;
+
+  // 前台公開內容：以單一請求取得所有區塊，同時載入的區塊共用同一個請求
+  async getPortfolio(): Promise<PortfolioBundle> {
+    if (!this.portfolioRequest || Date.now() - this.portfolioFetchedAt > PORTFOLIO_MAX_AGE) {
+      this.portfolioFetchedAt = Date.now();
+      const request = fetch(`${API_BASE_URL}/api/v1/portfolio`).then(async (response) => {
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const bundle = await response.json();
+        localStorage.setItem(this.STORAGE_KEYS.USER_INFO, JSON.stringify(bundle.user));
+        return { ...bundle, competitions: bundle.competitions.map(toCompetition) } as PortfolioBundle;
+      });
+      // 失敗的請求不重複使用
+      request.catch(() => {
+        if (this.portfolioRequest === request) {
+          this.portfolioRequest = null;
+        }
+      });
+      this.portfolioRequest = request;
+    }
+    return this.portfolioRequest;
+  }
+
+  // 取得前台的單一區塊；彙整端點失敗時改用個別的 API
+  async getPublicContent<K extends keyof PortfolioBundle>(section: K): Promise<PortfolioBundle[K]> {
+    try {
+      const bundle = await this.getPortfolio();
+      return bundle[section];
+    } catch (error) {
+      logger.log('Portfolio bundle failed, fallback to per-resource API:', error);
+      const fallbacks: { [S in keyof PortfolioBundle]: () => Promise<PortfolioBundle[S]> } = {
+        user: () => this.getUserInfo(),
+        competitions: () => this.getCompetitions(),
+        projects: async () => (await this.getProjects()).data || [],
+        skills: () => this.getSkills(),
+        patents: () => this.getPatents(),
+        mediaCoverage: () => this.getMediaCoverage(),
+        aboutValues: () => this.getAboutValues()
+      };
+      return fallbacks[section]();
+    }
+  }
+
   // 獲取用戶信息
   async getUserInfo(): Promise<UserInfo> {
     try {
@@ -104,11 +258,8 @@ class AdminApiService {
         try {
           logger.log('Fetching user data from API:', `${API_BASE_URL}/api/v1/user`);
           const response = await fetch(`${API_BASE_URL}/api/v1/user`, {
-            // 添加快取破壞機制
-            headers: {
-              'Cache-Control': 'no-cache',
-              'Pragma': 'no-cache'
-            }
+            // 每次向伺服器確認 (If-None-Match)，資料未變更時以 304 沿用瀏覽器快取
+            cache: 'no-cache'
           });
           logger.log('API response status:', response.status, response.ok);
           if (response.ok) {
@@ -244,6 +395,24 @@ class AdminApiService {
     }
   }
 
+  // 獲取流量時間序列 (每小時/每日，空白區間為 0)
+  async getAnalyticsTimeseries(
+    days: number = 30,
+    granularity: 'hour' | 'day' = 'day',
+    metric: 'views' | 'sessions' = 'views',
+    path?: string
+  ): Promise<AnalyticsTimeseries> {
+    const params = new URLSearchParams({ days: String(days), granularity, metric });
+    if (path) {
+      params.set('path', path);
+    }
+    const response = await fetch(`${API_BASE_URL}/api/v1/analytics/timeseries?${params}`);
+    if (!response.ok) {
+      throw new Error(`獲取流量時間序列失敗: ${response.status}`);
+    }
+    return response.json();
+  }
+
   // 獲取最近瀏覽記錄
   async getRecentViews(limit: number = 50): Promise<RecentViewsData> {
     try {
@@ -277,19 +446,31 @@ class AdminApiService {
     }
   }
 
+  // 訂閱即時流量 (Server-Sent Events)，回傳取消訂閱函式；連線中斷時瀏覽器會自動重連
+  subscribeLiveAnalytics(onMessage: (message: LiveAnalyticsMessage) => void): () => void {
+    if (!API_BASE_URL || typeof EventSource === 'undefined') {
+      return () => {};
+    }
+
+    const source = new EventSource(`${API_BASE_URL}/api/v1/analytics/live`);
+    const handle = (event: MessageEvent) => {
+      try {
+        onMessage(JSON.parse(event.data));
+      } catch (error) {
+        logger.error('Failed to parse live analytics message:', error);
+      }
+    };
+    source.addEventListener('snapshot', handle as EventListener);
+    source.addEventListener('update', handle as EventListener);
+    return () => source.close();
+  }
+
   // 專案管理
   async getProjects(): Promise<ApiResponse<Project[]>> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/projects`);
-        if (response.ok) {
-          const data = await response.json();
-          return { success: true, data };
-        } else {
-          const error = await response.text();
-          logger.error("Failed to fetch projects from API:", error);
-          return { success: false, error: `API 錯誤: ${response.status}` };
-        }
+        const data = await this.fetchAllPages<Project>('/api/v1/projects');
+        return { success: true, data };
       } else {
         const stored = localStorage.getItem(this.STORAGE_KEYS.PROJECTS);
         const data = stored ? JSON.parse(stored) : [];
@@ -371,8 +552,7 @@ class AdminApiService {
   async getSkills(): Promise<Skill[]> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/skills`);
-        return await response.json();
+        return await this.fetchAllPages<Skill>('/api/v1/skills');
       } else {
         const stored = localStorage.getItem(this.STORAGE_KEYS.SKILLS);
         return stored ? JSON.parse(stored) : [];
@@ -457,11 +637,7 @@ class AdminApiService {
   async getPatents(): Promise<Patent[]> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/patents`);
-        if (response.ok) {
-          return await response.json();
-        }
-        return [];
+        return await this.fetchAllPages<Patent>('/api/v1/patents');
       } else {
         const stored = localStorage.getItem(this.STORAGE_KEYS.PATENTS);
         return stored ? JSON.parse(stored) : [];
@@ -567,11 +743,7 @@ class AdminApiService {
   async getMediaCoverage(): Promise<MediaCoverage[]> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/media-coverage`);
-        if (response.ok) {
-          return await response.json();
-        }
-        return [];
+        return await this.fetchAllPages<MediaCoverage>('/api/v1/media-coverage');
       } else {
         const stored = localStorage.getItem(this.STORAGE_KEYS.MEDIA_COVERAGE);
         return stored ? JSON.parse(stored) : [];
@@ -739,8 +911,7 @@ class AdminApiService {
   async getFiles(): Promise<FileData[]> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/files`);
-        return await response.json();
+        return await this.fetchAllPages<FileData>('/api/v1/files');
       } else {
         const stored = localStorage.getItem(this.STORAGE_KEYS.FILES);
         return stored ? JSON.parse(stored) : [];
@@ -789,59 +960,9 @@ class AdminApiService {
   async getCompetitions(): Promise<Competition[]> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/competitions`);
+        const apiData = await this.fetchAllPages<CompetitionApiData>('/api/v1/competitions');
 
-        if (!response.ok) {
-          logger.error('API Error:', response.status, response.statusText);
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-
-        const apiData = await response.json();
-
-        // 確保 apiData 是陣列
-        if (!Array.isArray(apiData)) {
-          logger.error('Expected array but got:', typeof apiData, apiData);
-          return [];
-        }
-        
-        // 將後端數據格式轉換為前端期望的格式
-        return apiData.map((comp: {
-          id: string;
-          name: string;
-          result: string;
-          date: string;
-          description: string;
-          detailedDescription?: string;
-          certificateUrl?: string;
-          category?: string;
-          featured?: boolean;
-          organizer?: string;
-          location?: string;
-          teamSize?: number;
-          role?: string;
-          technologies?: string[];
-          projectUrl?: string;
-          projectImages?: string[];
-          createdAt?: string;
-        }) => ({
-          id: comp.id,
-          name: comp.name, // 後端的 name 映射為前端的 name
-          result: comp.result,
-          date: comp.date,
-          description: comp.description,
-          detailedDescription: comp.detailedDescription || undefined,
-          certificateUrl: comp.certificateUrl || '',
-          category: comp.category || '技術競賽', // 提供預設值
-          featured: comp.featured !== false,
-          organizer: comp.organizer || '', // 從後端載入實際資料
-          location: comp.location || '',
-          teamSize: comp.teamSize || 1,
-          role: comp.role || '',
-          technologies: comp.technologies || [],
-          projectUrl: comp.projectUrl || '',
-          projectImages: comp.projectImages || [], // 修復：加入 projectImages 處理
-          createdAt: comp.createdAt || new Date().toISOString()
-        }));
+        return apiData.map(toCompetition);
       } else {
         const stored = localStorage.getItem(this.STORAGE_KEYS.COMPETITIONS);
         return stored ? JSON.parse(stored) : [];
@@ -990,10 +1111,7 @@ class AdminApiService {
   async getAboutValues(): Promise<AboutValue[]> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/about-values`);
-        if (response.ok) {
-          return await response.json();
-        }
+        return await this.fetchAllPages<AboutValue>('/api/v1/about-values');
       }
       return [];
     } catch (error) {
@@ -1069,8 +1187,7 @@ class AdminApiService {
   }  async getNews(): Promise<NewsItem[]> {
     try {
       if (API_BASE_URL) {
-        const response = await fetch(`${API_BASE_URL}/api/v1/news`);
-        return await response.json();
+        return await this.fetchAllPages<NewsItem>('/api/v1/news');
       } else {
         const stored = localStorage.getItem(this.STORAGE_KEYS.NEWS);
         return stored ? JSON.parse(stored) : [];
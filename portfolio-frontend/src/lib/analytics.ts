@@ -47,6 +47,7 @@ export interface PageTrackingData {
   title?: string;
   sessionId?: string;
   referrer?: string;
+  pageViewId?: string;
 }
 
 // 分析統計資料介面
@@ -54,6 +55,9 @@ export interface AnalyticsStats {
   pageViews: number;
   uniqueVisitors: number;
   averageTimeOnSite: string;
+  averageTimeOnSiteSeconds?: number;
+  medianTimeOnSite?: string;
+  medianTimeOnSiteSeconds?: number;
   topPages: Array<{
     path: string;
     title: string;
@@ -67,6 +71,15 @@ export interface AnalyticsStats {
     name: string;
     count: number;
   }>;
+  countries: Array<{
+    country: string;
+    count: number;
+  }>;
+  cities: Array<{
+    country: string;
+    city: string;
+    count: number;
+  }>;
   dateRange: {
     start: string;
     end: string;
@@ -92,37 +105,147 @@ export interface RecentViewsResponse {
   total: number;
 }
 
+// 批次送出設定
+const BATCH_MAX_EVENTS = 10;
+const BATCH_FLUSH_INTERVAL = 5000;
+
+// 停留時間心跳間隔
+const HEARTBEAT_INTERVAL = 15000;
+
+// 緩衝中的頁面瀏覽事件
+interface BufferedPageView {
+  pageViewId: string;
+  path: string;
+  title: string;
+  sessionId: string;
+  referrer: string;
+  timestamp: number;
+}
+
+// 批次記錄回應介面
+export interface TrackBatchResponse {
+  status: string;
+  accepted: number;
+  rejected: number;
+  dropped: number;
+  results: Array<{
+    index: number;
+    status: 'accepted' | 'rejected' | 'dropped';
+    sessionId?: string;
+    pageViewId?: string;
+    error?: string;
+  }>;
+}
+
 class AnalyticsAPI {
+  private static buffer: BufferedPageView[] = [];
+  private static flushTimer: ReturnType<typeof setTimeout> | null = null;
+
   /**
-   * 記錄頁面瀏覽
+   * 記錄頁面瀏覽 (先放入緩衝，再批次送出)
    */
   static async trackPageView(data: PageTrackingData): Promise<void> {
     try {
       const sessionId = SessionManager.getSessionId();
-      
-      const trackingData = {
+
+      this.buffer.push({
+        pageViewId: data.pageViewId || uuidv4(),
         path: data.path,
         title: data.title || document.title || '',
         sessionId: data.sessionId || sessionId,
-        referrer: data.referrer || document.referrer || ''
-      };
+        referrer: data.referrer || document.referrer || '',
+        timestamp: Date.now()
+      });
+
+      if (this.buffer.length >= BATCH_MAX_EVENTS) {
+        await this.flush();
+      } else if (!this.flushTimer) {
+        this.flushTimer = setTimeout(() => {
+          this.flush();
+        }, BATCH_FLUSH_INTERVAL);
+      }
+    } catch (error) {
+      logger.error('❌ 頁面瀏覽記錄失敗:', error);
+      // 不要拋出錯誤，以免影響使用者體驗
+    }
+  }
+
+  /**
+   * 送出緩衝中的頁面瀏覽
+   * 頁面隱藏或卸載時使用 sendBeacon，確保資料不會遺失
+   */
+  static async flush(useBeacon: boolean = false): Promise<void> {
+    if (this.flushTimer) {
+      clearTimeout(this.flushTimer);
+      this.flushTimer = null;
+    }
+
+    const events = this.buffer.splice(0, this.buffer.length);
+    if (events.length === 0) {
+      return;
+    }
 
-      const response = await fetch(`${API_BASE_URL}/api/v1/analytics/track`, {
+    const url = `${API_BASE_URL}/api/v1/analytics/track/batch`;
+    const body = JSON.stringify({ events });
+
+    try {
+      // sendBeacon 以 text/plain 送出，避免跨域預檢請求
+      if (useBeacon && typeof navigator !== 'undefined' && navigator.sendBeacon) {
+        if (navigator.sendBeacon(url, body)) {
+          logger.log(`📊 已透過 sendBeacon 送出 ${events.length} 筆頁面瀏覽`);
+          return;
+        }
+      }
+
+      const response = await fetch(url, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(trackingData)
+        body,
+        keepalive: true
       });
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const result = await response.json();
-      logger.log('📊 頁面瀏覽記錄成功:', result);
+      const result: TrackBatchResponse = await response.json();
+      if (result.rejected > 0 || result.dropped > 0) {
+        logger.warn('⚠️ 部分頁面瀏覽未被記錄:', result.results.filter(item => item.status !== 'accepted'));
+      }
+      logger.log(`📊 頁面瀏覽批次記錄成功: ${result.accepted} 筆`);
     } catch (error) {
-      logger.error('❌ 頁面瀏覽記錄失敗:', error);
+      logger.error('❌ 頁面瀏覽批次記錄失敗:', error);
+      // 不要拋出錯誤，以免影響使用者體驗
+    }
+  }
+
+  /**
+   * 送出頁面累計停留時間 (秒)
+   * 伺服器只保留每個頁面瀏覽的最大值，重複送出不會重複計算
+   */
+  static async sendHeartbeat(pageViewId: string, duration: number, useBeacon: boolean = false): Promise<void> {
+    const url = `${API_BASE_URL}/api/v1/analytics/heartbeat`;
+    const body = JSON.stringify({ heartbeats: [{ pageViewId, duration }] });
+
+    try {
+      if (useBeacon && typeof navigator !== 'undefined' && navigator.sendBeacon) {
+        if (navigator.sendBeacon(url, body)) {
+          return;
+        }
+      }
+
+      await fetch(url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body,
+        keepalive: true
+      });
+    } catch (error) {
+      logger.error('❌ 停留時間記錄失敗:', error);
       // 不要拋出錯誤，以免影響使用者體驗
     }
   }
@@ -168,6 +291,8 @@ class AnalyticsAPI {
 export class PageViewTracker {
   private static startTime: number = 0;
   private static currentPath: string = '';
+  private static pageViewId: string = '';
+  private static heartbeatTimer: ReturnType<typeof setInterval> | null = null;
 
   /**
    * 開始追蹤頁面
@@ -175,23 +300,47 @@ export class PageViewTracker {
   static startTracking(path: string, title?: string): void {
     this.startTime = Date.now();
     this.currentPath = path;
+    this.pageViewId = uuidv4();
     
-    // 記錄頁面瀏覽
+    // 記錄頁面瀏覽 (pageViewId 由前端產生，心跳不需等待批次送出)
     AnalyticsAPI.trackPageView({
       path,
-      title
+      title,
+      pageViewId: this.pageViewId
     });
+
+    // 定期送出累計停留時間
+    if (this.heartbeatTimer) {
+      clearInterval(this.heartbeatTimer);
+    }
+    this.heartbeatTimer = setInterval(() => {
+      if (this.startTime > 0) {
+        AnalyticsAPI.sendHeartbeat(this.pageViewId, this.elapsedSeconds());
+      }
+    }, HEARTBEAT_INTERVAL);
+  }
+
+  private static elapsedSeconds(): number {
+    return Math.round((Date.now() - this.startTime) / 1000);
   }
 
   /**
-   * 停止追蹤頁面 (可用於記錄停留時間)
+   * 停止追蹤頁面並送出最終停留時間
    */
   static stopTracking(): void {
+    if (this.heartbeatTimer) {
+      clearInterval(this.heartbeatTimer);
+      this.heartbeatTimer = null;
+    }
+
     if (this.startTime > 0) {
-      const duration = Math.round((Date.now() - this.startTime) / 1000);
+      const duration = this.elapsedSeconds();
       logger.log(`📊 頁面停留時間: ${duration}秒`, this.currentPath);
+      // 頁面可能即將卸載，以 sendBeacon 送出
+      AnalyticsAPI.sendHeartbeat(this.pageViewId, duration, true);
       this.startTime = 0;
       this.currentPath = '';
+      this.pageViewId = '';
     }
   }
 
@@ -229,10 +378,16 @@ export class AutoTracker {
       PageViewTracker.stopTracking();
     });
 
+    // 頁面關閉時送出剩餘的緩衝事件
+    window.addEventListener('pagehide', () => {
+      AnalyticsAPI.flush(true);
+    });
+
     // 監聽頁面可見性變化
     document.addEventListener('visibilitychange', () => {
       if (document.visibilityState === 'hidden') {
         PageViewTracker.stopTracking();
+        AnalyticsAPI.flush(true);
       } else if (document.visibilityState === 'visible') {
         PageViewTracker.startTracking(
           window.location.pathname + window.location.search,
@@ -250,6 +405,7 @@ export class AutoTracker {
   static disable(): void {
     this.isEnabled = false;
     PageViewTracker.stopTracking();
+    AnalyticsAPI.flush(true);
     logger.log('📊 自動流量追蹤已停用');
   }
 }
@@ -158,6 +158,7 @@ export interface Analytics {
   pageViews: number;
   uniqueVisitors: number;
   averageTimeOnSite: string;
+  medianTimeOnSite?: string;
   topPages: {
     path: string;
     views: number;